@@ -0,0 +1,369 @@
+# benchmark.py - Throughput and latency benchmark for the main API routes
+"""
+Builds a school with generate_data.py in a scratch SQLite database (or uses the one at
+--database-url as is), then drives each scenario with --concurrency clients until
+--requests requests have completed. Reports throughput, p50/p95/p99 latency and SQL
+statements per request, and writes everything to a JSON file so runs on different
+commits can be compared with --compare.
+
+--server inproc   calls the app in this process through httpx's ASGI transport; SQL
+                  statements are counted, but the announcement scenario has no sockets
+--server uvicorn  starts uvicorn on a local port and goes over real HTTP; the
+                  announcement scenario also opens --listeners WebSocket clients and
+                  measures how long the event takes to reach all of them
+
+Usage: python benchmark.py [--students 2000] [--days 60] [--requests 300] [--concurrency 16]
+                           [--server inproc|uvicorn] [--scenarios login,students,...]
+                           [--output results.json] [--compare previous.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--students", type=int, default=2000)
+parser.add_argument("--days", type=int, default=60, help="school days of attendance history")
+parser.add_argument("--database-url", help="benchmark an existing database instead of generating one")
+parser.add_argument("--server", choices=["inproc", "uvicorn"], default="inproc")
+parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (more than one needs WS_BROKER=unix)")
+parser.add_argument("--requests", type=int, default=300, help="requests per scenario")
+parser.add_argument("--concurrency", type=int, default=16)
+parser.add_argument("--listeners", type=int, default=200, help="WebSocket clients for the announcement scenario")
+parser.add_argument("--scenarios", help="comma separated subset of: " + ", ".join(
+    ["login", "students", "dashboard-admin", "dashboard-teacher", "dashboard-student", "dashboard-accountant",
+     "notifications", "attendance", "announcement"]))
+parser.add_argument("--output", help="result file (default bench-results/<time>-<commit>.json)")
+parser.add_argument("--compare", help="earlier result file to print the change against")
+parser.add_argument("--password", default="password123",
+                    help="password of the generated accounts, or of the existing ones with --database-url (login scenario)")
+args = parser.parse_args()
+
+if args.server == "uvicorn" and args.workers > 1:
+    # With the in-process broker each worker only reaches its own sockets, so deliveredToAll would count one worker's
+    if os.environ.setdefault("WS_BROKER", "unix") != "unix":
+        parser.error("--workers > 1 needs WS_BROKER=unix so every worker delivers every event")
+
+# The engines are built on import, so point them at the benchmark database first
+workdir = None
+if args.database_url:
+    os.environ["DATABASE_URL"] = args.database_url
+else:
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+# The scheduled retention job would only add noise
+os.environ.setdefault("MAINTENANCE_INTERVAL_MINUTES", "0")
+
+import httpx  # noqa: E402
+import websockets  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from core.database import async_engine, engine  # noqa: E402
+from generate_data import SchoolSize, generate  # noqa: E402
+from main import Section, Student, User, UserRole, app, create_access_token, prepare_database, write_queue  # noqa: E402
+from utils.querycount import QueryCounter  # noqa: E402
+
+# Scenarios whose requests are expensive by design run 1/n of --requests
+REQUEST_SHARE = {"login": 5, "announcement": 10}
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(latencies, errors, elapsed, statements=None):
+    ordered = sorted(latencies)
+    completed = len(ordered)
+    result = {
+        "requests": completed + errors,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(completed / elapsed, 1) if elapsed else None,
+        "meanMs": round(1000 * statistics.fmean(ordered), 2) if ordered else None,
+        "p50Ms": round(1000 * percentile(ordered, 0.50), 2) if ordered else None,
+        "p95Ms": round(1000 * percentile(ordered, 0.95), 2) if ordered else None,
+        "p99Ms": round(1000 * percentile(ordered, 0.99), 2) if ordered else None,
+        "sqlPerRequest": round(statements / (completed + errors), 2) if statements is not None and completed + errors else None,
+    }
+    return result
+
+
+async def drive(client, make_request, total, concurrency):
+    """Run make_request(client, i) for i in range(total) on `concurrency` workers; returns (latencies, errors)"""
+    latencies, errors = [], 0
+    next_index = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in next_index:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                response.raise_for_status()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+class Fixture:
+    """Accounts and ids the scenarios pick from, read once from the benchmark database"""
+
+    def __init__(self):
+        with engine.connect() as connection:
+            def accounts(role, limit):
+                rows = connection.execute(
+                    select(User.email, User.id).where(User.role == role).order_by(User.id).limit(limit)
+                ).all()
+                # Minted directly: logging hundreds of accounts in would spend minutes in argon2 before the first scenario
+                self.tokens.update({email: create_access_token({"sub": email, "uid": uid, "role": role.value}) for email, uid in rows})
+                return [email for email, _ in rows]
+            self.tokens = {}
+            self.admin = accounts(UserRole.ADMIN, 1)[0]
+            self.accountant = accounts(UserRole.ACCOUNTANT, 1)[0]
+            self.teachers = accounts(UserRole.TEACHER, 50)
+            self.students = accounts(UserRole.STUDENT, max(args.listeners, 200))
+            self.sections = {}
+            for section_id, class_id, student_id in connection.execute(
+                select(Section.id, Section.class_id, Student.id).join(Student, Student.section_id == Section.id)
+            ):
+                self.sections.setdefault((section_id, class_id), []).append(student_id)
+            self.section_keys = sorted(self.sections)
+            self.counts = {
+                model.__tablename__: connection.execute(select(func.count()).select_from(model)).scalar()
+                for model in (User, Student)
+            }
+
+    def headers(self, email):
+        return {"Authorization": f"Bearer {self.tokens[email]}"}
+
+
+def scenarios(fixture: Fixture):
+    """name -> make_request(client, i)"""
+    today = date.today()
+
+    def get(path, accounts, **params):
+        return lambda client, i: client.get(path, params=params, headers=fixture.headers(accounts[i % len(accounts)]))
+
+    def login(client, i):
+        email = fixture.students[i % len(fixture.students)]
+        return client.post("/api/auth/login", json={"email": email, "password": args.password})
+
+    def attendance(client, i):
+        section_id, class_id = fixture.section_keys[i % len(fixture.section_keys)]
+        day = today - timedelta(days=i // len(fixture.section_keys))
+        statuses = ["present"] * 18 + ["absent", "late"]
+        return client.post("/api/attendance/mark", headers=fixture.headers(fixture.teachers[i % len(fixture.teachers)]), json={
+            "class_id": str(class_id),
+            "date": day.isoformat(),
+            "attendance": {str(student_id): statuses[(student_id + i) % len(statuses)] for student_id in fixture.sections[(section_id, class_id)]},
+        })
+
+    def announcement(client, i):
+        return client.post("/api/announcements", headers=fixture.headers(fixture.admin), json={
+            "title": f"bench-{i}", "message": "Benchmark announcement", "target": "students",
+        })
+
+    return {
+        "login": login,
+        "students": get("/api/students", [fixture.admin], limit=50),
+        "dashboard-admin": get("/api/dashboard/admin", [fixture.admin]),
+        "dashboard-teacher": get("/api/dashboard/teacher", fixture.teachers),
+        "dashboard-student": get("/api/dashboard/student", fixture.students),
+        "dashboard-accountant": get("/api/dashboard/accountant", [fixture.accountant]),
+        "notifications": get("/api/notifications", fixture.students),
+        "attendance": attendance,
+        "announcement": announcement,
+    }
+
+
+async def listen(url, token, received, ready):
+    """WebSocket client recording when each benchmark announcement arrives"""
+    async with websockets.connect(f"{url}/ws?token={token}", max_queue=None) as ws:
+        ready.release()
+        async for text in ws:
+            event = json.loads(text)
+            message = event.get("notification", {}).get("message", "")
+            if message.startswith("New announcement: bench-"):
+                received.setdefault(message.rsplit("-", 1)[1], []).append(time.perf_counter())
+
+
+async def run_announcements(client, fixture, make_request, ws_url):
+    """Announcement scenario; with a server, also measures delivery to every listener"""
+    listeners = args.listeners if ws_url else 0
+    received, sent, tasks = {}, {}, []
+    ready = asyncio.Semaphore(0)
+    for email in fixture.students[:listeners]:
+        tasks.append(asyncio.create_task(listen(ws_url, fixture.tokens[email], received, ready)))
+    for _ in tasks:
+        await ready.acquire()
+
+    async def timed(client, i):
+        sent[str(i)] = time.perf_counter()
+        return await make_request(client, i)
+
+    total = max(1, args.requests // REQUEST_SHARE["announcement"])  # each one fans out to every student
+    started = time.perf_counter()
+    latencies, errors = await drive(client, timed, total, min(args.concurrency, total))
+    elapsed = time.perf_counter() - started
+
+    deliveries = []
+    if listeners:
+        deadline = time.perf_counter() + 30
+        while time.perf_counter() < deadline and sum(len(times) for times in received.values()) < total * listeners:
+            await asyncio.sleep(0.05)
+        deliveries = [max(times) - sent[key] for key, times in received.items() if len(times) == listeners]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies, errors, elapsed, {
+        "listeners": listeners,
+        "deliveredToAll": len(deliveries),
+        "deliveryP50Ms": round(1000 * percentile(sorted(deliveries), 0.50), 2) if deliveries else None,
+        "deliveryP95Ms": round(1000 * percentile(sorted(deliveries), 0.95), 2) if deliveries else None,
+    }
+
+
+def start_uvicorn():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1).raise_for_status()
+            return server, f"http://127.0.0.1:{port}"
+        except httpx.HTTPError:
+            if server.poll() is not None:
+                raise SystemExit("uvicorn exited during startup")
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("uvicorn did not start within 60s")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(fixture):
+    if args.server == "uvicorn":
+        server, base_url = start_uvicorn()
+        try:
+            transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=args.concurrency + 4))
+            return await run_scenarios(fixture, transport, base_url, base_url.replace("http", "ws", 1), count_sql=False)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    # Startup and shutdown hooks run as they would under a server
+    async with app.router.lifespan_context(app):
+        return await run_scenarios(fixture, httpx.ASGITransport(app=app), "http://bench", None, count_sql=True)
+
+
+async def run_scenarios(fixture, transport, base_url, ws_url, count_sql):
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60) as client:
+        available = scenarios(fixture)
+        for name in args.scenarios.split(",") if args.scenarios else list(available):
+            make_request = available[name]
+            # Warm-up: fill caches and pools so the first requests of a scenario are not outliers
+            await drive(client, make_request, min(args.concurrency, 10), 1)
+            with QueryCounter(async_engine.sync_engine) as counter:
+                if name == "announcement":
+                    latencies, errors, elapsed, extra = await run_announcements(client, fixture, make_request, ws_url)
+                else:
+                    started = time.perf_counter()
+                    total = max(1, args.requests // REQUEST_SHARE.get(name, 1))
+                    latencies, errors = await drive(client, make_request, total, min(args.concurrency, total))
+                    elapsed, extra = time.perf_counter() - started, {}
+                await write_queue.stop()  # queued writes land inside the scenario that caused them
+            row = results[name] = {**summarize(latencies, errors, elapsed, counter.count if count_sql else None), **extra}
+            print(f"{name:<22} {row['throughput'] or 0:>9.1f} req/s  p50 {row['p50Ms'] or 0:>8.2f}  "
+                  f"p95 {row['p95Ms'] or 0:>8.2f}  p99 {row['p99Ms'] or 0:>8.2f} ms  "
+                  f"sql/req {row['sqlPerRequest'] if row['sqlPerRequest'] is not None else '-':>5}  errors {row['errors']}")
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\n=== change against {baseline_path} ({baseline['meta'].get('commit')}) ===")
+    for name, row in results.items():
+        before = baseline["scenarios"].get(name)
+        if not before or not before.get("p50Ms") or not row.get("p50Ms"):
+            continue
+        print(f"{name:<22} throughput {100 * (row['throughput'] / before['throughput'] - 1):+7.1f}%   "
+              f"p50 {100 * (row['p50Ms'] / before['p50Ms'] - 1):+7.1f}%   p95 {100 * (row['p95Ms'] / before['p95Ms'] - 1):+7.1f}%")
+
+
+def main():
+    prepare_database()
+    if workdir:
+        print(f"Generating {args.students} students with {args.days} days of attendance ...")
+        with engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA synchronous=OFF")
+            connection.commit()
+            with connection.begin():
+                generate(connection, SchoolSize(students=args.students, days=args.days, seed=1), args.password, log=lambda line: None)
+    fixture = Fixture()
+
+    print(f"Benchmarking {engine.url} with {args.server}, {args.requests} requests x {args.concurrency} clients\n")
+    results = asyncio.run(run(fixture))
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server": args.server,
+            "workers": args.workers if args.server == "uvicorn" else None,
+            "wsBroker": os.getenv("WS_BROKER", "memory"),
+            "database": engine.url.get_backend_name(),
+            "sqlitePerformanceMode": os.getenv("SQLITE_PERFORMANCE_MODE", "false"),
+            "dataset": fixture.counts,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "scenarios": results,
+    }
+    output = args.output or os.path.join(
+        BACKEND_DIR, "bench-results", f"{report['meta']['timestamp'].replace(':', '')}-{commit or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        engine.dispose()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
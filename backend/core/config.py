@@ -0,0 +1,96 @@
+# config.py - Application settings
+"""
+Settings come from environment variables, with a .env file in the working directory loaded first.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def default_broker_path(database_url: str) -> str:
+    """Broker directory private to this OS user and database, so separate checkouts never share events"""
+    if database_url.startswith("sqlite") and ":///" in database_url:
+        prefix, _, database = database_url.partition(":///")
+        database_url = f"{prefix}:///{os.path.abspath(database)}"
+    getuid = getattr(os, "getuid", lambda: 0)
+    key = hashlib.sha1(f"{getuid()}:{database_url}".encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"school-management-ws-{key}")
+
+
+def multiple_workers() -> bool:
+    """Whether this deployment runs several API worker processes side by side"""
+    return int(os.getenv("WEB_CONCURRENCY", "1")) > 1 or os.getenv("WS_BROKER", "memory") != "memory"
+
+
+class Settings:
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./school_management.db")
+
+    # Connection pool, per engine and per worker process; a server DB needs
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) * 2 engines below its max_connections
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 to never recycle
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    # Server-side statement timeout (Postgres only), 0 disables it
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+    # Opt-in SQLite profile for single-node deployments: WAL, tuned pragmas and a group-committing write queue
+    SQLITE_PERFORMANCE_MODE: bool = os.getenv("SQLITE_PERFORMANCE_MODE", "false").lower() in ("1", "true", "yes")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB, so 64 MiB
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    WRITE_QUEUE_MAX_BATCH: int = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "64"))
+    WRITE_QUEUE_MAX_DELAY_MS: float = float(os.getenv("WRITE_QUEUE_MAX_DELAY_MS", "2"))
+
+    # Grade boundaries as "min_percentage:grade" pairs, and the percentage a pass needs
+    GRADE_BOUNDARIES: str = os.getenv("GRADE_BOUNDARIES", "90:A+,80:A,70:B+,60:B,50:C,0:F")
+    PASS_PERCENTAGE: float = float(os.getenv("PASS_PERCENTAGE", "50"))
+
+    # Homework uploads: content-addressed store on local disk
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
+    MAX_UPLOAD_MB: int = int(os.getenv("MAX_UPLOAD_MB", "25"))
+    # Maintenance deletes stored files no submission references once they are this old
+    UPLOAD_ORPHAN_HOURS: float = float(os.getenv("UPLOAD_ORPHAN_HOURS", "1"))
+    UPLOAD_ALLOWED_TYPES: str = os.getenv(
+        "UPLOAD_ALLOWED_TYPES",
+        "application/pdf,image/jpeg,image/png,image/webp,image/heic,text/plain,"
+        "application/msword,application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    )
+
+    # Retention job: read notifications older than this move to notification_archive in batches
+    NOTIFICATION_RETENTION_DAYS: int = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+    MAINTENANCE_BATCH_SIZE: int = int(os.getenv("MAINTENANCE_BATCH_SIZE", "1000"))
+    MAINTENANCE_INTERVAL_MINUTES: float = float(os.getenv("MAINTENANCE_INTERVAL_MINUTES", "1440"))  # 0 disables the schedule
+    MAINTENANCE_VACUUM_PAGES: int = int(os.getenv("MAINTENANCE_VACUUM_PAGES", "10000"))  # per run, SQLite only
+
+    # Authenticated principal cache; set AUTH_CACHE_TTL=0 to look the user up on every request.
+    # Each worker has its own cache and drops entries only on its own ORM writes to users, so a role,
+    # status or account change made through another worker (or raw SQL) applies there after at most
+    # the TTL; it therefore defaults to 5s instead of 60s with several workers (WEB_CONCURRENCY or a unix broker)
+    AUTH_CACHE_TTL: float = float(os.getenv("AUTH_CACHE_TTL", "5" if multiple_workers() else "60"))
+    AUTH_CACHE_SIZE: int = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+    # argon2 cost parameters (passlib defaults); existing hashes keep verifying after a change
+    ARGON2_TIME_COST: int = int(os.getenv("ARGON2_TIME_COST", "2"))
+    ARGON2_MEMORY_COST: int = int(os.getenv("ARGON2_MEMORY_COST", "102400"))  # KiB
+    ARGON2_PARALLELISM: int = int(os.getenv("ARGON2_PARALLELISM", "8"))
+    # Worker pool for hashing/verification and how many jobs may wait before requests get a 503
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+    # WebSocket fan-out: "memory" for a single worker, "unix" to share events between uvicorn workers
+    # (the workers of one deployment meet in WS_BROKER_PATH, by default derived from the user and database)
+    WS_BROKER: str = os.getenv("WS_BROKER", "memory")
+    WS_BROKER_PATH: str = os.getenv("WS_BROKER_PATH") or default_broker_path(DATABASE_URL)
+    WS_MAX_QUEUE: int = int(os.getenv("WS_MAX_QUEUE", "100"))
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+
+settings = Settings()
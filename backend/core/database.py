@@ -0,0 +1,184 @@
+# database.py - Database engines and session factories
+"""
+Request handlers use the async engine (aiosqlite locally, asyncpg for Postgres) so that
+database I/O never blocks the event loop that also drives WebSocket fan-out.
+The sync engine is kept for table creation, startup seeding and command-line scripts.
+
+Both engines are built from the DB_* settings in core/config.py, e.g.
+DATABASE_URL=postgresql://school:secret@db/school DB_POOL_SIZE=10 DB_STATEMENT_TIMEOUT_MS=5000
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from core.config import settings
+from core.writer import WriteQueue
+
+# Async driver used for each sync URL scheme
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def async_database_url(url: str) -> str:
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db, postgresql://... -> postgresql+asyncpg://..."""
+    scheme, rest = url.split("://", 1)
+    backend = scheme.split("+", 1)[0]
+    return f"{ASYNC_DRIVERS.get(backend, scheme)}://{rest}"
+
+
+class PoolMetrics:
+    """How long callers waited to check a connection out of the pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "waitMsAvg": round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "waitMsMax": round(1000 * self.wait_max, 3),
+            }
+
+
+class TimedPoolMixin:
+    """Times every checkout; the metrics survive pool recreation on dispose()"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.metrics.record(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """create_engine() keyword arguments for url, built from the DB_* settings"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    connect_args = {}
+    if backend == "sqlite":
+        connect_args["check_same_thread"] = False
+        if parsed.database in (None, "", ":memory:"):
+            # An in-memory database lives in one connection; keep SQLAlchemy's single-connection pool
+            return {"connect_args": connect_args}
+    elif backend == "postgresql" and settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+        if is_async:
+            connect_args["server_settings"] = {"statement_timeout": timeout}
+        else:
+            connect_args["options"] = f"-c statement_timeout={timeout}"
+    return {
+        "connect_args": connect_args,
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def pool_metrics(engine) -> dict:
+    pool = engine.pool
+    metrics = pool.metrics.snapshot() if isinstance(pool, TimedPoolMixin) else {}
+    if isinstance(pool, QueuePool):
+        metrics.update({"size": pool.size(), "checkedOut": pool.checkedout(), "overflow": pool.overflow()})
+    return metrics
+
+
+DATABASE_URL = settings.DATABASE_URL
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+# Objects stay usable after commit without an implicit (and, under asyncio, illegal) lazy refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+def _reset_pools_after_fork():
+    # A forked worker (gunicorn --preload and friends) must not reuse the parent's sockets;
+    # close=False drops the inherited connections without closing them under the parent
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+SQLITE_PERFORMANCE_MODE = IS_SQLITE and settings.SQLITE_PERFORMANCE_MODE
+SQLITE_SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection tuning for the SQLite performance profile (journal_mode=WAL also persists in the file)"""
+    synchronous = settings.SQLITE_SYNCHRONOUS.upper()
+    if synchronous not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {sorted(SQLITE_SYNCHRONOUS_LEVELS)}")
+    cursor = dbapi_connection.cursor()
+    # Only takes effect on a new database (or after a one-off VACUUM); lets maintenance return free pages
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={synchronous}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+if SQLITE_PERFORMANCE_MODE:
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+# Hot write paths submit here; with the SQLite profile on, writes are serialized and group-committed
+write_queue = WriteQueue(
+    AsyncSessionLocal,
+    enabled=SQLITE_PERFORMANCE_MODE,
+    max_batch=settings.WRITE_QUEUE_MAX_BATCH,
+    max_delay=settings.WRITE_QUEUE_MAX_DELAY_MS / 1000,
+)
+
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
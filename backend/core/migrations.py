@@ -0,0 +1,96 @@
+# migrations.py - Apply Alembic migrations from code
+"""
+Tables come from Base.metadata.create_all(); changes to tables that already exist
+(indexes, new columns) ship as Alembic revisions under migrations/versions.
+Revisions are written to be idempotent, so a fresh database that create_all() just
+built with every index simply gets stamped at head.
+
+Nothing runs on import. The app calls main.prepare_database() once at startup and the
+scripts call it before touching the database; every uvicorn worker does so, but the
+migration lock lets one of them build or upgrade the schema while the others wait and
+then find nothing left to do.
+
+From the command line (run in backend/): alembic upgrade head, alembic downgrade -1
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+from typing import List
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single worker there
+    fcntl = None
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+logger = logging.getLogger(__name__)
+
+# Any constant works, it only has to be the same in every process of the app
+POSTGRES_LOCK_KEY = 0x5C4001
+
+
+def alembic_config(connection=None, metadata=None) -> Config:
+    config = Config(ALEMBIC_INI)
+    # Hand env.py an open connection so it neither builds its own engine nor imports main
+    config.attributes["connection"] = connection
+    config.attributes["target_metadata"] = metadata
+    return config
+
+
+@contextmanager
+def migration_lock(connection):
+    """Exclusive across processes while the schema is created or migrated"""
+    database = connection.engine.url.database
+    if connection.dialect.name == "postgresql":
+        # Transaction scoped: released by the commit or rollback that ends the migration
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": POSTGRES_LOCK_KEY})
+        yield
+    elif connection.dialect.name == "sqlite" and fcntl is not None and database not in (None, "", ":memory:"):
+        # A file of its own: locking the database file would interfere with SQLite's own locks on it
+        with open(f"{database}.migrate-lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        yield
+
+
+def upgrade_schema(engine, metadata, revision: str = "head"):
+    """Create missing tables, then apply pending revisions"""
+    with engine.begin() as connection, migration_lock(connection):
+        metadata.create_all(connection)
+        command.upgrade(alembic_config(connection, metadata), revision)
+
+
+def downgrade_schema(engine, metadata, revision: str):
+    with engine.begin() as connection, migration_lock(connection):
+        command.downgrade(alembic_config(connection, metadata), revision)
+
+
+def set_aside_duplicates(connection, table: str, key_columns: List[str]) -> int:
+    """
+    Move every row of `table` but the newest (highest id) of its key into `<table>_duplicates`,
+    so that a unique index over the key can be built. Nothing is thrown away: the moved rows stay
+    in the audit table for someone to review. Returns how many rows were moved.
+    """
+    key = ", ".join(key_columns)
+    older = f"id NOT IN (SELECT MAX(id) FROM {table} GROUP BY {key})"
+    moved = connection.scalar(text(f"SELECT COUNT(*) FROM {table} WHERE {older}"))
+    if not moved:
+        return 0
+    audit = f"{table}_duplicates"
+    if inspect(connection).has_table(audit):
+        connection.execute(text(f"INSERT INTO {audit} SELECT * FROM {table} WHERE {older}"))
+    else:
+        connection.execute(text(f"CREATE TABLE {audit} AS SELECT * FROM {table} WHERE {older}"))
+    connection.execute(text(f"DELETE FROM {table} WHERE {older}"))
+    logger.warning("Moved %d duplicate %s rows (same %s) to %s, review them there", moved, table, key, audit)
+    return moved
@@ -0,0 +1,137 @@
+# security.py - Authentication helpers
+"""
+The authenticated principal is cached per token subject so that most requests
+skip the users lookup. Entries expire after a TTL and are dropped explicitly
+when the underlying user row changes through the ORM in this process; other
+workers only notice such a change once their entry expires.
+
+Password hashing and verification run on a small dedicated thread pool (argon2
+releases the GIL), so a login storm queues there instead of freezing the event loop.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+from passlib.context import CryptContext
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Immutable snapshot of the authenticated user, safe to share across requests and threads"""
+    id: int
+    name: str
+    email: str
+    role: str
+    status: str
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(id=user.id, name=user.name, email=user.email, role=user.role, status=user.status)
+
+
+class PrincipalCache:
+    """Thread-safe LRU of principals keyed on token subject, with a per-entry TTL"""
+
+    def __init__(self, ttl: float = 60.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, subject: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[subject]
+                return None
+            self._entries.move_to_end(subject)
+            return principal
+
+    def put(self, subject: str, principal: Principal):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[subject] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, subject: str):
+        with self._lock:
+            self._entries.pop(subject, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when more hashing jobs are waiting than the pool is allowed to queue"""
+
+
+class PasswordHasher:
+    """Runs CryptContext hash/verify on a bounded worker pool and tracks how deep its queue is"""
+
+    def __init__(self, context: CryptContext, max_workers: int = 2, max_pending: int = 64):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs submitted but not yet picked up by a worker"""
+        return max(0, self.pending - self.max_workers)
+
+    def metrics(self) -> dict:
+        return {"workers": self.max_workers, "pending": self.pending, "queueDepth": self.queue_depth}
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hash a batch in parallel without queueing more than one job per worker at a time.
+
+        The semaphore already bounds what the batch adds to the queue, so its jobs are admitted
+        past max_pending: a bulk import must not fail halfway because logins filled the queue.
+        """
+        slots = asyncio.Semaphore(self.max_workers)
+
+        async def hash_one(password):
+            async with slots:
+                return await self._run(self.context.hash, password, bounded=False)
+
+        return await asyncio.gather(*(hash_one(password) for password in passwords))
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self.context.verify, password, hashed)
+
+    async def _run(self, fn, *args, bounded: bool = True):
+        with self._lock:
+            if bounded and self.pending >= self.max_pending:
+                raise PasswordHasherBusy()
+            self.pending += 1
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+            executor = self.executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def shutdown(self):
+        with self._lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
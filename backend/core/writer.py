@@ -0,0 +1,164 @@
+# writer.py - Serialized write queue with group commit
+"""
+SQLite allows one writer at a time, so concurrent write transactions mostly wait on
+each other and fail with "database is locked" once busy_timeout runs out. Funnelling
+small writes through a single task avoids that contention, and committing several
+queued writes together pays for one fsync instead of one per request.
+
+A job is a plain function taking a sync Session (like the attendance helpers); it
+runs through AsyncSession.run_sync inside the batch's transaction. submit_exclusive()
+is for work that needs a connection of its own (SQLite vacuuming): it runs as a batch
+by itself, in a thread, with no queued write in flight.
+"""
+
+import asyncio
+import logging
+from typing import Callable, List, Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+class WriteJob:
+    def __init__(self, fn: Callable, args: tuple, future: asyncio.Future, exclusive: bool = False):
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.exclusive = exclusive
+
+
+class WriteQueue:
+    def __init__(self, session_factory: async_sessionmaker, enabled: bool = True,
+                 max_batch: int = 64, max_delay: float = 0.002):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self._held: Optional[WriteJob] = None  # exclusive job taken off the queue while filling a batch
+        self.batches = 0
+        self.writes = 0
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": self.queue.qsize() if self.queue else 0,
+            "batches": self.batches,
+            "writes": self.writes,
+        }
+
+    async def submit(self, fn: Callable, *args):
+        """Run fn(session, *args) in a committed transaction and return its result"""
+        if not self.enabled:
+            async with self.session_factory() as db:
+                result = await db.run_sync(fn, *args)
+                await db.commit()
+                return result
+
+        return await self._enqueue(WriteJob(fn, args, asyncio.get_running_loop().create_future()))
+
+    async def submit_exclusive(self, fn: Callable, *args):
+        """Run fn(*args) in a thread once the writes queued before it are committed, holding later ones back"""
+        if not self.enabled:
+            return await asyncio.to_thread(fn, *args)
+        return await self._enqueue(WriteJob(fn, args, asyncio.get_running_loop().create_future(), exclusive=True))
+
+    async def _enqueue(self, job: WriteJob):
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self._run())
+        self.queue.put_nowait(job)
+        return await job.future
+
+    async def stop(self):
+        """Finish whatever is queued, then stop the worker"""
+        if self.worker is None:
+            return
+        await self.queue.join()
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.worker = None
+
+    async def _collect(self) -> List[WriteJob]:
+        first, self._held = self._held or await self.queue.get(), None
+        batch = [first]
+        if first.exclusive:
+            return batch
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                job = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if job.exclusive:
+                # Runs alone, right after this batch
+                self._held = job
+                break
+            batch.append(job)
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                if batch[0].exclusive:
+                    await self._run_exclusive(batch[0])
+                else:
+                    await self._commit_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _commit_batch(self, batch: List[WriteJob]):
+        results = []
+        try:
+            async with self.session_factory() as db:
+                for job in batch:
+                    results.append(await db.run_sync(job.fn, *job.args))
+                await db.commit()
+        except Exception:
+            # One bad job must not fail its neighbours: replay each in its own transaction.
+            # Rejections are often expected (validation raised inside a job), so the caller gets the error, not the log.
+            logger.debug("Group commit of %d writes failed, retrying them one by one", len(batch), exc_info=True)
+            for job in batch:
+                await self._commit_one(job)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for job, result in zip(batch, results):
+            if not job.future.done():
+                job.future.set_result(result)
+
+    async def _run_exclusive(self, job: WriteJob):
+        try:
+            result = await asyncio.to_thread(job.fn, *job.args)
+        except Exception as exc:
+            if not job.future.done():
+                job.future.set_exception(exc)
+            return
+        if not job.future.done():
+            job.future.set_result(result)
+
+    async def _commit_one(self, job: WriteJob):
+        try:
+            async with self.session_factory() as db:
+                result = await db.run_sync(job.fn, *job.args)
+                await db.commit()
+        except Exception as exc:
+            if not job.future.done():
+                job.future.set_exception(exc)
+            return
+        self.batches += 1
+        self.writes += 1
+        if not job.future.done():
+            job.future.set_result(result)
@@ -0,0 +1,313 @@
+# generate_data.py - Deterministic synthetic school of any size for benchmarks and load tests
+"""
+Fills an empty database with a school of the requested size. People and other small
+tables are built in Python and written with bulk Core inserts; the large tables
+(attendance, marks, fees, notifications) are produced by one INSERT ... SELECT per
+day / exam / batch, so their rows never pass through Python at all. Every account
+shares one password hash, computed once. The same arguments always give the same data
+as long as --today pins the anchor date; otherwise dates follow the current day.
+
+Point DATABASE_URL at the target first; missing tables are created before generating.
+Usage: DATABASE_URL=sqlite:///./loadtest.db python generate_data.py --students 50000 --days 220
+"""
+
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Column, Date, Integer, MetaData, Table, case, func, insert, literal, select, true
+from sqlalchemy.orm import Session
+
+from core.database import engine
+from main import (
+    AcademicYear, Announcement, AttendanceRecord, AttendanceStatus, Base, Class, Exam, FeeHead, FeeStatus,
+    Homework, Mark, Notification, Parent, Section, Student, StudentFee, StudentParent, Subject, TeacherProfile,
+    User, UserRole, get_password_hash, grade_scale, prepare_database, rebuild_attendance_rollups, rebuild_fee_balances,
+    rebuild_homework_counters, rebuild_notification_counters,
+)
+
+BATCH = 10000
+EMAIL_DOMAIN = "school.test"
+SUBJECTS = ["Mathematics", "Science", "English", "Hindi", "Social Studies", "Computer Science", "Art", "Physical Education"]
+FEE_HEADS = [("Tuition Fee", 25000), ("Transport Fee", 8000), ("Library Fee", 1500)]
+EXAM_NAMES = ["Unit Test 1", "Half Yearly", "Unit Test 2", "Annual"]
+FIRST_NAMES = ["Aarav", "Vivaan", "Aditya", "Diya", "Ananya", "Ishaan", "Kavya", "Rohan", "Saanvi", "Arjun",
+               "Meera", "Kabir", "Nisha", "Rahul", "Priya", "Dev", "Tara", "Neel", "Zara", "Om"]
+LAST_NAMES = ["Sharma", "Verma", "Iyer", "Reddy", "Khan", "Singh", "Patel", "Das", "Nair", "Gupta",
+              "Mehta", "Bose", "Rao", "Joshi", "Kapoor"]
+
+
+class SchoolSize:
+    def __init__(self, students: int = 5000, classes: int = 12, sections_per_class: int = 4, teachers: int = 0,
+                 children_per_parent: int = 2, days: int = 220, exams: int = 3, homework_per_subject: int = 4,
+                 notifications: int = 5, seed: int = 42):
+        self.students = students
+        self.classes = classes
+        self.sections_per_class = sections_per_class
+        self.teachers = teachers or max(classes * sections_per_class, students // 25)
+        self.children_per_parent = children_per_parent
+        self.days = days
+        self.exams = min(exams, len(EXAM_NAMES))
+        self.homework_per_subject = homework_per_subject
+        self.notifications = notifications
+        self.seed = seed
+
+
+def spread(column, salt: int, seed: int):
+    """Deterministic 0-99 value per (row, salt), computed by the database"""
+    return (column * 7919 + salt * 104729 + seed * 31) % 100
+
+
+def school_days(count: int, today: date):
+    """The last `count` days the school was open (Monday to Saturday), oldest first"""
+    days, day = [], today
+    while len(days) < count:
+        if day.weekday() != 6:
+            days.append(day)
+        day -= timedelta(days=1)
+    return days[::-1]
+
+
+def insert_returning_ids(connection, model, rows):
+    ids = []
+    for start in range(0, len(rows), BATCH):
+        result = connection.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows[start:start + BATCH])
+        ids.extend(result.scalars())
+    return ids
+
+
+def insert_rows(connection, model, rows):
+    for start in range(0, len(rows), BATCH):
+        connection.execute(insert(model), rows[start:start + BATCH])
+
+
+def person(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def users(connection, role: UserRole, prefix: str, count: int, password_hash: str, rng: random.Random):
+    return insert_returning_ids(connection, User, [
+        {"name": person(rng), "email": f"{prefix}{n}@{EMAIL_DOMAIN}", "phone": f"9{rng.randrange(10 ** 9):09d}",
+         "password_hash": password_hash, "role": role, "status": "active"}
+        for n in range(1, count + 1)
+    ])
+
+
+def generate(connection, size: SchoolSize, password: str = "password123", log=print, today: date = None) -> dict:
+    """Populate an empty database; returns row counts per table. Dates count back from `today` (default: now)"""
+    rng = random.Random(size.seed)
+    now = datetime.combine(today, datetime.min.time()) if today else datetime.utcnow()
+    today = now.date()
+    counts = {}
+
+    def step(name: str):
+        log(f"  {name} ({time.perf_counter() - started:.1f}s)")
+
+    started = time.perf_counter()
+    password_hash = get_password_hash(password)
+
+    year_start = date(today.year if today.month >= 4 else today.year - 1, 4, 1)
+    year_id = connection.execute(insert(AcademicYear).returning(AcademicYear.id), {
+        "name": f"{year_start.year}-{year_start.year + 1}", "start_date": year_start,
+        "end_date": date(year_start.year + 1, 3, 31), "is_active": True,
+    }).scalar()
+    class_ids = insert_returning_ids(connection, Class, [
+        {"name": f"Class {n}", "academic_year_id": year_id} for n in range(1, size.classes + 1)
+    ])
+    sections = [(class_id, chr(65 + s)) for class_id in class_ids for s in range(size.sections_per_class)]
+    section_ids = insert_returning_ids(connection, Section, [{"class_id": c, "name": name} for c, name in sections])
+    subject_rows = [
+        {"name": subject, "code": f"{subject[:3].upper()}{class_id}", "class_id": class_id}
+        for class_id in class_ids for subject in SUBJECTS
+    ]
+    subject_ids = insert_returning_ids(connection, Subject, subject_rows)
+    step("classes, sections and subjects")
+
+    for role, prefix in [(UserRole.SUPER_ADMIN, "superadmin"), (UserRole.ADMIN, "admin"), (UserRole.ACCOUNTANT, "accountant")]:
+        users(connection, role, prefix, 1, password_hash, rng)
+    teacher_ids = users(connection, UserRole.TEACHER, "teacher", size.teachers, password_hash, rng)
+    insert_rows(connection, TeacherProfile, [
+        {"user_id": user_id, "subject": SUBJECTS[n % len(SUBJECTS)], "experience": f"{rng.randint(1, 25)} years",
+         "qualification": rng.choice(["B.Ed", "M.Ed", "M.Sc", "M.A"]), "created_at": now}
+        for n, user_id in enumerate(teacher_ids)
+    ])
+
+    student_user_ids = users(connection, UserRole.STUDENT, "student", size.students, password_hash, rng)
+    student_rows = []
+    for n, user_id in enumerate(student_user_ids):
+        section = rng.randrange(len(section_ids))
+        student_rows.append({
+            "user_id": user_id, "admission_no": f"ADM{n + 1:07d}", "class_id": sections[section][0],
+            "section_id": section_ids[section], "roll_no": n + 1,
+            "dob": date(today.year - 6 - section // size.sections_per_class, rng.randint(1, 12), rng.randint(1, 28)),
+            "gender": rng.choice(["Male", "Female"]),
+        })
+    student_ids = insert_returning_ids(connection, Student, student_rows)
+
+    families = range(0, len(student_ids), max(size.children_per_parent, 1))
+    parent_user_ids = users(connection, UserRole.PARENT, "parent", len(families), password_hash, rng)
+    parent_ids = insert_returning_ids(connection, Parent, [
+        {"user_id": user_id, "relation_type": rng.choice(["Father", "Mother", "Guardian"])} for user_id in parent_user_ids
+    ])
+    insert_rows(connection, StudentParent, [
+        {"student_id": student_id, "parent_id": parent_id}
+        for parent_id, first in zip(parent_ids, families)
+        for student_id in student_ids[first:first + size.children_per_parent]
+    ])
+    step("users, students and parents")
+
+    # Attendance: ~90% present, 5% absent, 3% late, 2% half day. Rows go in student by student, in
+    # (student_id, date) order, so the unique index grows at its right edge instead of being rewritten at random
+    days = Table("generate_days", MetaData(), Column("day_no", Integer), Column("day", Date), prefixes=["TEMPORARY"])
+    days.create(connection)
+    connection.execute(insert(days), [{"day_no": n, "day": day} for n, day in enumerate(school_days(size.days, today), start=1)])
+    chance = spread(Student.id, days.c.day_no, size.seed)
+    status_type = AttendanceRecord.__table__.c.status.type
+    status = case(
+        (chance < 5, literal(AttendanceStatus.ABSENT, status_type)),
+        (chance < 8, literal(AttendanceStatus.LATE, status_type)),
+        (chance < 10, literal(AttendanceStatus.HALF_DAY, status_type)),
+        else_=literal(AttendanceStatus.PRESENT, status_type),
+    )
+    # Cheaper to build the secondary indexes once at the end than to maintain them row by row
+    indexes = list(AttendanceRecord.__table__.indexes)
+    for index in indexes:
+        index.drop(connection)
+    per_statement = max(1, 1000000 // max(size.days, 1))
+    for first in range(0, len(student_ids), per_statement):
+        chunk = student_ids[first:first + per_statement]
+        connection.execute(insert(AttendanceRecord).from_select(
+            ["student_id", "date", "status", "created_at"],
+            select(Student.id, days.c.day, status, literal(now))
+            .join(days, true())
+            .where(Student.id.between(chunk[0], chunk[-1]))
+            .order_by(Student.id, days.c.day_no),
+        ))
+    days.drop(connection)
+    for index in indexes:
+        index.create(connection)
+    step(f"attendance for {size.days} days")
+
+    # Marks: one INSERT ... SELECT per exam over students x their class's subjects
+    exam_ids = insert_returning_ids(connection, Exam, [
+        {"name": EXAM_NAMES[n], "type": "term", "academic_year_id": year_id,
+         "start_date": year_start + timedelta(days=60 * (n + 1)), "end_date": year_start + timedelta(days=60 * (n + 1) + 7)}
+        for n in range(size.exams)
+    ])
+    for salt, exam_id in enumerate(exam_ids, start=1):
+        obtained = 20 + (Student.id * 31 + Subject.id * 17 + salt * 7 + size.seed) % 81
+        grade = case(
+            *[(obtained >= threshold, literal(name)) for threshold, name in zip(reversed(grade_scale.thresholds), reversed(grade_scale.grades))],
+        )
+        connection.execute(insert(Mark).from_select(
+            ["exam_id", "student_id", "subject_id", "marks_obtained", "max_marks", "grade"],
+            select(literal(exam_id), Student.id, Subject.id, obtained, literal(100.0), grade)
+            .join(Subject, Subject.class_id == Student.class_id),
+        ))
+    step(f"marks for {size.exams} exams")
+
+    insert_rows(connection, Homework, [
+        {"class_id": subject["class_id"], "section_id": None, "subject_id": subject_id,
+         "teacher_id": rng.choice(teacher_ids), "title": f"{subject['name']} assignment {n}",
+         "description": "Complete the exercises and submit before the due date.",
+         "due_date": today + timedelta(days=rng.randint(-60, 14)), "created_at": now}
+        for subject_id, subject in zip(subject_ids, subject_rows) for n in range(1, size.homework_per_subject + 1)
+    ])
+
+    fee_head_ids = insert_returning_ids(connection, FeeHead, [{"name": name, "description": name} for name, _ in FEE_HEADS])
+    fee_status_type = StudentFee.__table__.c.status.type
+    for salt, (fee_head_id, (_, amount)) in enumerate(zip(fee_head_ids, FEE_HEADS), start=1):
+        chance = spread(Student.id, 1000 + salt, size.seed)
+        connection.execute(insert(StudentFee).from_select(
+            ["student_id", "fee_head_id", "amount_due", "amount_paid", "due_date", "status"],
+            select(
+                Student.id, literal(fee_head_id), literal(float(amount)),
+                case((chance < 60, literal(float(amount))), (chance < 80, literal(amount / 2)), else_=literal(0.0)),
+                literal(year_start + timedelta(days=30 * salt)),
+                case(
+                    (chance < 60, literal(FeeStatus.PAID, fee_status_type)),
+                    (chance < 80, literal(FeeStatus.PARTIALLY_PAID, fee_status_type)),
+                    else_=literal(FeeStatus.PENDING, fee_status_type),
+                ),
+            ),
+        ))
+    step("homework and fees")
+
+    admin_id = connection.execute(select(User.id).where(User.role == UserRole.ADMIN)).scalar()
+    insert_rows(connection, Announcement, [
+        {"title": f"Announcement {n}", "message": "Please check the notice board for details.", "target_type": target,
+         "created_by": admin_id, "created_at": now - timedelta(days=n)}
+        for n, target in enumerate(["all", "students", "parents", "teachers"] * 3, start=1)
+    ])
+    for n in range(size.notifications):
+        connection.execute(insert(Notification).from_select(
+            ["user_id", "type", "message", "is_read", "created_at"],
+            select(
+                User.id, literal("announcement"), literal(f"Announcement {n + 1}: please check the notice board"),
+                spread(User.id, 2000 + n, size.seed) < 70, literal(now - timedelta(days=n * 3, minutes=n)),
+            ).where(User.role.in_([UserRole.STUDENT, UserRole.PARENT])),
+        ))
+    step("announcements and notifications")
+
+    with Session(bind=connection) as db:
+        rebuild_attendance_rollups(db)
+        rebuild_fee_balances(db)
+        rebuild_homework_counters(db)
+        rebuild_notification_counters(db)
+        db.flush()
+    step("rollups and counters")
+
+    for model in (User, Student, Parent, AttendanceRecord, Mark, Homework, StudentFee, Notification):
+        counts[model.__tablename__] = connection.execute(select(func.count()).select_from(model)).scalar()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--classes", type=int, default=12)
+    parser.add_argument("--sections-per-class", type=int, default=4)
+    parser.add_argument("--teachers", type=int, default=0, help="default: one per 25 students")
+    parser.add_argument("--children-per-parent", type=int, default=2)
+    parser.add_argument("--days", type=int, default=220, help="school days of attendance history")
+    parser.add_argument("--exams", type=int, default=3)
+    parser.add_argument("--homework-per-subject", type=int, default=4)
+    parser.add_argument("--notifications", type=int, default=5, help="per student and parent")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", type=date.fromisoformat, help="YYYY-MM-DD the history ends on (default: today)")
+    parser.add_argument("--password", default="password123", help="shared by every generated account")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate every table first")
+    args = parser.parse_args()
+
+    if args.reset:
+        Base.metadata.drop_all(engine)
+    prepare_database()
+    size = SchoolSize(
+        students=args.students, classes=args.classes, sections_per_class=args.sections_per_class,
+        teachers=args.teachers, children_per_parent=args.children_per_parent, days=args.days, exams=args.exams,
+        homework_per_subject=args.homework_per_subject, notifications=args.notifications, seed=args.seed,
+    )
+
+    with engine.connect() as connection:
+        if connection.execute(select(User.id).limit(1)).first() is not None:
+            raise SystemExit("The database already has users; pass --reset to start from empty tables")
+        if connection.dialect.name == "sqlite":
+            # A scratch build: nothing to lose on a crash, so skip the fsyncs
+            connection.exec_driver_sql("PRAGMA synchronous=OFF")
+            connection.exec_driver_sql("PRAGMA cache_size=-262144")
+        connection.commit()
+        print(f"Generating {size.students} students, {size.teachers} teachers, {size.days} days into {engine.url} ...")
+        started = time.perf_counter()
+        with connection.begin():
+            counts = generate(connection, size, args.password, today=args.today)
+        print(f"Done in {time.perf_counter() - started:.1f}s")
+
+    for table, count in counts.items():
+        print(f"  - {table}: {count}")
+    print(f"\nLogins (password {args.password}): admin1@{EMAIL_DOMAIN}, accountant1@{EMAIL_DOMAIN}, "
+          f"teacher1@{EMAIL_DOMAIN}, student1@{EMAIL_DOMAIN}, parent1@{EMAIL_DOMAIN}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,27 +4,49 @@ Complete FastAPI backend with JWT auth, WebSockets, and comprehensive features
 Run with: uvicorn main:app --reload
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi import BackgroundTasks, FastAPI, Depends, File, HTTPException, Query, Request, UploadFile, status, WebSocket, WebSocketDisconnect
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Date, Text, Enum as SQLEnum
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, delete, or_, event, inspect, literal, text, tuple_, union, update, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Date, Text, Index, insert, select, func, case, Enum as SQLEnum
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session, sessionmaker, relationship
+from sqlalchemy.orm import Session, relationship, object_session, contains_eager, joinedload, selectinload
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, date
-from typing import Optional, List
-from pydantic import BaseModel, EmailStr
+from typing import Dict, Optional, List
+from pydantic import BaseModel, EmailStr, Field, ValidationError, model_validator
+import asyncio
+import bisect
+import codecs
+import csv
 import enum
+import io
+import itertools
 import json
+import logging
+import statistics
+import time
+import uuid
+
+from core.config import settings
+from core.database import AsyncSessionLocal, SessionLocal, async_engine, engine, get_db, pool_metrics, write_queue
+from core.migrations import migration_lock, upgrade_schema
+from core.security import PasswordHasher, PasswordHasherBusy, Principal, PrincipalCache
+from utils.broker import create_broker
+from utils.uploads import ContentStore, UploadError, receive_multipart
+from utils.websocket import EVERY_CHANNEL, ConnectionManager
+
+logger = logging.getLogger(__name__)
 
 # =====================
 # DATABASE SETUP
 # =====================
 
-DATABASE_URL = "sqlite:///./school_management.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 # =====================
@@ -50,6 +72,14 @@ class HomeworkStatus(str, enum.Enum):
     SUBMITTED = "submitted"
     GRADED = "graded"
 
+class Weekday(str, enum.Enum):
+    MONDAY = "monday"
+    TUESDAY = "tuesday"
+    WEDNESDAY = "wednesday"
+    THURSDAY = "thursday"
+    FRIDAY = "friday"
+    SATURDAY = "saturday"
+
 class FeeStatus(str, enum.Enum):
     PAID = "paid"
     PARTIALLY_PAID = "partially_paid"
@@ -87,6 +117,7 @@ class Class(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     academic_year_id = Column(Integer, ForeignKey("academic_years.id"))
+    academic_year = relationship("AcademicYear")
     sections = relationship("Section", back_populates="class_obj")
     subjects = relationship("Subject", back_populates="class_obj")
 
@@ -125,6 +156,11 @@ class Student(Base):
     marks = relationship("Mark", back_populates="student")
     parents = relationship("StudentParent", back_populates="student")
 
+    __table_args__ = (
+        Index("ix_students_class_section", "class_id", "section_id"),
+        Index("ix_students_section", "section_id"),
+    )
+
 class Parent(Base):
     __tablename__ = "parents"
     id = Column(Integer, primary_key=True, index=True)
@@ -152,6 +188,11 @@ class AttendanceRecord(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     student = relationship("Student", back_populates="attendance_records")
 
+    __table_args__ = (
+        Index("ix_attendance_student_date", "student_id", "date", unique=True),
+        Index("ix_attendance_date", "date"),
+    )
+
 class Homework(Base):
     __tablename__ = "homework"
     id = Column(Integer, primary_key=True, index=True)
@@ -164,8 +205,14 @@ class Homework(Base):
     due_date = Column(Date, nullable=False)
     attachment_url = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    submission_count = Column(Integer, nullable=False, default=0, server_default="0")
+    graded_count = Column(Integer, nullable=False, default=0, server_default="0")
     submissions = relationship("HomeworkSubmission", back_populates="homework")
 
+    __table_args__ = (
+        Index("ix_homework_teacher", "teacher_id"),
+    )
+
 class HomeworkSubmission(Base):
     __tablename__ = "homework_submissions"
     id = Column(Integer, primary_key=True, index=True)
@@ -173,6 +220,10 @@ class HomeworkSubmission(Base):
     student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
     submitted_at = Column(DateTime, default=datetime.utcnow)
     file_url = Column(String)
+    file_sha256 = Column(String(64), index=True)  # name of the file in the upload store
+    file_name = Column(String)
+    file_size = Column(Integer)
+    content_type = Column(String)
     text_answer = Column(Text)
     marks = Column(Float)
     feedback = Column(Text)
@@ -180,6 +231,10 @@ class HomeworkSubmission(Base):
     homework = relationship("Homework", back_populates="submissions")
     student = relationship("Student", back_populates="homework_submissions")
 
+    __table_args__ = (
+        Index("ix_homework_submissions_homework_student", "homework_id", "student_id", unique=True),
+    )
+
 class Exam(Base):
     __tablename__ = "exams"
     id = Column(Integer, primary_key=True, index=True)
@@ -200,6 +255,12 @@ class Mark(Base):
     grade = Column(String)
     student = relationship("Student", back_populates="marks")
 
+    __table_args__ = (
+        Index("ix_marks_student_exam", "student_id", "exam_id"),
+        # One mark per student per paper; the sheet upsert conflicts on it
+        Index("ix_marks_exam_subject_student", "exam_id", "subject_id", "student_id", unique=True),
+    )
+
 class FeeHead(Base):
     __tablename__ = "fee_heads"
     id = Column(Integer, primary_key=True, index=True)
@@ -237,6 +298,30 @@ class Notification(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     user = relationship("User", back_populates="notifications")
 
+    __table_args__ = (
+        # Scanned backwards for "newest first", so no DESC column is needed; id breaks ties for keyset paging
+        Index("ix_notifications_user_created_id", "user_id", "created_at", "id"),
+    )
+
+class NotificationArchive(Base):
+    """Read notifications past the retention window, moved out of the hot table by the maintenance job"""
+    __tablename__ = "notification_archive"
+    # A key of its own: SQLite hands deleted notification ids out again, so an id can be archived twice
+    id = Column(Integer, primary_key=True, index=True)
+    notification_id = Column(Integer, nullable=False)  # the id it had in notifications
+    user_id = Column(Integer, nullable=False, index=True)
+    type = Column(String)
+    reference_id = Column(Integer)
+    message = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False)
+
+class NotificationCounter(Base):
+    """Unread notifications per user, kept in step with every write to notifications"""
+    __tablename__ = "notification_counters"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    unread = Column(Integer, nullable=False, default=0)
+
 class TeacherProfile(Base):
     __tablename__ = "teacher_profiles"
 
@@ -252,7 +337,124 @@ class TeacherProfile(Base):
 
     user = relationship("User")
 
-Base.metadata.create_all(bind=engine)
+class StudentAttendanceSummary(Base):
+    """Running attendance counters per student, maintained by apply_attendance_rollups"""
+    __tablename__ = "student_attendance_summary"
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    total_days = Column(Integer, nullable=False, default=0)
+    present_days = Column(Integer, nullable=False, default=0)
+    half_days = Column(Integer, nullable=False, default=0)
+
+class SectionAttendanceDaily(Base):
+    """Attendance counters per section and day, maintained by apply_attendance_rollups"""
+    __tablename__ = "section_attendance_daily"
+    section_id = Column(Integer, ForeignKey("sections.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    total_days = Column(Integer, nullable=False, default=0)
+    present_days = Column(Integer, nullable=False, default=0)
+    half_days = Column(Integer, nullable=False, default=0)
+
+class FeePayment(Base):
+    """Payment ledger; every change to StudentFee.amount_paid is one row, keyed for retries by transaction_id"""
+    __tablename__ = "fee_payments"
+    id = Column(Integer, primary_key=True, index=True)
+    student_fee_id = Column(Integer, ForeignKey("student_fees.id"), nullable=False, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False, index=True)
+    amount = Column(Float, nullable=False)
+    payment_mode = Column(String, nullable=False)
+    transaction_id = Column(String, unique=True, nullable=False)
+    recorded_by = Column(Integer, ForeignKey("users.id"))
+    paid_at = Column(DateTime, default=datetime.utcnow)
+
+class StudentFeeBalance(Base):
+    """Fee totals per student, maintained by record_fee_payment"""
+    __tablename__ = "student_fee_balances"
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    total_due = Column(Float, nullable=False, default=0.0)
+    total_paid = Column(Float, nullable=False, default=0.0)
+
+class ClassFeeBalance(Base):
+    """Fee totals per class, maintained by record_fee_payment"""
+    __tablename__ = "class_fee_balances"
+    class_id = Column(Integer, ForeignKey("classes.id"), primary_key=True)
+    total_due = Column(Float, nullable=False, default=0.0)
+    total_paid = Column(Float, nullable=False, default=0.0)
+
+class TimetableEntry(Base):
+    """One period of a section's week; the unique keys make double-booking a section or teacher impossible"""
+    __tablename__ = "timetable_entries"
+    id = Column(Integer, primary_key=True, index=True)
+    section_id = Column(Integer, ForeignKey("sections.id"), nullable=False)
+    day = Column(SQLEnum(Weekday), nullable=False)
+    period = Column(Integer, nullable=False)
+    time = Column(String)  # "08:00-08:45"
+    subject_id = Column(Integer, ForeignKey("subjects.id"), nullable=False)
+    teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_timetable_section_slot", "section_id", "day", "period", unique=True),
+        Index("ix_timetable_teacher_slot", "teacher_id", "day", "period", unique=True),
+    )
+
+class TimetableRevision(Base):
+    """Single row bumped by every timetable write, so each worker knows when its in-memory grid is stale"""
+    __tablename__ = "timetable_revision"
+    id = Column(Integer, primary_key=True)
+    revision = Column(Integer, nullable=False, default=0)
+
+class StudentHomeworkDue(Base):
+    """Homework assigned to and submitted by a student per due date; pending = assigned - submitted over dates still ahead"""
+    __tablename__ = "student_homework_due"
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    due_date = Column(Date, primary_key=True)
+    assigned = Column(Integer, nullable=False, default=0)
+    submitted = Column(Integer, nullable=False, default=0)
+
+class TeacherHomeworkSummary(Base):
+    """Homework set by a teacher and the submissions received and graded, maintained with the homework writes"""
+    __tablename__ = "teacher_homework_summary"
+    teacher_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    homework = Column(Integer, nullable=False, default=0)
+    submissions = Column(Integer, nullable=False, default=0)
+    graded = Column(Integer, nullable=False, default=0)
+
+class ReportCard(Base):
+    """Per-student exam totals and ranks, computed by compute_report_cards and dropped whenever marks change"""
+    __tablename__ = "report_cards"
+    exam_id = Column(Integer, ForeignKey("exams.id"), primary_key=True)
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    class_id = Column(Integer, ForeignKey("classes.id"))
+    section_id = Column(Integer, ForeignKey("sections.id"))
+    subjects = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)
+    max_total = Column(Float, nullable=False)
+    percentage = Column(Float, nullable=False)
+    section_rank = Column(Integer, nullable=False)
+    class_rank = Column(Integer, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_report_cards_exam_class", "exam_id", "class_id"),
+        Index("ix_report_cards_exam_section", "exam_id", "section_id"),
+    )
+
+class ReportCardBatch(Base):
+    """Marks an exam and class whose report cards are computed, so a class without marks is not recomputed on every read"""
+    __tablename__ = "report_card_batches"
+    exam_id = Column(Integer, ForeignKey("exams.id"), primary_key=True)
+    class_id = Column(Integer, ForeignKey("classes.id"), primary_key=True)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+class MaintenanceLease(Base):
+    """Single row shared by all workers: who may run maintenance now, and when it last started"""
+    __tablename__ = "maintenance_lease"
+    id = Column(Integer, primary_key=True)
+    locked_until = Column(DateTime)
+    last_run = Column(DateTime)
+
+def prepare_database():
+    """Create missing tables and apply migrations; startup runs it, and so must scripts before using the database"""
+    upgrade_schema(engine, Base.metadata)
 
 # =====================
 # PYDANTIC SCHEMAS
@@ -261,7 +463,8 @@ Base.metadata.create_all(bind=engine)
 class AnnouncementCreate(BaseModel):
     title: str
     message: str
-    target: str = "all"
+    target: str = "all"  # all | teachers | students | parents | class | section | user
+    target_id: Optional[int] = None
 
 class UserCreate(BaseModel):
     name: str
@@ -322,29 +525,60 @@ class ClassCreate(BaseModel):
 class AttendanceMarkRequest(BaseModel):
     class_id: str
     date: str
-    attendance: dict
+    attendance: dict  # {student_id: "present" | "absent" | "late" | "half_day"}
 
 class MarksCreate(BaseModel):
     student_id: int
-    subject: str
-    exam: str
-    max_marks: int
-    obtained_marks: int
+    subject: str  # name or code of a subject of the student's class
+    exam: str  # exam name; the most recent exam of that name
+    max_marks: int = Field(gt=0)
+    obtained_marks: int = Field(ge=0)
+
+    @model_validator(mode="after")
+    def check_marks_range(self):
+        if self.obtained_marks > self.max_marks:
+            raise ValueError(f"obtained_marks {self.obtained_marks} is above max_marks {self.max_marks}")
+        return self
+
+class HomeworkCreate(BaseModel):
+    class_id: int
+    section_id: Optional[int] = None  # None assigns it to every section of the class
+    subject_id: int
+    title: str = Field(min_length=1)
+    description: Optional[str] = None
+    due_date: date
+
+class HomeworkGrade(BaseModel):
+    marks: float = Field(ge=0)
+    feedback: Optional[str] = None
+
+class MarksSheetRequest(BaseModel):
+    exam_id: int
+    section_id: int
+    max_marks: float = Field(100, gt=0)
+    marks: Dict[int, Dict[int, float]]  # {subject_id: {student_id: marks_obtained}}
+
+    @model_validator(mode="after")
+    def check_marks_range(self):
+        for subject_id, sheet in self.marks.items():
+            for student_id, obtained in sheet.items():
+                if not 0 <= obtained <= self.max_marks:
+                    raise ValueError(f"Subject {subject_id}, student {student_id}: {obtained} is outside 0-{self.max_marks:g}")
+        return self
 
 class FeePaymentRequest(BaseModel):
-    amount: float
+    amount: float = Field(gt=0)
     payment_mode: str
-    transaction_id: Optional[str] = None
+    # Receipt or gateway reference; resubmitting the same one is a no-op. Without it retries cannot be recognised.
+    transaction_id: Optional[str] = Field(None, min_length=1, max_length=100)
 
 class TimetableCreate(BaseModel):
-    period: str
-    time: str
-    monday: str
-    tuesday: str
-    wednesday: str
-    thursday: str
-    friday: str
-    saturday: str
+    section_id: int
+    day: Weekday
+    period: int = Field(ge=1, le=12)
+    time: Optional[str] = None
+    subject_id: int
+    teacher_id: int
 
 class TeacherUpdate(BaseModel):
     subject: str
@@ -360,7 +594,19 @@ SECRET_KEY = "your-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
+# Request handlers hash through this pool; the sync helpers below are for scripts and startup
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 def verify_password(plain_password, hashed_password):
@@ -375,31 +621,917 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+principal_cache = PrincipalCache(ttl=settings.AUTH_CACHE_TTL, max_size=settings.AUTH_CACHE_SIZE)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def principal_from_token(token: Optional[str], db: AsyncSession) -> Optional[Principal]:
+    """Resolve a bearer token to its principal, None if the token is missing, invalid or expired"""
+    if not token:
+        return None
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
-        raise credentials_exception
-    return user
+        return None
+    email: str = payload.get("sub")
+    uid = payload.get("uid")
+    if email is None or uid is None:
+        return None
+
+    # The uid claim must match on both paths: a token of a deleted account must not
+    # authenticate as a later account that reuses its email
+    principal = principal_cache.get(email)
+    if principal is not None and principal.id == uid:
+        return principal
+
+    user = await db.scalar(select(User).where(User.email == email))
+    if user is None or user.id != uid:
+        return None
+    principal = Principal.from_user(user)
+    principal_cache.put(email, principal)
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    principal = await principal_from_token(token, db)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _queue_principal_invalidation(mapper, connection, target):
+    # Remember old and new emails, the cache is keyed on whichever one issued the token
+    emails = {target.email, *inspect(target).attrs.email.history.deleted}
+    object_session(target).info.setdefault("stale_principals", set()).update(emails)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_stale_principals(session):
+    for email in session.info.pop("stale_principals", ()):
+        principal_cache.invalidate(email)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stale_principals(session):
+    session.info.pop("stale_principals", None)
+
+# =====================
+# ATTENDANCE WRITES & ROLLUPS
+# =====================
+
+ATTENDED_STATUSES = {AttendanceStatus.PRESENT, AttendanceStatus.LATE}
+
+def dialect_insert(db: Session, model):
+    """INSERT construct for the session's backend, so callers can use ON CONFLICT on SQLite and Postgres alike"""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def upsert_attendance(db: Session, rows: List[dict]):
+    """Insert or update a batch of attendance rows keyed on (student_id, date) with a single executemany"""
+    stmt = dialect_insert(db, AttendanceRecord)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AttendanceRecord.student_id, AttendanceRecord.date],
+        set_={
+            "status": stmt.excluded.status,
+            "remarks": stmt.excluded.remarks,
+            "taken_by_teacher_id": stmt.excluded.taken_by_teacher_id,
+        },
+    )
+    db.execute(stmt, rows)
+
+def _attendance_counts(attendance_status: Optional[AttendanceStatus]):
+    """(total, present, half) contribution of a single record; None means no record"""
+    if attendance_status is None:
+        return 0, 0, 0
+    return (
+        1,
+        1 if attendance_status in ATTENDED_STATUSES else 0,
+        1 if attendance_status == AttendanceStatus.HALF_DAY else 0,
+    )
+
+def attendance_percentage(total_days, present_days, half_days):
+    if not total_days:
+        return 0.0
+    return round((present_days + 0.5 * half_days) * 100 / total_days, 1)
+
+def _increment_rollup(db: Session, model, key_columns: List[str], deltas: dict):
+    """Add counter deltas to a rollup table with one upsert, creating missing rows"""
+    rows = [dict(zip(key_columns, key), **counts) for key, counts in deltas.items() if any(counts.values())]
+    if not rows:
+        return
+    stmt = dialect_insert(db, model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={
+            column: getattr(model, column) + getattr(stmt.excluded, column)
+            for column in rows[0] if column not in key_columns
+        },
+    )
+    db.execute(stmt, rows)
+
+def apply_attendance_rollups(db: Session, record_date: date, changes: List[tuple]):
+    """
+    Fold attendance changes into the rollup tables.
+    `changes` holds (student_id, section_id, old_status, new_status) tuples, old_status is None for new records.
+    """
+    student_deltas = {}
+    section_deltas = {}
+    for student_id, section_id, old_status, new_status in changes:
+        old_counts = _attendance_counts(old_status)
+        new_counts = _attendance_counts(new_status)
+        delta = {
+            "total_days": new_counts[0] - old_counts[0],
+            "present_days": new_counts[1] - old_counts[1],
+            "half_days": new_counts[2] - old_counts[2],
+        }
+        student_deltas[(student_id,)] = delta
+        if section_id is not None:
+            section_delta = section_deltas.setdefault((section_id, record_date), dict.fromkeys(delta, 0))
+            for column, value in delta.items():
+                section_delta[column] += value
+
+    _increment_rollup(db, StudentAttendanceSummary, ["student_id"], student_deltas)
+    _increment_rollup(db, SectionAttendanceDaily, ["section_id", "date"], section_deltas)
+
+def lock_rows_for_write(db: Session, key, ids):
+    """
+    Take the write lock on the rows of `key` (a primary key column) before reading what the write
+    depends on, so concurrent writers (other workers included) cannot both act on the same old state.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        # Row locks held until commit; key order keeps two overlapping writers from deadlocking
+        db.execute(select(key).where(key.in_(ids)).order_by(key).with_for_update())
+    elif dialect == "sqlite":
+        # SQLite has no row locks and the driver only opens a transaction at the first DML, so the
+        # SELECT would run unlocked. Within a worker the write queue already serializes these jobs;
+        # BEGIN IMMEDIATE takes the database write lock up front against the other workers.
+        # An earlier job of the same group commit may have opened the transaction, which then holds it.
+        if not db.connection().connection.driver_connection.in_transaction:
+            db.execute(text("BEGIN IMMEDIATE"))
+
+def lock_students_for_write(db: Session, student_ids):
+    """Serialize writers of the same students' attendance, so previous statuses are never double counted"""
+    lock_rows_for_write(db, Student.id, student_ids)
+
+def write_attendance(db: Session, record_date: date, marked: dict, sections: dict, teacher_id: int):
+    """
+    Upsert a section's attendance ({student_id: status}) and fold it into the rollups.
+    Previous statuses are read in the same transaction, so serialized writers never double count.
+    """
+    lock_students_for_write(db, marked)
+    previous = dict(db.execute(
+        select(AttendanceRecord.student_id, AttendanceRecord.status)
+        .where(AttendanceRecord.student_id.in_(marked), AttendanceRecord.date == record_date)
+    ).all())
+    upsert_attendance(db, [
+        {
+            "student_id": student_id,
+            "date": record_date,
+            "status": attendance_status,
+            "remarks": "",
+            "taken_by_teacher_id": teacher_id,
+        }
+        for student_id, attendance_status in marked.items()
+    ])
+    apply_attendance_rollups(db, record_date, [
+        (student_id, sections[student_id], previous.get(student_id), attendance_status)
+        for student_id, attendance_status in marked.items()
+    ])
+
+def rebuild_attendance_rollups(db: Session):
+    """Recompute both rollup tables from attendance_records, for backfills and bulk seeding"""
+    present = func.sum(case((AttendanceRecord.status.in_(ATTENDED_STATUSES), 1), else_=0))
+    half = func.sum(case((AttendanceRecord.status == AttendanceStatus.HALF_DAY, 1), else_=0))
+
+    db.query(StudentAttendanceSummary).delete()
+    db.query(SectionAttendanceDaily).delete()
+    db.execute(
+        StudentAttendanceSummary.__table__.insert().from_select(
+            ["student_id", "total_days", "present_days", "half_days"],
+            select(AttendanceRecord.student_id, func.count(), present, half)
+            .group_by(AttendanceRecord.student_id),
+        )
+    )
+    db.execute(
+        SectionAttendanceDaily.__table__.insert().from_select(
+            ["section_id", "date", "total_days", "present_days", "half_days"],
+            select(Student.section_id, AttendanceRecord.date, func.count(), present, half)
+            .join(Student, Student.id == AttendanceRecord.student_id)
+            .where(Student.section_id.is_not(None))
+            .group_by(Student.section_id, AttendanceRecord.date),
+        )
+    )
+
+# =====================
+# MARKS & GRADING
+# =====================
+
+class GradeScale:
+    """Grade boundary table; grades for a whole sheet come from one bisect per mark"""
+
+    def __init__(self, boundaries: str, pass_percentage: float):
+        pairs = sorted(
+            (float(minimum), grade.strip())
+            for minimum, grade in (item.split(":", 1) for item in boundaries.split(",") if item.strip())
+        )
+        if not pairs or pairs[0][0] > 0:
+            raise ValueError("GRADE_BOUNDARIES needs a grade starting at 0")
+        self.thresholds = [minimum for minimum, _ in pairs]
+        self.grades = [grade for _, grade in pairs]
+        self.pass_percentage = pass_percentage
+
+    def grade(self, percentage: float) -> str:
+        return self.grades[bisect.bisect_right(self.thresholds, percentage) - 1]
+
+    def grade_many(self, percentages: List[float]) -> List[str]:
+        thresholds, grades, locate = self.thresholds, self.grades, bisect.bisect_right
+        return [grades[locate(thresholds, percentage) - 1] for percentage in percentages]
+
+grade_scale = GradeScale(settings.GRADE_BOUNDARIES, settings.PASS_PERCENTAGE)
+
+def sheet_aggregates(percentages: List[float], grades: List[str]) -> dict:
+    """Summary of one exam x subject x section sheet"""
+    if not percentages:
+        return {"count": 0, "mean": None, "median": None, "highest": None, "lowest": None, "passRate": None, "grades": {}}
+    passed = sum(1 for percentage in percentages if percentage >= grade_scale.pass_percentage)
+    distribution = dict.fromkeys(reversed(grade_scale.grades), 0)
+    for grade in grades:
+        # Stored grades may predate a change to the boundary table
+        distribution[grade] = distribution.get(grade, 0) + 1
+    return {
+        "count": len(percentages),
+        "mean": round(statistics.fmean(percentages), 2),
+        "median": round(statistics.median(percentages), 2),
+        "highest": round(max(percentages), 2),
+        "lowest": round(min(percentages), 2),
+        "passRate": round(100 * passed / len(percentages), 1),
+        "grades": distribution,
+    }
+
+def upsert_marks(db: Session, rows: List[dict]):
+    """Insert or replace a sheet of marks keyed on (exam_id, subject_id, student_id) with one executemany"""
+    stmt = dialect_insert(db, Mark)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Mark.exam_id, Mark.subject_id, Mark.student_id],
+        set_={
+            "marks_obtained": stmt.excluded.marks_obtained,
+            "max_marks": stmt.excluded.max_marks,
+            "grade": stmt.excluded.grade,
+        },
+    )
+    db.execute(stmt, rows)
+
+def invalidate_report_cards(db: Session, exam_id: int, class_id: int):
+    """Drop an exam's precomputed report cards for a class; ranks span the class, so every section goes"""
+    db.execute(delete(ReportCard).where(ReportCard.exam_id == exam_id, ReportCard.class_id == class_id))
+    db.execute(delete(ReportCardBatch).where(ReportCardBatch.exam_id == exam_id, ReportCardBatch.class_id == class_id))
+
+def write_marks_sheet(db: Session, exam_id: int, class_id: int, rows: List[dict]):
+    # Same lock as compute_report_cards: a computation racing this write either sees the new marks
+    # or finishes first and has its cards dropped here, never stores cards for the old marks after
+    lock_rows_for_write(db, Class.id, [class_id])
+    upsert_marks(db, rows)
+    invalidate_report_cards(db, exam_id, class_id)
+
+def compute_report_cards(db: Session, exam_id: int, class_id: int):
+    """
+    Totals, percentages and section/class ranks for every student of a class in one
+    INSERT ... SELECT: a GROUP BY over the exam's marks feeding two RANK() windows.
+    """
+    lock_rows_for_write(db, Class.id, [class_id])
+    totals = (
+        select(
+            Mark.student_id,
+            Student.section_id,
+            func.count().label("subjects"),
+            func.sum(Mark.marks_obtained).label("total"),
+            func.sum(Mark.max_marks).label("max_total"),
+        )
+        .join(Student, Student.id == Mark.student_id)
+        .where(Mark.exam_id == exam_id, Student.class_id == class_id)
+        .group_by(Mark.student_id, Student.section_id)
+        .subquery()
+    )
+    percentage = totals.c.total * 100.0 / totals.c.max_total
+    ranked = select(
+        literal(exam_id),
+        totals.c.student_id,
+        literal(class_id),
+        totals.c.section_id,
+        totals.c.subjects,
+        totals.c.total,
+        totals.c.max_total,
+        percentage,
+        func.rank().over(partition_by=totals.c.section_id, order_by=percentage.desc()),
+        func.rank().over(order_by=percentage.desc()),
+        literal(datetime.utcnow()),
+    ).where(totals.c.max_total > 0)  # also the WHERE SQLite needs before ON CONFLICT in INSERT ... SELECT
+    # Concurrent readers may race to fill the same exam and class; the first insert wins
+    db.execute(
+        dialect_insert(db, ReportCard)
+        .from_select(
+            ["exam_id", "student_id", "class_id", "section_id", "subjects", "total", "max_total",
+             "percentage", "section_rank", "class_rank", "computed_at"],
+            ranked,
+        )
+        .on_conflict_do_nothing()
+    )
+    db.execute(
+        dialect_insert(db, ReportCardBatch)
+        .values(exam_id=exam_id, class_id=class_id, computed_at=datetime.utcnow())
+        .on_conflict_do_nothing()
+    )
+
+async def load_report_cards(db: AsyncSession, exam_id: int, class_id: int, *filters) -> List[ReportCard]:
+    """
+    Precomputed report cards of an exam and class matching filters, computing the class on first use.
+    No cards only means "not computed yet" when the class has no ReportCardBatch marker; with one,
+    the filter (or the whole class) simply has no marks and the empty result is the answer.
+    """
+    stmt = select(ReportCard).where(ReportCard.exam_id == exam_id, ReportCard.class_id == class_id, *filters)
+    cards = (await db.scalars(stmt)).all()
+    if not cards:
+        computed = await db.scalar(
+            select(ReportCardBatch.computed_at).where(ReportCardBatch.exam_id == exam_id, ReportCardBatch.class_id == class_id)
+        )
+        if computed is not None:
+            return cards
+        if await db.get(Exam, exam_id) is None:
+            raise HTTPException(status_code=404, detail="Exam not found")
+        await write_queue.submit(compute_report_cards, exam_id, class_id)
+        cards = (await db.scalars(stmt)).all()
+    return cards
+
+def report_card_summary(card: ReportCard) -> dict:
+    return {
+        "studentId": card.student_id,
+        "subjects": card.subjects,
+        "total": card.total,
+        "maxTotal": card.max_total,
+        "percentage": round(card.percentage, 2),
+        "grade": grade_scale.grade(card.percentage),
+        "sectionRank": card.section_rank,
+        "classRank": card.class_rank,
+    }
+
+# =====================
+# FEE LEDGER
+# =====================
+
+class PaymentExceedsBalance(Exception):
+    """Raised inside the payment write job when the amount is more than the fee's outstanding balance"""
+
+def fee_status(amount_paid, amount_due):
+    """SQL CASE giving a fee's status from column expressions, for use inside the payment UPDATE"""
+    return case(
+        (amount_paid >= amount_due, literal(FeeStatus.PAID, StudentFee.status.type)),
+        (amount_paid > 0, literal(FeeStatus.PARTIALLY_PAID, StudentFee.status.type)),
+        else_=literal(FeeStatus.PENDING, StudentFee.status.type),
+    )
+
+def record_fee_payment(db: Session, fee_id: int, student_id: int, class_id: Optional[int], payment: dict):
+    """
+    Ledger row, StudentFee update and balance increments in one transaction. Returns the fee's
+    new (amount_paid, status), or None when transaction_id was already recorded, in which case
+    nothing was written. The amount is added inside the UPDATE, so concurrent payments never
+    lose each other, and the WHERE refuses anything beyond the outstanding amount.
+    """
+    payment_id = db.scalar(
+        dialect_insert(db, FeePayment)
+        .values(student_fee_id=fee_id, student_id=student_id, **payment)
+        .on_conflict_do_nothing(index_elements=[FeePayment.transaction_id])
+        .returning(FeePayment.id)
+    )
+    if payment_id is None:
+        return None
+
+    new_paid = func.coalesce(StudentFee.amount_paid, 0) + payment["amount"]
+    fee = db.execute(
+        update(StudentFee)
+        .where(StudentFee.id == fee_id, new_paid <= StudentFee.amount_due)
+        .values(amount_paid=new_paid, status=fee_status(new_paid, StudentFee.amount_due))
+        .returning(StudentFee.amount_paid, StudentFee.status)
+    ).one_or_none()
+    if fee is None:
+        # Raising rolls the ledger row back with it
+        raise PaymentExceedsBalance()
+
+    paid = {"total_paid": payment["amount"]}
+    _increment_rollup(db, StudentFeeBalance, ["student_id"], {(student_id,): paid})
+    if class_id is not None:
+        _increment_rollup(db, ClassFeeBalance, ["class_id"], {(class_id,): paid})
+    return tuple(fee)
+
+def rebuild_fee_balances(db: Session):
+    """Recompute both balance tables from student_fees, for backfills, seeding and fee assignment"""
+    due = func.sum(StudentFee.amount_due)
+    paid = func.sum(func.coalesce(StudentFee.amount_paid, 0))
+
+    db.query(StudentFeeBalance).delete()
+    db.query(ClassFeeBalance).delete()
+    db.execute(
+        StudentFeeBalance.__table__.insert().from_select(
+            ["student_id", "total_due", "total_paid"],
+            select(StudentFee.student_id, due, paid).group_by(StudentFee.student_id),
+        )
+    )
+    db.execute(
+        ClassFeeBalance.__table__.insert().from_select(
+            ["class_id", "total_due", "total_paid"],
+            select(Student.class_id, due, paid)
+            .join(Student, Student.id == StudentFee.student_id)
+            .where(Student.class_id.is_not(None))
+            .group_by(Student.class_id),
+        )
+    )
+
+def fee_balance(total_due, total_paid) -> dict:
+    return {"totalDue": total_due, "totalPaid": total_paid, "outstanding": round(total_due - total_paid, 2)}
+
+# =====================
+# TIMETABLE
+# =====================
+
+class TimetableIndex:
+    """
+    In-memory copy of the timetable: slot indexes on (section, day, period) and
+    (teacher, day, period) for constant-time clash checks, plus week grids built once
+    per section or teacher. It is valid for one timetable revision and reloads when the
+    revision in the database moves, which also picks up writes from other workers.
+    """
+
+    def __init__(self):
+        self.revision: Optional[int] = None
+        self.entries: Dict[int, dict] = {}
+        self.section_slots: Dict[tuple, int] = {}
+        self.teacher_slots: Dict[tuple, int] = {}
+        self.grids: Dict[tuple, list] = {}
+
+    def load(self, revision: int, entries: List[dict]):
+        self.entries = {}
+        self.section_slots = {}
+        self.teacher_slots = {}
+        self.grids = {}
+        for entry in entries:
+            self._add(entry)
+        self.revision = revision
+
+    def clashes(self, section_id: int, teacher_id: int, day: Weekday, period: int, entry_id: int = None) -> List[dict]:
+        found = []
+        for slots, key in ((self.section_slots, (section_id, day, period)), (self.teacher_slots, (teacher_id, day, period))):
+            other = slots.get(key)
+            if other is not None and other != entry_id and self.entries[other] not in found:
+                found.append(self.entries[other])
+        return found
+
+    def apply(self, revision: int, removed_id: Optional[int] = None, entry: Optional[dict] = None):
+        """Fold in a write that moved the revision by one; anything else means a reload is due"""
+        if self.revision != revision - 1:
+            self.revision = None
+            return
+        if removed_id is not None and removed_id in self.entries:
+            self._remove(removed_id)
+        if entry is not None:
+            self._add(entry)
+        self.revision = revision
+
+    def grid(self, kind: str, key: int) -> list:
+        """Week rows for a section or teacher in the shape the timetable page renders"""
+        if (kind, key) not in self.grids:
+            rows = {}
+            for entry in self.entries.values():
+                if entry[f"{kind}_id"] != key:
+                    continue
+                row = rows.setdefault(entry["period"], {
+                    "period": str(entry["period"]),
+                    "time": "",
+                    **dict.fromkeys((day.value for day in Weekday), ""),
+                })
+                label = entry["subject"] if kind == "section" else f"{entry['subject']} ({entry['section']})"
+                row[entry["day"].value] = label
+                row[f"{entry['day'].value}Id"] = entry["id"]
+                if entry["time"]:
+                    row["time"] = entry["time"]
+            self.grids[(kind, key)] = [rows[period] for period in sorted(rows)]
+        return self.grids[(kind, key)]
+
+    def _add(self, entry: dict):
+        self.entries[entry["id"]] = entry
+        self.section_slots[(entry["section_id"], entry["day"], entry["period"])] = entry["id"]
+        self.teacher_slots[(entry["teacher_id"], entry["day"], entry["period"])] = entry["id"]
+        self.grids.pop(("section", entry["section_id"]), None)
+        self.grids.pop(("teacher", entry["teacher_id"]), None)
+
+    def _remove(self, entry_id: int):
+        entry = self.entries.pop(entry_id)
+        self.section_slots.pop((entry["section_id"], entry["day"], entry["period"]), None)
+        self.teacher_slots.pop((entry["teacher_id"], entry["day"], entry["period"]), None)
+        self.grids.pop(("section", entry["section_id"]), None)
+        self.grids.pop(("teacher", entry["teacher_id"]), None)
+
+timetable_index = TimetableIndex()
+
+def timetable_entries_query():
+    return (
+        select(
+            TimetableEntry.id,
+            TimetableEntry.section_id,
+            TimetableEntry.teacher_id,
+            TimetableEntry.day,
+            TimetableEntry.period,
+            TimetableEntry.time,
+            Subject.name.label("subject"),
+            (Class.name + "-" + Section.name).label("section"),
+            User.name.label("teacher"),
+        )
+        .join(Subject, Subject.id == TimetableEntry.subject_id)
+        .join(Section, Section.id == TimetableEntry.section_id)
+        .join(Class, Class.id == Section.class_id)
+        .join(User, User.id == TimetableEntry.teacher_id)
+    )
+
+async def current_timetable(db: AsyncSession) -> TimetableIndex:
+    """The in-memory timetable, reloaded first if another write moved the revision"""
+    revision = await db.scalar(select(TimetableRevision.revision).where(TimetableRevision.id == 1)) or 0
+    if timetable_index.revision != revision:
+        rows = (await db.execute(timetable_entries_query())).mappings().all()
+        timetable_index.load(revision, [dict(row) for row in rows])
+    return timetable_index
+
+def clash_detail(clashes: List[dict], day: Weekday, period: int) -> str:
+    taken = "; ".join(f"{entry['section']} has {entry['subject']} with {entry['teacher']}" for entry in clashes)
+    return f"{day.value.title()} period {period} is taken: {taken}"
+
+class TimetableEntryNotFound(Exception):
+    """Raised inside the timetable write job when the entry to change does not exist"""
+
+class TimetableSlotTaken(Exception):
+    """Raised inside the timetable write job when the slot clashes; the message is the clash detail"""
+
+def save_timetable_entry(db: Session, entry_id: Optional[int], values: dict):
+    """
+    Insert (entry_id None), update or delete (values None) an entry and bump the revision.
+    The bump comes first so it takes the write lock; the clash query then runs on the
+    unique slot indexes and is authoritative even against other workers.
+    Returns (revision, removed entry id, saved entry).
+    """
+    # One upsert, so two first writers cannot both try to create the row
+    revision = db.scalar(
+        dialect_insert(db, TimetableRevision)
+        .values(id=1, revision=1)
+        .on_conflict_do_update(index_elements=[TimetableRevision.id], set_={"revision": TimetableRevision.revision + 1})
+        .returning(TimetableRevision.revision)
+    )
+
+    if entry_id is not None and db.get(TimetableEntry, entry_id) is None:
+        raise TimetableEntryNotFound()
+    if values is None:
+        db.execute(delete(TimetableEntry).where(TimetableEntry.id == entry_id))
+        return revision, entry_id, None
+
+    slot = (TimetableEntry.day == values["day"]) & (TimetableEntry.period == values["period"])
+    clashes = db.execute(
+        timetable_entries_query()
+        .where(slot & ((TimetableEntry.section_id == values["section_id"]) | (TimetableEntry.teacher_id == values["teacher_id"])))
+        .where(TimetableEntry.id != (entry_id or 0))
+    ).mappings().all()
+    if clashes:
+        raise TimetableSlotTaken(clash_detail(clashes, values["day"], values["period"]))
+
+    if entry_id is None:
+        entry_id = db.scalar(insert(TimetableEntry).values(**values).returning(TimetableEntry.id))
+    else:
+        db.execute(update(TimetableEntry).where(TimetableEntry.id == entry_id).values(**values))
+    entry = db.execute(timetable_entries_query().where(TimetableEntry.id == entry_id)).mappings().one()
+    return revision, entry_id, dict(entry)
+
+# =====================
+# HOMEWORK SUBMISSIONS
+# =====================
+
+upload_store = ContentStore(settings.UPLOAD_DIR)
+UPLOAD_ALLOWED_TYPES = {item.strip() for item in settings.UPLOAD_ALLOWED_TYPES.split(",") if item.strip()}
+
+def homework_students(homework_class_id, homework_section_id):
+    """Filter for the students a homework is assigned to"""
+    return and_(
+        Student.class_id == homework_class_id,
+        or_(homework_section_id == None, Student.section_id == homework_section_id),  # noqa: E711
+    )
+
+def assign_homework(db: Session, values: dict) -> int:
+    """Insert a homework and count it against its teacher and, per due date, every student it targets"""
+    homework_id = db.scalar(insert(Homework).values(**values).returning(Homework.id))
+    _increment_rollup(db, TeacherHomeworkSummary, ["teacher_id"], {(values["teacher_id"],): {"homework": 1}})
+
+    due = dialect_insert(db, StudentHomeworkDue)
+    db.execute(
+        due.from_select(
+            ["student_id", "due_date", "assigned", "submitted"],
+            select(Student.id, literal(values["due_date"]), literal(1), literal(0))
+            .where(homework_students(values["class_id"], values.get("section_id"))),
+        ).on_conflict_do_update(
+            index_elements=[StudentHomeworkDue.student_id, StudentHomeworkDue.due_date],
+            set_={"assigned": StudentHomeworkDue.assigned + 1},
+        )
+    )
+    return homework_id
+
+def rebuild_homework_counters(db: Session):
+    """Recompute every homework counter from homework and homework_submissions, for backfills and seeding"""
+    submitted = (
+        select(HomeworkSubmission.homework_id, func.count().label("submitted"),
+               func.sum(case((HomeworkSubmission.status == HomeworkStatus.GRADED, 1), else_=0)).label("graded"))
+        .group_by(HomeworkSubmission.homework_id)
+        .subquery()
+    )
+    db.execute(
+        update(Homework).values(
+            submission_count=func.coalesce(select(submitted.c.submitted).where(submitted.c.homework_id == Homework.id).scalar_subquery(), 0),
+            graded_count=func.coalesce(select(submitted.c.graded).where(submitted.c.homework_id == Homework.id).scalar_subquery(), 0),
+        )
+    )
+
+    db.query(TeacherHomeworkSummary).delete()
+    db.execute(
+        TeacherHomeworkSummary.__table__.insert().from_select(
+            ["teacher_id", "homework", "submissions", "graded"],
+            select(Homework.teacher_id, func.count(), func.sum(Homework.submission_count), func.sum(Homework.graded_count))
+            .group_by(Homework.teacher_id),
+        )
+    )
+
+    refresh_student_homework_due(db)
+
+def refresh_student_homework_due(db: Session, *students):
+    """
+    Recompute StudentHomeworkDue for the students matching the filters (all of them without any)
+    from the homework of their current class and section. Run when students are created, imported
+    or moved, since assign_homework only counts the students a homework targets at that moment.
+    db may also be a Connection, as in the Student mapper events.
+    """
+    db.execute(delete(StudentHomeworkDue).where(StudentHomeworkDue.student_id.in_(select(Student.id).where(*students))))
+    db.execute(
+        StudentHomeworkDue.__table__.insert().from_select(
+            ["student_id", "due_date", "assigned", "submitted"],
+            select(
+                Student.id,
+                Homework.due_date,
+                func.count(),
+                func.count(HomeworkSubmission.id),
+            )
+            .join(Homework, homework_students(Homework.class_id, Homework.section_id))
+            .outerjoin(
+                HomeworkSubmission,
+                (HomeworkSubmission.homework_id == Homework.id) & (HomeworkSubmission.student_id == Student.id),
+            )
+            .where(*students)
+            .group_by(Student.id, Homework.due_date),
+        )
+    )
+
+@event.listens_for(Student, "after_insert")
+def _count_homework_of_new_student(mapper, connection, target):
+    if target.class_id is not None:
+        refresh_student_homework_due(connection, Student.id == target.id)
+
+@event.listens_for(Student, "after_update")
+def _recount_homework_of_moved_student(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.class_id.history.has_changes() or state.attrs.section_id.history.has_changes():
+        refresh_student_homework_due(connection, Student.id == target.id)
+
+def grade_homework_submission(db: Session, submission_id: int, homework_id: int, teacher_id: int, values: dict):
+    """Store marks and feedback; the first grading of a submission also moves the graded counters"""
+    first_grading = db.scalar(
+        update(HomeworkSubmission)
+        .where(HomeworkSubmission.id == submission_id, HomeworkSubmission.status != HomeworkStatus.GRADED)
+        .values(status=HomeworkStatus.GRADED, **values)
+        .returning(HomeworkSubmission.id)
+    )
+    if first_grading is None:
+        db.execute(update(HomeworkSubmission).where(HomeworkSubmission.id == submission_id).values(**values))
+        return
+    db.execute(update(Homework).where(Homework.id == homework_id).values(graded_count=Homework.graded_count + 1))
+    _increment_rollup(db, TeacherHomeworkSummary, ["teacher_id"], {(teacher_id,): {"graded": 1}})
+
+class SubmissionAlreadyGraded(Exception):
+    """Raised inside the submission write job when the earlier submission was graded meanwhile"""
+
+def save_homework_submission(db: Session, homework: dict, student_id: int, values: dict):
+    """
+    Insert a student's submission, or replace their earlier one, and keep the submission counters
+    in step. Returns (submission_id, file_url, created). The insert decides which case applies, so
+    two racing first submissions still count once; a resubmission without a file keeps the old one.
+    """
+    homework_id = homework["id"]
+    inserted = db.execute(
+        dialect_insert(db, HomeworkSubmission)
+        .values(homework_id=homework_id, student_id=student_id, **values)
+        .on_conflict_do_nothing(index_elements=[HomeworkSubmission.homework_id, HomeworkSubmission.student_id])
+        .returning(HomeworkSubmission.id, HomeworkSubmission.file_url)
+    ).one_or_none()
+    if inserted is not None:
+        db.execute(update(Homework).where(Homework.id == homework_id).values(submission_count=Homework.submission_count + 1))
+        _increment_rollup(db, TeacherHomeworkSummary, ["teacher_id"], {(homework["teacher_id"],): {"submissions": 1}})
+        _increment_rollup(db, StudentHomeworkDue, ["student_id", "due_date"], {(student_id, homework["due_date"]): {"submitted": 1}})
+        return (*inserted, True)
+    # The route checked the status before the upload; grading may have happened since
+    updated = db.execute(
+        update(HomeworkSubmission)
+        .where(
+            HomeworkSubmission.homework_id == homework_id,
+            HomeworkSubmission.student_id == student_id,
+            HomeworkSubmission.status != HomeworkStatus.GRADED,
+        )
+        .values(**values)
+        .returning(HomeworkSubmission.id, HomeworkSubmission.file_url)
+    ).one_or_none()
+    if updated is None:
+        raise SubmissionAlreadyGraded()
+    return (*updated, False)
+
+# =====================
+# BULK IMPORT
+# =====================
+
+IMPORT_BATCH_SIZE = 500
+
+def check_csv_encoding(upload: UploadFile, chunk_size: int = 64 * 1024):
+    """Reject a CSV that is not UTF-8 before any of it is imported, naming the first bad line"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    line_no = 1
+    try:
+        while True:
+            chunk = upload.file.read(chunk_size)
+            line_no += decoder.decode(chunk, final=not chunk).count("\n")
+            if not chunk:
+                break
+    except UnicodeDecodeError as exc:
+        line_no += exc.object[:exc.start].count(b"\n")
+        raise HTTPException(status_code=400, detail=f"File must be UTF-8 encoded (invalid bytes on line {line_no})")
+    finally:
+        upload.file.seek(0)
+
+def iter_csv_rows(upload: UploadFile):
+    """Yield (line number, row) pairs from an uploaded CSV, one row at a time"""
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {key.strip(): (value or "").strip() for key, value in row.items() if key}
+    finally:
+        text.detach()
+
+async def read_csv_rows(upload: UploadFile, batch_size: int = IMPORT_BATCH_SIZE):
+    """iter_csv_rows with the reading and parsing done in the threadpool, batch_size rows at a time"""
+    rows = iter_csv_rows(upload)
+    try:
+        while True:
+            parsed = await run_in_threadpool(list, itertools.islice(rows, batch_size))
+            if not parsed:
+                return
+            for row in parsed:
+                yield row
+    finally:
+        rows.close()
+
+def _validation_messages(exc: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in exc.errors()]
+
+def _student_profile(lookups: dict, person: StudentCreate) -> dict:
+    class_id = section_id = None
+    if person.class_:
+        class_id = lookups["classes"].get(person.class_)
+        if class_id is None:
+            raise ValueError(f"Unknown class '{person.class_}'")
+    if person.section:
+        section_id = lookups["sections"].get((class_id, person.section))
+        if section_id is None:
+            raise ValueError(f"Unknown section '{person.section}' for class '{person.class_}'")
+    return {"admission_no": person.admission_no, "class_id": class_id, "section_id": section_id, "roll_no": person.roll_no}
+
+def _teacher_profile(lookups: dict, person: TeacherCreate) -> dict:
+    return {
+        "subject": person.subject,
+        "experience": person.experience,
+        "qualification": person.qualification,
+        "classes": person.classes,
+    }
+
+IMPORT_KINDS = {
+    "students": {
+        "schema": StudentCreate,
+        "role": UserRole.STUDENT,
+        "profile_model": Student,
+        "profile": _student_profile,
+        "aliases": {"class": "class_"},
+        "unique": Student.admission_no,  # profile column that must not repeat, besides the user email
+        # Core inserts skip the Student mapper events, so homework already set for their class is counted here
+        "after_insert": lambda db, user_ids: refresh_student_homework_due(db, Student.user_id.in_(user_ids)),
+    },
+    "teachers": {
+        "schema": TeacherCreate,
+        "role": UserRole.TEACHER,
+        "profile_model": TeacherProfile,
+        "profile": _teacher_profile,
+        "aliases": {},
+        "unique": None,
+        "after_insert": None,
+    },
+}
+
+async def _import_lookups(db: AsyncSession) -> dict:
+    classes = dict((await db.execute(select(Class.name, Class.id))).all())
+    sections = {(class_id, name): section_id for section_id, class_id, name in await db.execute(select(Section.id, Section.class_id, Section.name))}
+    return {"classes": classes, "sections": sections}
+
+async def _flush_import_batch(db: AsyncSession, kind: dict, batch: List[tuple], report: dict):
+    """Insert one batch of validated rows as users plus profiles in a single transaction"""
+    emails = [person.email for _, person, _ in batch]
+    taken_emails = set(await db.scalars(select(User.email).where(User.email.in_(emails))))
+    taken_unique = set()
+    unique_column = kind["unique"]
+    if unique_column is not None:
+        values = [profile[unique_column.key] for _, _, profile in batch]
+        taken_unique = set(await db.scalars(select(unique_column).where(unique_column.in_(values))))
+
+    accepted = []
+    for line_no, person, profile in batch:
+        if person.email in taken_emails:
+            report["errors"].append({"row": line_no, "errors": [f"email '{person.email}' already exists"]})
+        elif unique_column is not None and profile[unique_column.key] in taken_unique:
+            report["errors"].append({"row": line_no, "errors": [f"{unique_column.key} '{profile[unique_column.key]}' already exists"]})
+        else:
+            accepted.append((line_no, person, profile))
+    if not accepted:
+        return
+
+    hashes = await password_hasher.hash_many([person.password for _, person, _ in accepted])
+    try:
+        user_ids = (await db.scalars(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [
+                {"name": person.name, "email": person.email, "phone": person.phone,
+                 "password_hash": password_hash, "role": kind["role"], "status": "active"}
+                for (_, person, _), password_hash in zip(accepted, hashes)
+            ],
+        )).all()
+        await db.execute(
+            insert(kind["profile_model"]),
+            [dict(profile, user_id=user_id) for (_, _, profile), user_id in zip(accepted, user_ids)],
+        )
+        if kind["after_insert"] is not None:
+            await db.run_sync(kind["after_insert"], user_ids)
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        for line_no, _, _ in accepted:
+            report["errors"].append({"row": line_no, "errors": [f"batch rejected by the database: {exc.orig}"]})
+        return
+    report["created"] += len(accepted)
+
+async def import_people(db: AsyncSession, upload: UploadFile, kind: dict) -> dict:
+    """Stream a CSV upload into users plus profiles, in batches, collecting a per-row error report"""
+    # Both pass over the whole file, so like password hashing they run off the event loop
+    await run_in_threadpool(check_csv_encoding, upload)
+    report = {"created": 0, "errors": []}
+    lookups = await _import_lookups(db)
+    seen = set()
+    batch = []
+    async for line_no, raw in read_csv_rows(upload):
+        fields = {kind["aliases"].get(key, key): value for key, value in raw.items() if value != ""}
+        try:
+            person = kind["schema"](**fields)
+            profile = kind["profile"](lookups, person)
+        except ValidationError as exc:
+            report["errors"].append({"row": line_no, "errors": _validation_messages(exc)})
+            continue
+        except ValueError as exc:
+            report["errors"].append({"row": line_no, "errors": [str(exc)]})
+            continue
+
+        keys = {("email", person.email)}
+        if kind["unique"] is not None:
+            keys.add((kind["unique"].key, profile[kind["unique"].key]))
+        repeated = keys & seen
+        if repeated:
+            report["errors"].append({"row": line_no, "errors": [f"duplicate {name} '{value}' in file" for name, value in sorted(repeated)]})
+            continue
+        seen |= keys
+
+        batch.append((line_no, person, profile))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await _flush_import_batch(db, kind, batch, report)
+            batch = []
+    if batch:
+        await _flush_import_batch(db, kind, batch, report)
+
+    report["errors"].sort(key=lambda error: error["row"])
+    report["failed"] = len(report["errors"])
+    return report
 
 # =====================
 # FASTAPI APP
@@ -415,16 +1547,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/api/notifications/mark-all-read")
-def mark_all_read(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    db.query(Notification).filter(Notification.user_id == current_user.id).update({"is_read": True})
-    db.commit()
-    return {"message": "All notifications marked as read"}
-
 # Teachers
 @app.get("/api/teachers")
-def get_teachers(db: Session = Depends(get_db)):
-    profiles = db.query(TeacherProfile).join(User).all()
+async def get_teachers(db: AsyncSession = Depends(get_db)):
+    # The join already fetches users; contains_eager fills p.user from it instead of one SELECT per teacher
+    profiles = await db.scalars(select(TeacherProfile).join(User).options(contains_eager(TeacherProfile.user)))
 
     return {
         "teachers": [
@@ -446,8 +1573,8 @@ def get_teachers(db: Session = Depends(get_db)):
 
 @app.post("/api/teachers")
 async def create_teacher(teacher: TeacherCreate, 
-                         db: Session = Depends(get_db), 
-                         current_user: User = Depends(get_current_user)):
+                         db: AsyncSession = Depends(get_db), 
+                         current_user: Principal = Depends(get_current_user)):
 
     if current_user.role not in [UserRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Not authorized")
@@ -457,12 +1584,11 @@ async def create_teacher(teacher: TeacherCreate,
         name=teacher.name,
         email=teacher.email,
         phone=teacher.phone,
-        password_hash=get_password_hash(teacher.password),
+        password_hash=await password_hasher.hash(teacher.password),
         role=UserRole.TEACHER
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
 
     # Create TEACHER PROFILE entry
     profile = TeacherProfile(
@@ -473,142 +1599,988 @@ async def create_teacher(teacher: TeacherCreate,
         classes=teacher.classes,
     )
     db.add(profile)
-    db.commit()
+    await db.commit()
 
     return {"message": "Teacher created successfully"}
 
+@app.post("/api/teachers/import")
+async def import_teachers(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role not in [UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    return await import_people(db, file, IMPORT_KINDS["teachers"])
+
 
 # Classes
 @app.get("/api/classes")
-def get_classes(db: Session = Depends(get_db)):
-    classes = db.query(Class).all()
+async def get_classes(db: AsyncSession = Depends(get_db)):
+    classes = await db.scalars(
+        select(Class)
+        .options(joinedload(Class.academic_year), selectinload(Class.sections))
+        .order_by(Class.id)
+    )
+    student_counts = dict((await db.execute(select(Student.class_id, func.count(Student.id)).group_by(Student.class_id))).all())
     return {
         "classes": [
             {
                 "id": c.id,
                 "name": c.name,
-                "academicYear": "2024-25",
-                "sections": ["A", "B", "C"],
-                "students": 120
+                "academicYear": c.academic_year.name if c.academic_year else None,
+                "sections": [section.name for section in c.sections],
+                "students": student_counts.get(c.id, 0)
             }
             for c in classes
         ]
     }
 
 @app.post("/api/classes")
-async def create_class(class_data: ClassCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_class(class_data: ClassCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     if current_user.role not in [UserRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
     db_class = Class(name=class_data.name)
     db.add(db_class)
-    db.commit()
+    await db.flush()
     
     sections = [s.strip() for s in class_data.sections.split(',')]
     for section_name in sections:
         section = Section(class_id=db_class.id, name=section_name)
         db.add(section)
-    db.commit()
+    await db.commit()
     
     return {"message": "Class created successfully"}
 
 # Attendance Marking
 @app.post("/api/attendance/mark")
-async def mark_attendance(attendance_data: AttendanceMarkRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def mark_attendance(attendance_data: AttendanceMarkRequest, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     if current_user.role != UserRole.TEACHER:
         raise HTTPException(status_code=403, detail="Only teachers can mark attendance")
     
-    # Here you would save the attendance records
-    # For now, just return success
-    return {"message": "Attendance marked successfully"}
+    try:
+        record_date = date.fromisoformat(attendance_data.date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+
+    try:
+        marked = {int(student_id): AttendanceStatus(value) for student_id, value in attendance_data.attendance.items()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Attendance must map student ids to a valid status")
+    if not marked:
+        return {"message": "Attendance marked successfully", "count": 0}
+
+    sections = dict((await db.execute(select(Student.id, Student.section_id).where(Student.id.in_(marked)))).all())
+    unknown_ids = sorted(set(marked) - set(sections))
+    if unknown_ids:
+        raise HTTPException(status_code=404, detail=f"Unknown student ids: {unknown_ids}")
+    # Release the read connection before queueing behind other writers
+    await db.close()
+
+    await write_queue.submit(write_attendance, record_date, marked, sections, current_user.id)
+    return {"message": "Attendance marked successfully", "count": len(marked)}
 
 # Marks Entry
 @app.post("/api/marks")
-async def create_marks(marks_data: MarksCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_marks(marks_data: MarksCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """Enter a single mark; saved like a one-cell marks sheet"""
     if current_user.role not in [UserRole.TEACHER, UserRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Not authorized")
-    
-    # Calculate grade
-    percentage = (marks_data.obtained_marks / marks_data.max_marks) * 100
-    if percentage >= 90:
-        grade = "A+"
-    elif percentage >= 80:
-        grade = "A"
-    elif percentage >= 70:
-        grade = "B+"
-    elif percentage >= 60:
-        grade = "B"
-    elif percentage >= 50:
-        grade = "C"
-    else:
-        grade = "F"
-    
-    # Save marks (simplified - you'd need exam_id and subject_id from your schema)
-    return {"message": "Marks entered successfully", "grade": grade}
+
+    class_id = await db.scalar(select(Student.class_id).where(Student.id == marks_data.student_id))
+    if class_id is None:
+        raise HTTPException(status_code=404, detail="Student not found or not assigned to a class")
+    subject_id = await db.scalar(
+        select(Subject.id)
+        .where(Subject.class_id == class_id, or_(Subject.name == marks_data.subject, Subject.code == marks_data.subject))
+        .order_by(Subject.id).limit(1)
+    )
+    if subject_id is None:
+        raise HTTPException(status_code=404, detail=f"Subject '{marks_data.subject}' is not taught in the student's class")
+    exam_id = await db.scalar(select(Exam.id).where(Exam.name == marks_data.exam).order_by(Exam.id.desc()).limit(1))
+    if exam_id is None:
+        raise HTTPException(status_code=404, detail=f"Exam '{marks_data.exam}' not found")
+    await db.close()
+
+    grade = grade_scale.grade(marks_data.obtained_marks * 100 / marks_data.max_marks)
+    await write_queue.submit(write_marks_sheet, exam_id, class_id, [{
+        "exam_id": exam_id,
+        "subject_id": subject_id,
+        "student_id": marks_data.student_id,
+        "marks_obtained": marks_data.obtained_marks,
+        "max_marks": marks_data.max_marks,
+        "grade": grade,
+    }])
+    return {"message": "Marks saved successfully", "grade": grade}
+
+async def _sheet_section(db: AsyncSession, exam_id: int, section_id: int):
+    """Validate the exam and section of a sheet; returns (class_id, {student_id: name}, {subject_id: name})"""
+    if await db.get(Exam, exam_id) is None:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    section = await db.get(Section, section_id)
+    if section is None:
+        raise HTTPException(status_code=404, detail="Section not found")
+    students = dict((await db.execute(
+        select(Student.id, User.name).join(User, User.id == Student.user_id).where(Student.section_id == section_id)
+    )).all())
+    subjects = dict((await db.execute(
+        select(Subject.id, Subject.name).where(Subject.class_id == section.class_id)
+    )).all())
+    return section.class_id, students, subjects
+
+@app.post("/api/marks/sheet")
+async def save_marks_sheet(sheet: MarksSheetRequest, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """Save a whole exam sheet (every subject x student of one section) in one batch and return per-subject aggregates"""
+    if current_user.role not in [UserRole.TEACHER, UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    class_id, students, subjects = await _sheet_section(db, sheet.exam_id, sheet.section_id)
+    unknown_subjects = sorted(set(sheet.marks) - set(subjects))
+    if unknown_subjects:
+        raise HTTPException(status_code=404, detail=f"Subjects not taught in this section's class: {unknown_subjects}")
+    unknown_students = sorted({student_id for cells in sheet.marks.values() for student_id in cells} - set(students))
+    if unknown_students:
+        raise HTTPException(status_code=404, detail=f"Students not in this section: {unknown_students}")
+    await db.close()
+
+    rows = []
+    aggregates = {}
+    for subject_id, cells in sheet.marks.items():
+        percentages = [obtained * 100 / sheet.max_marks for obtained in cells.values()]
+        grades = grade_scale.grade_many(percentages)
+        rows.extend(
+            {
+                "exam_id": sheet.exam_id,
+                "subject_id": subject_id,
+                "student_id": student_id,
+                "marks_obtained": obtained,
+                "max_marks": sheet.max_marks,
+                "grade": grade,
+            }
+            for (student_id, obtained), grade in zip(cells.items(), grades)
+        )
+        aggregates[subject_id] = {"subject": subjects[subject_id], **sheet_aggregates(percentages, grades)}
+
+    if rows:
+        await write_queue.submit(write_marks_sheet, sheet.exam_id, class_id, rows)
+    return {"message": "Marks saved successfully", "count": len(rows), "subjects": aggregates}
+
+@app.get("/api/marks/sheet")
+async def get_marks_sheet(exam_id: int, section_id: int, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role not in [UserRole.TEACHER, UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    _, students, subjects = await _sheet_section(db, exam_id, section_id)
+    marks = (await db.execute(
+        select(Mark.subject_id, Mark.student_id, Mark.marks_obtained, Mark.max_marks, Mark.grade)
+        .join(Student, Student.id == Mark.student_id)
+        .where(Mark.exam_id == exam_id, Student.section_id == section_id)
+        .order_by(Mark.subject_id, Mark.student_id)
+    )).all()
+
+    sheets = {subject_id: [] for subject_id in subjects}
+    for mark in marks:
+        sheets.setdefault(mark.subject_id, []).append(mark)
+    result = []
+    for subject_id, cells in sheets.items():
+        percentages = [cell.marks_obtained * 100 / cell.max_marks for cell in cells]
+        result.append({
+            "subjectId": subject_id,
+            "subject": subjects.get(subject_id),
+            "marks": [
+                {"studentId": cell.student_id, "name": students.get(cell.student_id), "marksObtained": cell.marks_obtained,
+                 "maxMarks": cell.max_marks, "grade": cell.grade}
+                for cell in cells
+            ],
+            **sheet_aggregates(percentages, [cell.grade for cell in cells]),
+        })
+    return {"examId": exam_id, "sectionId": section_id, "subjects": result}
+
+# Report Cards
+async def visible_student(db: AsyncSession, student_id: int, user: Principal, staff_roles=(UserRole.TEACHER, UserRole.ADMIN)) -> Student:
+    """A student whose records user may open: staff_roles any, students their own, parents their children's"""
+    stmt = select(Student).where(Student.id == student_id)
+    if user.role == UserRole.STUDENT:
+        stmt = stmt.where(Student.user_id == user.id)
+    elif user.role == UserRole.PARENT:
+        stmt = (
+            stmt.join(StudentParent, StudentParent.student_id == Student.id)
+            .join(Parent, Parent.id == StudentParent.parent_id)
+            .where(Parent.user_id == user.id)
+        )
+    elif user.role not in staff_roles:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    student = await db.scalar(stmt)
+    if student is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return student
+
+@app.get("/api/report-cards")
+async def get_section_report_cards(exam_id: int, section_id: int, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role not in [UserRole.TEACHER, UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    section = await db.get(Section, section_id)
+    if section is None:
+        raise HTTPException(status_code=404, detail="Section not found")
+
+    cards = sorted(
+        await load_report_cards(db, exam_id, section.class_id, ReportCard.section_id == section_id),
+        key=lambda card: (card.section_rank, card.student_id),
+    )
+    names = dict((await db.execute(
+        select(Student.id, User.name).join(User, User.id == Student.user_id).where(Student.section_id == section_id)
+    )).all())
+    summaries = [{**report_card_summary(card), "name": names.get(card.student_id)} for card in cards]
+    return {
+        "examId": exam_id,
+        "sectionId": section_id,
+        "students": summaries,
+        "summary": sheet_aggregates([card.percentage for card in cards], [summary["grade"] for summary in summaries]),
+    }
+
+@app.get("/api/report-cards/{student_id}")
+async def get_report_card(student_id: int, exam_id: int, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    student = await visible_student(db, student_id, current_user)
+    if student.class_id is None:
+        raise HTTPException(status_code=404, detail="Student is not assigned to a class")
+    cards = await load_report_cards(db, exam_id, student.class_id, ReportCard.student_id == student_id)
+    if not cards:
+        raise HTTPException(status_code=404, detail="No marks recorded for this exam")
+
+    subjects = (await db.execute(
+        select(Subject.name, Mark.marks_obtained, Mark.max_marks, Mark.grade)
+        .join(Subject, Subject.id == Mark.subject_id)
+        .where(Mark.exam_id == exam_id, Mark.student_id == student_id)
+        .order_by(Subject.name)
+    )).all()
+    return {
+        "examId": exam_id,
+        **report_card_summary(cards[0]),
+        "marks": [
+            {"subject": name, "marksObtained": obtained, "maxMarks": max_marks, "grade": grade}
+            for name, obtained, max_marks, grade in subjects
+        ],
+    }
 
 # Fee Payment
 @app.post("/api/fees/{fee_id}/pay")
-async def record_payment(fee_id: int, payment_data: FeePaymentRequest, db: Session = Depends(get_db)):
-    # Record the payment
-    # Update the fee status
-    return {"message": "Payment recorded successfully"}
+async def record_payment(fee_id: int, payment_data: FeePaymentRequest, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role not in [UserRole.ACCOUNTANT, UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
 
-# Timetable
-@app.get("/api/timetable")
-def get_timetable(db: Session = Depends(get_db)):
-    # Return timetable data
+    fee = (await db.execute(
+        select(StudentFee.student_id, Student.class_id)
+        .join(Student, Student.id == StudentFee.student_id)
+        .where(StudentFee.id == fee_id)
+    )).one_or_none()
+    if fee is None:
+        raise HTTPException(status_code=404, detail="Fee not found")
+
+    transaction_id = payment_data.transaction_id or uuid.uuid4().hex
+    # A resubmitted payment is answered from the ledger without touching the write path
+    recorded = await db.scalar(select(FeePayment).where(FeePayment.transaction_id == transaction_id))
+    if recorded is None:
+        await db.close()
+        try:
+            result = await write_queue.submit(record_fee_payment, fee_id, fee.student_id, fee.class_id, {
+                "amount": payment_data.amount,
+                "payment_mode": payment_data.payment_mode,
+                "transaction_id": transaction_id,
+                "recorded_by": current_user.id,
+            })
+        except PaymentExceedsBalance:
+            raise HTTPException(status_code=400, detail="Payment exceeds the outstanding amount")
+        if result is not None:
+            amount_paid, fee_state = result
+            return {
+                "message": "Payment recorded successfully",
+                "transactionId": transaction_id,
+                "amountPaid": amount_paid,
+                "status": fee_state,
+            }
+        # Lost the race against an identical submission
+        recorded = await db.scalar(select(FeePayment).where(FeePayment.transaction_id == transaction_id))
+
+    if recorded.student_fee_id != fee_id or recorded.amount != payment_data.amount:
+        raise HTTPException(status_code=409, detail="Transaction id already used for a different payment")
+    amount_paid, fee_state = (await db.execute(
+        select(StudentFee.amount_paid, StudentFee.status).where(StudentFee.id == fee_id)
+    )).one()
+    return {
+        "message": "Payment already recorded",
+        "transactionId": transaction_id,
+        "amountPaid": amount_paid,
+        "status": fee_state,
+    }
+
+@app.get("/api/fees/balances")
+async def get_fee_balances(db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """Outstanding fees per class from the maintained balances, without summing student_fees"""
+    if current_user.role not in [UserRole.ACCOUNTANT, UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    rows = (await db.execute(
+        select(ClassFeeBalance.class_id, Class.name, ClassFeeBalance.total_due, ClassFeeBalance.total_paid)
+        .join(Class, Class.id == ClassFeeBalance.class_id)
+        .order_by(Class.name)
+    )).all()
+    return {
+        **fee_balance(sum(row.total_due for row in rows), sum(row.total_paid for row in rows)),
+        "classes": [
+            {"classId": row.class_id, "class": row.name, **fee_balance(row.total_due, row.total_paid)}
+            for row in rows
+        ],
+    }
+
+@app.get("/api/fees/students/{student_id}")
+async def get_student_fees(student_id: int, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    await visible_student(db, student_id, current_user, staff_roles=[UserRole.ACCOUNTANT, UserRole.ADMIN])
+    fees = (await db.execute(
+        select(StudentFee, FeeHead.name)
+        .join(FeeHead, FeeHead.id == StudentFee.fee_head_id)
+        .where(StudentFee.student_id == student_id)
+        .order_by(StudentFee.due_date, StudentFee.id)
+    )).all()
+    balance = await db.get(StudentFeeBalance, student_id) or StudentFeeBalance(total_due=0.0, total_paid=0.0)
     return {
-        "timetable": [
+        "studentId": student_id,
+        **fee_balance(balance.total_due, balance.total_paid),
+        "fees": [
             {
-                "period": "1",
-                "time": "08:00-09:00",
-                "monday": "Math",
-                "tuesday": "Physics",
-                "wednesday": "Chemistry",
-                "thursday": "English",
-                "friday": "Math",
-                "saturday": "Computer"
+                "id": fee.id,
+                "head": head,
+                "amount": fee.amount_due,
+                "paid": fee.amount_paid or 0.0,
+                "status": fee.status,
+                "dueDate": fee.due_date,
             }
-        ]
+            for fee, head in fees
+        ],
     }
 
+# Timetable
+@app.get("/api/timetable")
+async def get_timetable(
+    section_id: Optional[int] = None,
+    teacher_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    Week grid of a section or teacher. Without parameters: a teacher's own teaching timetable,
+    a student's (or a parent's first child's) section, and the first section for everyone else;
+    an empty grid when there is no such section.
+    """
+    if section_id is None and teacher_id is None:
+        if current_user.role == UserRole.TEACHER:
+            teacher_id = current_user.id
+        else:
+            if current_user.role == UserRole.STUDENT:
+                default_section = select(Student.section_id).where(Student.user_id == current_user.id)
+            elif current_user.role == UserRole.PARENT:
+                default_section = (
+                    select(Student.section_id)
+                    .join(StudentParent, StudentParent.student_id == Student.id)
+                    .join(Parent, Parent.id == StudentParent.parent_id)
+                    .where(Parent.user_id == current_user.id, Student.section_id.is_not(None))
+                    .order_by(Student.id).limit(1)
+                )
+            else:
+                default_section = select(Section.id).order_by(Section.id).limit(1)
+            section_id = await db.scalar(default_section)
+            if section_id is None:
+                return {"sectionId": None, "timetable": []}
+
+    timetable = await current_timetable(db)
+    if section_id is not None:
+        return {"sectionId": section_id, "timetable": timetable.grid("section", section_id)}
+    return {"teacherId": teacher_id, "timetable": timetable.grid("teacher", teacher_id)}
+
+async def _write_timetable(db: AsyncSession, entry_id: Optional[int], timetable_data: Optional[TimetableCreate]):
+    values = None
+    if timetable_data is not None:
+        values = timetable_data.model_dump()
+        # Cheap rejections first: the in-memory slot indexes answer clashes without a write
+        clashes = (await current_timetable(db)).clashes(
+            values["section_id"], values["teacher_id"], values["day"], values["period"], entry_id
+        )
+        if clashes:
+            raise HTTPException(status_code=409, detail=clash_detail(clashes, values["day"], values["period"]))
+        class_id = await db.scalar(select(Section.class_id).where(Section.id == values["section_id"]))
+        if class_id is None:
+            raise HTTPException(status_code=404, detail="Section not found")
+        if await db.scalar(select(Subject.id).where(Subject.id == values["subject_id"], Subject.class_id == class_id)) is None:
+            raise HTTPException(status_code=404, detail="Subject not taught in this section's class")
+        if await db.scalar(select(User.id).where(User.id == values["teacher_id"], User.role == UserRole.TEACHER)) is None:
+            raise HTTPException(status_code=404, detail="Teacher not found")
+    await db.close()
+
+    try:
+        revision, removed_id, entry = await write_queue.submit(save_timetable_entry, entry_id, values)
+    except TimetableEntryNotFound:
+        raise HTTPException(status_code=404, detail="Timetable entry not found")
+    except TimetableSlotTaken as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    timetable_index.apply(revision, removed_id, entry)
+    return entry
+
 @app.post("/api/timetable")
-async def create_timetable_entry(timetable_data: TimetableCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_timetable_entry(timetable_data: TimetableCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
         raise HTTPException(status_code=403, detail="Not authorized")
-    
-    # Save timetable entry
-    return {"message": "Timetable entry created successfully"}
+    entry = await _write_timetable(db, None, timetable_data)
+    return {"message": "Timetable entry created successfully", "id": entry["id"]}
+
+@app.put("/api/timetable/{entry_id}")
+async def update_timetable_entry(entry_id: int, timetable_data: TimetableCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    await _write_timetable(db, entry_id, timetable_data)
+    return {"message": "Timetable entry updated successfully", "id": entry_id}
+
+@app.delete("/api/timetable/{entry_id}")
+async def delete_timetable_entry(entry_id: int, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role not in [UserRole.ADMIN, UserRole.TEACHER]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    await _write_timetable(db, entry_id, None)
+    return {"message": "Timetable entry deleted successfully"}
+
+# Homework
+@app.get("/api/homework")
+async def get_homework(db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """Teachers see what they set with its counters, students what is assigned to them with their own status"""
+    query = (
+        select(Homework, Subject.name.label("subject"))
+        .join(Subject, Subject.id == Homework.subject_id)
+        .order_by(Homework.due_date.desc(), Homework.id.desc())
+    )
+    if current_user.role == UserRole.STUDENT:
+        student = (await db.execute(
+            select(Student.id, Student.class_id, Student.section_id).where(Student.user_id == current_user.id)
+        )).one_or_none()
+        if student is None:
+            return {"homework": []}
+        query = (
+            query.add_columns(HomeworkSubmission.status.label("submission_status"))
+            .outerjoin(
+                HomeworkSubmission,
+                (HomeworkSubmission.homework_id == Homework.id) & (HomeworkSubmission.student_id == student.id),
+            )
+            .where(Homework.class_id == student.class_id, (Homework.section_id == None) | (Homework.section_id == student.section_id))  # noqa: E711
+        )
+    elif current_user.role == UserRole.TEACHER:
+        query = query.where(Homework.teacher_id == current_user.id)
+    elif current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    homework_list = []
+    for row in await db.execute(query):
+        homework = row.Homework
+        item = {
+            "id": homework.id,
+            "title": homework.title,
+            "subject": row.subject,
+            "description": homework.description,
+            "dueDate": homework.due_date,
+            "classId": homework.class_id,
+            "sectionId": homework.section_id,
+        }
+        if current_user.role == UserRole.STUDENT:
+            item["status"] = (row.submission_status or HomeworkStatus.PENDING).value
+        else:
+            item.update(submissions=homework.submission_count, graded=homework.graded_count)
+        homework_list.append(item)
+    return {"homework": homework_list}
+
+@app.post("/api/homework")
+async def create_homework(homework_data: HomeworkCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role not in [UserRole.TEACHER, UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if await db.scalar(select(Subject.id).where(Subject.id == homework_data.subject_id, Subject.class_id == homework_data.class_id)) is None:
+        raise HTTPException(status_code=404, detail="Subject not taught in this class")
+    if homework_data.section_id is not None and await db.scalar(
+        select(Section.id).where(Section.id == homework_data.section_id, Section.class_id == homework_data.class_id)
+    ) is None:
+        raise HTTPException(status_code=404, detail="Section not found in this class")
+    await db.close()
+
+    homework_id = await write_queue.submit(assign_homework, {**homework_data.model_dump(), "teacher_id": current_user.id})
+    return {"message": "Homework created successfully", "id": homework_id}
+
+@app.post("/api/homework/submissions/{submission_id}/grade")
+async def grade_submission(submission_id: int, grade_data: HomeworkGrade, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role not in [UserRole.TEACHER, UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    homework = (await db.execute(
+        select(Homework.id, Homework.teacher_id)
+        .join(HomeworkSubmission, HomeworkSubmission.homework_id == Homework.id)
+        .where(HomeworkSubmission.id == submission_id)
+    )).one_or_none()
+    if homework is None:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    if current_user.role == UserRole.TEACHER and homework.teacher_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Only the teacher who set this homework can grade it")
+    await db.close()
+
+    await write_queue.submit(grade_homework_submission, submission_id, homework.id, homework.teacher_id, grade_data.model_dump())
+    return {"message": "Submission graded successfully"}
 
 # Homework Submission
 @app.post("/api/homework/{homework_id}/submit")
-async def submit_homework(homework_id: int, submission_data: dict, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def submit_homework(homework_id: int, request: Request, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """multipart/form-data with text_answer and/or file; the file streams to the upload store as it arrives"""
     if current_user.role != UserRole.STUDENT:
         raise HTTPException(status_code=403, detail="Only students can submit homework")
-    
-    # Save homework submission
-    return {"message": "Homework submitted successfully"}
+
+    homework = await db.get(Homework, homework_id)
+    if homework is None:
+        raise HTTPException(status_code=404, detail="Homework not found")
+    student = (await db.execute(
+        select(Student.id, Student.class_id, Student.section_id).where(Student.user_id == current_user.id)
+    )).one_or_none()
+    if student is None or student.class_id != homework.class_id or homework.section_id not in (None, student.section_id):
+        raise HTTPException(status_code=403, detail="This homework is not assigned to you")
+    previous_status = await db.scalar(
+        select(HomeworkSubmission.status)
+        .where(HomeworkSubmission.homework_id == homework_id, HomeworkSubmission.student_id == student.id)
+    )
+    if previous_status == HomeworkStatus.GRADED:
+        raise HTTPException(status_code=409, detail="This homework has already been graded")
+    # Uploads can take a while; do not hold a pooled connection meanwhile
+    await db.close()
+
+    try:
+        fields, files = await receive_multipart(
+            request, upload_store, settings.MAX_UPLOAD_MB * 1024 * 1024, allowed_types=UPLOAD_ALLOWED_TYPES
+        )
+    except UploadError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+    upload = files.get("file")
+    text_answer = fields.get("text_answer", "").strip()
+    if upload is None and not text_answer:
+        raise HTTPException(status_code=422, detail="Submit a file or a text answer")
+
+    values = {
+        "text_answer": text_answer or None,
+        "submitted_at": datetime.utcnow(),
+        "status": HomeworkStatus.SUBMITTED,
+    }
+    if upload is not None:
+        values.update(
+            file_url=f"/api/files/{upload.digest}",
+            file_sha256=upload.digest,
+            file_name=upload.filename,
+            file_size=upload.size,
+            content_type=upload.content_type,
+        )
+    try:
+        submission_id, file_url, created = await write_queue.submit(
+            save_homework_submission,
+            {"id": homework.id, "teacher_id": homework.teacher_id, "due_date": homework.due_date},
+            student.id,
+            values,
+        )
+    except SubmissionAlreadyGraded:
+        raise HTTPException(status_code=409, detail="This homework has already been graded")
+    return {
+        "message": "Homework submitted successfully" if created else "Homework resubmitted successfully",
+        "id": submission_id,
+        "fileUrl": file_url,
+    }
+
+@app.get("/api/files/{digest}")
+async def download_file(digest: str, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """
+    A submitted file, visible to its student, their parents, the homework's teacher and admins.
+    FileResponse answers Range requests and hands the path to servers that support the
+    ASGI pathsend extension, which send it with sendfile() instead of through Python.
+    """
+    if len(digest) != 64 or any(char not in "0123456789abcdef" for char in digest):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    stmt = (
+        select(HomeworkSubmission.file_name, HomeworkSubmission.content_type)
+        .join(Homework, Homework.id == HomeworkSubmission.homework_id)
+        .join(Student, Student.id == HomeworkSubmission.student_id)
+        .where(HomeworkSubmission.file_sha256 == digest)
+    )
+    if current_user.role == UserRole.STUDENT:
+        stmt = stmt.where(Student.user_id == current_user.id)
+    elif current_user.role == UserRole.TEACHER:
+        stmt = stmt.where(Homework.teacher_id == current_user.id)
+    elif current_user.role == UserRole.PARENT:
+        stmt = (
+            stmt.join(StudentParent, StudentParent.student_id == Student.id)
+            .join(Parent, Parent.id == StudentParent.parent_id)
+            .where(Parent.user_id == current_user.id)
+        )
+    elif current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    stored = (await db.execute(stmt.limit(1))).one_or_none()
+    if stored is None or not upload_store.exists(digest):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return FileResponse(
+        upload_store.path(digest),
+        media_type=stored.content_type or "application/octet-stream",
+        filename=stored.file_name or digest,
+        # Content never changes under a hash name
+        headers={"Cache-Control": "private, max-age=31536000, immutable"},
+    )
 
 # WebSocket Connection Manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-    
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-    
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
+manager = ConnectionManager(
+    broker=create_broker(settings.WS_BROKER, settings.WS_BROKER_PATH),
+    max_queue=settings.WS_MAX_QUEUE,
+    send_timeout=settings.WS_SEND_TIMEOUT,
+)
 
-manager = ConnectionManager()
+ANNOUNCEMENT_ROLE_TARGETS = {
+    "teachers": [UserRole.TEACHER],
+    "students": [UserRole.STUDENT],
+    "parents": [UserRole.PARENT],
+}
+ADMIN_ROLES = [UserRole.ADMIN, UserRole.SUPER_ADMIN]
+
+LIKE_ESCAPE = "/"
+
+def like_literal(column):
+    """A column used inside a LIKE pattern, with its % and _ matching only themselves (pair with escape=LIKE_ESCAPE)"""
+    for char in (LIKE_ESCAPE, "%", "_"):
+        column = func.replace(column, char, LIKE_ESCAPE + char)
+    return column
+
+def teacher_sections():
+    """(teacher_id, class_id, section_id) for every section a teacher is timetabled in or lists on their profile"""
+    timetabled = (
+        select(TimetableEntry.teacher_id, Section.class_id, Section.id.label("section_id"))
+        .join(Section, Section.id == TimetableEntry.section_id)
+    )
+    # TeacherProfile.classes holds labels like "10-A,10-B", the same "<class>-<section>" the timetable shows
+    label = "," + like_literal(Class.name) + "-" + like_literal(Section.name) + ","
+    listed = (
+        select(TeacherProfile.user_id, Section.class_id, Section.id)
+        .join(Class, Class.id == Section.class_id)
+        .join(TeacherProfile, ("," + func.replace(TeacherProfile.classes, " ", "") + ",").contains(label, escape=LIKE_ESCAPE))
+    )
+    return union(timetabled, listed).subquery()
+
+async def websocket_channels(db: AsyncSession, user: Principal) -> dict:
+    """
+    Channels a user's socket is indexed under: students get their own class/section, parents their
+    children's, teachers the sections they are assigned to and admins every class and section
+    """
+    if user.role in ADMIN_ROLES:
+        return {"user_id": user.id, "role": user.role.value, "class_ids": {EVERY_CHANNEL}, "section_ids": {EVERY_CHANNEL}}
+    if user.role == UserRole.STUDENT:
+        rows = (await db.execute(select(Student.class_id, Student.section_id).where(Student.user_id == user.id))).all()
+    elif user.role == UserRole.PARENT:
+        rows = (await db.execute(
+            select(Student.class_id, Student.section_id)
+            .join(StudentParent, StudentParent.student_id == Student.id)
+            .join(Parent, Parent.id == StudentParent.parent_id)
+            .where(Parent.user_id == user.id)
+        )).all()
+    elif user.role == UserRole.TEACHER:
+        assigned = teacher_sections()
+        rows = (await db.execute(
+            select(assigned.c.class_id, assigned.c.section_id).where(assigned.c.teacher_id == user.id)
+        )).all()
+    else:
+        rows = []
+    return {
+        "user_id": user.id,
+        "role": user.role.value,
+        "class_ids": {class_id for class_id, _ in rows if class_id is not None},
+        "section_ids": {section_id for _, section_id in rows if section_id is not None},
+    }
+
+def announcement_audience(target_type: Optional[str], target_id: Optional[int]) -> Optional[dict]:
+    """publish() channels for an announcement target, None when it goes to everyone"""
+    if target_type in ANNOUNCEMENT_ROLE_TARGETS:
+        return {"roles": [role.value for role in ANNOUNCEMENT_ROLE_TARGETS[target_type]]}
+    if target_id is not None:
+        if target_type == "class":
+            return {"class_ids": [target_id]}
+        if target_type == "section":
+            return {"section_ids": [target_id]}
+        if target_type == "user":
+            return {"user_ids": [target_id]}
+    return None
+
+def audience_users(audience: Optional[dict]):
+    """
+    SELECT of the user ids behind publish() channels, matching who ConnectionManager pushes to:
+    class and section channels reach their students, the students' parents, the teachers assigned
+    there and admins
+    """
+    if audience is None:
+        return select(User.id)
+    conditions = []
+    if audience.get("user_ids"):
+        conditions.append(User.id.in_(audience["user_ids"]))
+    if audience.get("roles"):
+        conditions.append(User.role.in_([UserRole(role) for role in audience["roles"]]))
+    students = []
+    if audience.get("class_ids"):
+        students.append(Student.class_id.in_(audience["class_ids"]))
+    if audience.get("section_ids"):
+        students.append(Student.section_id.in_(audience["section_ids"]))
+    if students:
+        conditions.append(User.id.in_(select(Student.user_id).where(or_(*students))))
+        conditions.append(User.id.in_(
+            select(Parent.user_id)
+            .join(StudentParent, StudentParent.parent_id == Parent.id)
+            .join(Student, Student.id == StudentParent.student_id)
+            .where(or_(*students))
+        ))
+        assigned = teacher_sections()
+        sections = []
+        if audience.get("class_ids"):
+            sections.append(assigned.c.class_id.in_(audience["class_ids"]))
+        if audience.get("section_ids"):
+            sections.append(assigned.c.section_id.in_(audience["section_ids"]))
+        conditions.append(User.id.in_(select(assigned.c.teacher_id).where(or_(*sections))))
+        conditions.append(User.role.in_(ADMIN_ROLES))
+    return select(User.id).where(or_(*conditions) if conditions else literal(False))
+
+def fan_out_notification(db: Session, audience: Optional[dict], kind: str, reference_id: Optional[int],
+                         message: str, created_at: datetime) -> int:
+    """Write one inbox row per recipient with a single INSERT ... SELECT; the rows never pass through Python"""
+    recipients = audience_users(audience).subquery()
+    result = db.execute(
+        insert(Notification).from_select(
+            ["user_id", "type", "reference_id", "message", "is_read", "created_at"],
+            select(recipients.c.id, literal(kind), literal(reference_id, Integer), literal(message),
+                   literal(False), literal(created_at)),
+        )
+    )
+    counters = dialect_insert(db, NotificationCounter)
+    db.execute(
+        counters.from_select(
+            ["user_id", "unread"],
+            # SQLite needs a WHERE on the SELECT to parse the ON CONFLICT that follows
+            select(recipients.c.id, literal(1)).where(recipients.c.id != None),  # noqa: E711
+        ).on_conflict_do_update(
+            index_elements=[NotificationCounter.user_id],
+            set_={"unread": NotificationCounter.unread + 1},
+        )
+    )
+    return result.rowcount
+
+def mark_notifications_read(db: Session, user_id: int, notification_id: Optional[int] = None) -> int:
+    """Mark one notification (or all of them) read and return the user's new unread count"""
+    query = update(Notification).where(Notification.user_id == user_id, Notification.is_read == False)  # noqa: E712
+    if notification_id is not None:
+        query = query.where(Notification.id == notification_id)
+    changed = db.execute(query.values(is_read=True)).rowcount
+    return db.scalar(
+        update(NotificationCounter)
+        .where(NotificationCounter.user_id == user_id)
+        .values(unread=0 if notification_id is None else case((NotificationCounter.unread > changed, NotificationCounter.unread - changed), else_=0))
+        .returning(NotificationCounter.unread)
+    ) or 0
+
+def rebuild_notification_counters(db: Session):
+    """Recompute the unread counters from notifications, for backfills and seeding"""
+    db.query(NotificationCounter).delete()
+    db.execute(
+        NotificationCounter.__table__.insert().from_select(
+            ["user_id", "unread"],
+            select(Notification.user_id, func.count())
+            .where(Notification.is_read == False)  # noqa: E712
+            .group_by(Notification.user_id),
+        )
+    )
+
+async def push_unread_count(user_id: int, unread: int):
+    await manager.publish({"type": "unread", "unread": unread}, user_ids=[user_id])
+
+NOTIFICATION_STORE_ATTEMPTS = 4
+notification_state = {"stored": 0, "storeRetries": 0, "storeFailures": 0}
+
+async def deliver_notification(audience: Optional[dict], kind: str, reference_id: Optional[int], message: str):
+    """
+    Background task behind every user-facing event: store it in the recipients' inboxes so offline
+    users see it in /api/notifications, then push it to the sockets that are connected right now.
+    The push carries no inbox id (each recipient's row has its own); clients refetch their inbox on it.
+    A failed store is retried with backoff; a final failure is logged and counted in /api/metrics.
+    """
+    created_at = datetime.utcnow()
+    for attempt in range(NOTIFICATION_STORE_ATTEMPTS):
+        try:
+            await write_queue.submit(fan_out_notification, audience, kind, reference_id, message, created_at)
+            notification_state["stored"] += 1
+            break
+        except Exception:
+            if attempt + 1 == NOTIFICATION_STORE_ATTEMPTS:
+                notification_state["storeFailures"] += 1
+                logger.exception("Could not store %s notification for %s after %d attempts",
+                                 kind, audience or "everyone", NOTIFICATION_STORE_ATTEMPTS)
+            else:
+                notification_state["storeRetries"] += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    event = {
+        "type": "notification",
+        "notification": {"referenceId": reference_id, "message": message, "type": kind, "time": "Just now", "read": False},
+    }
+    if audience is None:
+        await manager.broadcast(event)
+    else:
+        await manager.publish(event, **audience)
+
+# =====================
+# RETENTION & MAINTENANCE
+# =====================
+
+maintenance_state = {"running": False, "lastRun": None}
+maintenance_task: Optional[asyncio.Task] = None
+# A run that outlives this (a worker died mid-run) no longer blocks the next one
+MAINTENANCE_LEASE = timedelta(hours=1)
+
+class MaintenanceRunning(Exception):
+    """Raised when another worker (or an earlier request) holds the maintenance lease"""
+
+def claim_maintenance(db: Session, now: datetime, due_before: Optional[datetime] = None) -> bool:
+    """
+    Take the lease unless it is held; with due_before (the schedule), also only when the last run
+    started before it, so one of the workers' loops runs per interval. One conditional upsert
+    decides, so two workers cannot both win.
+    """
+    free = or_(MaintenanceLease.locked_until == None, MaintenanceLease.locked_until < now)  # noqa: E711
+    if due_before is not None:
+        free = free & or_(MaintenanceLease.last_run == None, MaintenanceLease.last_run < due_before)  # noqa: E711
+    claimed = db.scalar(
+        dialect_insert(db, MaintenanceLease)
+        .values(id=1, locked_until=now + MAINTENANCE_LEASE, last_run=now)
+        .on_conflict_do_update(
+            index_elements=[MaintenanceLease.id],
+            set_={"locked_until": now + MAINTENANCE_LEASE, "last_run": now},
+            where=free,
+        )
+        .returning(MaintenanceLease.id)
+    )
+    return claimed is not None
+
+def release_maintenance(db: Session):
+    db.execute(update(MaintenanceLease).where(MaintenanceLease.id == 1).values(locked_until=None))
+
+def archive_notifications_batch(db: Session, cutoff: datetime, batch_size: int, archived_at: datetime) -> int:
+    """Move up to batch_size read notifications created before cutoff into the archive; returns how many moved"""
+    ids = db.scalars(
+        select(Notification.id)
+        .where(Notification.is_read == True, Notification.created_at < cutoff)  # noqa: E712
+        .order_by(Notification.id)
+        .limit(batch_size)
+    ).all()
+    if not ids:
+        return 0
+    db.execute(
+        insert(NotificationArchive).from_select(
+            ["notification_id", "user_id", "type", "reference_id", "message", "created_at", "archived_at"],
+            select(Notification.id, Notification.user_id, Notification.type, Notification.reference_id,
+                   Notification.message, Notification.created_at, literal(archived_at))
+            .where(Notification.id.in_(ids)),
+        )
+    )
+    db.execute(delete(Notification).where(Notification.id.in_(ids)))
+    return len(ids)
+
+def compact_database(vacuum_pages: int) -> dict:
+    """
+    Refresh planner statistics for the pruned table and, on SQLite, hand free pages back to the
+    filesystem. Uses a connection of its own, so it goes through write_queue.submit_exclusive.
+    """
+    with engine.connect() as connection:
+        if connection.dialect.name != "sqlite":
+            connection.execute(text("ANALYZE notifications"))
+            connection.commit()
+            return {"pagesFreed": 0}
+        free_before = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            # Not INCREMENTAL: free pages are reused by later inserts but the file does not shrink
+            connection.exec_driver_sql("ANALYZE notifications")
+            connection.commit()
+            return {"pagesFreed": 0, "freePages": free_before}
+        connection.rollback()
+        # incremental_vacuum frees one page per step and the DB-API only steps once; executescript runs it to the end
+        connection.connection.driver_connection.executescript(
+            f"ANALYZE notifications; PRAGMA incremental_vacuum({int(vacuum_pages)});"
+        )
+        free_after = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+        return {"pagesFreed": free_before - free_after, "freePages": free_after}
+
+def sweep_uploads(older_than: float, batch_size: int) -> dict:
+    """
+    Delete stored files that no submission references: rejected or replaced uploads and extra
+    file parts. Only files untouched since older_than go, which leaves uploads whose submission
+    is still being written alone; a file stored again meanwhile is skipped by delete().
+    """
+    removed = 0
+    digests = upload_store.stale_digests(older_than)
+    with SessionLocal() as db:
+        while True:
+            batch = list(itertools.islice(digests, batch_size))
+            if not batch:
+                break
+            referenced = set(db.scalars(
+                select(HomeworkSubmission.file_sha256).where(HomeworkSubmission.file_sha256.in_(batch))
+            ))
+            removed += sum(upload_store.delete(digest, older_than) for digest in batch if digest not in referenced)
+    return {"uploadsRemoved": removed, "partialUploadsRemoved": upload_store.purge_partial(older_than)}
+
+async def run_maintenance(due_before: Optional[datetime] = None) -> Optional[dict]:
+    """
+    Archive read notifications past NOTIFICATION_RETENTION_DAYS, then compact and sweep unreferenced
+    uploads. Each batch is its own write-queue job, so other writes get the lock between batches
+    instead of waiting for the whole run; compaction needs its own connection and runs as an
+    exclusive queue job. Raises MaintenanceRunning if another run holds the lease; a scheduled
+    run (due_before given) that is not due returns None instead.
+    """
+    now = datetime.utcnow()
+    if not await write_queue.submit(claim_maintenance, now, due_before):
+        if due_before is not None:
+            return None
+        raise MaintenanceRunning()
+    maintenance_state["running"] = True
+    try:
+        started = time.perf_counter()
+        cutoff = now - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+        archived = batches = 0
+        while True:
+            moved = await write_queue.submit(archive_notifications_batch, cutoff, settings.MAINTENANCE_BATCH_SIZE, now)
+            archived += moved
+            batches += 1
+            if moved < settings.MAINTENANCE_BATCH_SIZE:
+                break
+        archive_seconds = time.perf_counter() - started
+        compaction = await write_queue.submit_exclusive(compact_database, settings.MAINTENANCE_VACUUM_PAGES)
+        uploads = await run_in_threadpool(
+            sweep_uploads, time.time() - settings.UPLOAD_ORPHAN_HOURS * 3600, settings.MAINTENANCE_BATCH_SIZE
+        )
+        report = {
+            "startedAt": now,
+            "cutoff": cutoff,
+            "notificationsArchived": archived,
+            "batches": batches,
+            "archiveSeconds": round(archive_seconds, 3),
+            "compactSeconds": round(time.perf_counter() - started - archive_seconds, 3),
+            **compaction,
+            **uploads,
+        }
+    finally:
+        maintenance_state["running"] = False
+        await write_queue.submit(release_maintenance)
+    maintenance_state["lastRun"] = report
+    logger.info("Maintenance: %s", report)
+    return report
+
+async def maintenance_loop(interval: float):
+    """Every worker runs this loop; the lease lets only the first one due per interval do the work"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_maintenance(due_before=datetime.utcnow() - timedelta(seconds=interval / 2))
+        except Exception:
+            logger.exception("Scheduled maintenance failed")
 
 # =====================
 # SEED DATA
@@ -676,28 +2648,88 @@ def init_db():
         db.commit()
         
         print("✅ Database initialized with seed data")
+    if not db.query(StudentAttendanceSummary).first() and db.query(AttendanceRecord).first():
+        rebuild_attendance_rollups(db)
+        db.commit()
+    if not db.query(StudentFeeBalance).first() and db.query(StudentFee).first():
+        rebuild_fee_balances(db)
+        db.commit()
+    if not db.query(TeacherHomeworkSummary).first() and db.query(Homework).first():
+        rebuild_homework_counters(db)
+        db.commit()
+    if not db.query(NotificationCounter).first() and db.query(Notification).first():
+        rebuild_notification_counters(db)
+        db.commit()
     db.close()
 
 @app.on_event("startup")
 async def startup_event():
-    init_db()
+    global maintenance_task
+    prepare_database()
+    # Every worker runs this; the lock keeps two of them from inserting the seed users at once
+    with engine.connect() as connection, migration_lock(connection):
+        init_db()
+    await manager.start()
+    if settings.MAINTENANCE_INTERVAL_MINUTES > 0:
+        maintenance_task = asyncio.create_task(maintenance_loop(settings.MAINTENANCE_INTERVAL_MINUTES * 60))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    await manager.stop()
+    await write_queue.stop()
+    password_hasher.shutdown()
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
 
 # =====================
 # API ENDPOINTS
 # =====================
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "School Management System API", "version": "2.0.0"}
 
+@app.get("/api/metrics")
+async def get_metrics(current_user: Principal = Depends(get_current_user)):
+    """Internal queue, pool and maintenance counters; they reveal load and schema details, so admins only"""
+    if current_user.role not in ADMIN_ROLES:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {
+        "passwordHashing": password_hasher.metrics(),
+        "writeQueue": write_queue.metrics(),
+        "databasePool": pool_metrics(async_engine.sync_engine),
+        "maintenance": maintenance_state,
+        "notifications": notification_state,
+    }
+
+@app.post("/api/admin/maintenance")
+async def trigger_maintenance(current_user: Principal = Depends(get_current_user)):
+    """Run the retention and compaction job now instead of waiting for the schedule"""
+    if current_user.role not in ADMIN_ROLES:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    try:
+        return await run_maintenance()
+    except MaintenanceRunning:
+        raise HTTPException(status_code=409, detail="Maintenance is already running")
+
 # Authentication
 @app.post("/api/auth/login")
-async def login(body: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == body.email).first()
-    if not user or not verify_password(body.password, user.password_hash):
+async def login(body: LoginRequest, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.email == body.email))
+    # Hand the connection back to the pool while the hash check waits for a worker
+    await db.close()
+    if not user or not await password_hasher.verify(body.password, user.password_hash):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
 
-    token = create_access_token({"sub": user.email})
+    token = create_access_token({"sub": user.email, "uid": user.id, "role": user.role.value})
     return {
         "access_token": token,
         "token_type": "bearer",
@@ -712,27 +2744,66 @@ async def login(body: LoginRequest, db: Session = Depends(get_db)):
 
 # Dashboard
 @app.get("/api/dashboard/{role}")
-def get_dashboard(role: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_dashboard(role: str, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     stats = {}
     if role == "admin":
+        today_totals = (await db.execute(
+            select(
+                func.coalesce(func.sum(SectionAttendanceDaily.total_days), 0),
+                func.coalesce(func.sum(SectionAttendanceDaily.present_days), 0),
+                func.coalesce(func.sum(SectionAttendanceDaily.half_days), 0),
+            ).where(SectionAttendanceDaily.date == date.today())
+        )).one()
         stats = {
-            "totalStudents": db.query(Student).count(),
-            "totalTeachers": db.query(User).filter(User.role == UserRole.TEACHER).count(),
-            "totalClasses": db.query(Class).count(),
-            "attendanceToday": 94.5
+            "totalStudents": await db.scalar(select(func.count()).select_from(Student)),
+            "totalTeachers": await db.scalar(select(func.count()).select_from(User).where(User.role == UserRole.TEACHER)),
+            "totalClasses": await db.scalar(select(func.count()).select_from(Class)),
+            "attendanceToday": attendance_percentage(*today_totals)
         }
     elif role == "teacher":
+        homework = await db.get(TeacherHomeworkSummary, current_user.id) or TeacherHomeworkSummary(homework=0, submissions=0, graded=0)
         stats = {
             "classesAssigned": 4,
-            "homeworkPending": db.query(Homework).filter(Homework.teacher_id == current_user.id).count(),
+            "homeworkAssigned": homework.homework,
+            "homeworkPending": homework.submissions - homework.graded,  # submissions waiting to be graded
             "studentsTotal": 156
         }
     elif role == "student":
+        pending = (
+            # Clamped per due date: a counter that drifted below zero must not hide other pending work
+            select(func.coalesce(func.sum(case(
+                (StudentHomeworkDue.assigned > StudentHomeworkDue.submitted, StudentHomeworkDue.assigned - StudentHomeworkDue.submitted),
+                else_=0,
+            )), 0))
+            .where(StudentHomeworkDue.student_id == Student.id, StudentHomeworkDue.due_date >= date.today())
+            .scalar_subquery()
+        )
+        summary = (await db.execute(
+            select(
+                StudentAttendanceSummary.total_days,
+                StudentAttendanceSummary.present_days,
+                StudentAttendanceSummary.half_days,
+                pending,
+            )
+            .select_from(Student)
+            .outerjoin(StudentAttendanceSummary, StudentAttendanceSummary.student_id == Student.id)
+            .where(Student.user_id == current_user.id)
+        )).one_or_none()
         stats = {
-            "attendanceRate": 96.5,
-            "pendingHomework": 3,
+            "attendanceRate": attendance_percentage(*summary[:3]) if summary else 0.0,
+            "pendingHomework": summary[3] if summary else 0,
             "upcomingExams": 2
         }
+    elif role == "accountant":
+        total_due, total_paid = (await db.execute(
+            select(func.coalesce(func.sum(ClassFeeBalance.total_due), 0.0), func.coalesce(func.sum(ClassFeeBalance.total_paid), 0.0))
+        )).one()
+        stats = {
+            **fee_balance(total_due, total_paid),
+            "studentsWithDues": await db.scalar(
+                select(func.count()).select_from(StudentFeeBalance).where(StudentFeeBalance.total_paid < StudentFeeBalance.total_due)
+            ),
+        }
     
     return {
         "stats": stats,
@@ -747,64 +2818,115 @@ def get_dashboard(role: str, db: Session = Depends(get_db), current_user: User =
 
 # Students
 @app.get("/api/students")
-def get_students(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    students = db.query(Student).join(User).all()
-    result = []
-    for s in students:
-        result.append({
-            "id": s.id,
-            "name": s.user.name,
-            "class": "10",
-            "section": "A",
-            "rollNo": s.roll_no,
-            "attendance": 96.5,
-            "admissionNo": s.admission_no,
-            "phone": s.user.phone,
-            "email": s.user.email
-        })
-    return {"students": result}
+async def get_students(
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    class_id: Optional[int] = None,
+    section_id: Optional[int] = None,
+    admission_no: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """One page of students by id; pass nextCursor back as cursor for the following page"""
+    # Project only the returned columns and page by id, so a page never hydrates ORM objects
+    query = (
+        select(
+            Student.id,
+            User.name,
+            Class.name.label("class_name"),
+            Section.name.label("section_name"),
+            Student.roll_no,
+            Student.admission_no,
+            User.phone,
+            User.email,
+            StudentAttendanceSummary.total_days,
+            StudentAttendanceSummary.present_days,
+            StudentAttendanceSummary.half_days,
+        )
+        .join(User, User.id == Student.user_id)
+        .outerjoin(Class, Class.id == Student.class_id)
+        .outerjoin(Section, Section.id == Student.section_id)
+        .outerjoin(StudentAttendanceSummary, StudentAttendanceSummary.student_id == Student.id)
+        .order_by(Student.id)
+    )
+    query = query.limit(limit + 1)
+    if cursor is not None:
+        query = query.where(Student.id > cursor)
+    if class_id is not None:
+        query = query.where(Student.class_id == class_id)
+    if section_id is not None:
+        query = query.where(Student.section_id == section_id)
+    if admission_no:
+        query = query.where(Student.admission_no == admission_no)
+
+    rows = (await db.execute(query)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "students": [
+            {
+                "id": r.id,
+                "name": r.name,
+                "class": r.class_name,
+                "section": r.section_name,
+                "rollNo": r.roll_no,
+                "attendance": attendance_percentage(r.total_days, r.present_days, r.half_days),
+                "admissionNo": r.admission_no,
+                "phone": r.phone,
+                "email": r.email
+            }
+            for r in rows
+        ],
+        "nextCursor": rows[-1].id if has_more else None
+    }
 
 @app.post("/api/students")
-async def create_student(student: StudentCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_student(student: StudentCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     if current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
         raise HTTPException(status_code=403, detail="Not authorized")
+    try:
+        profile = _student_profile(await _import_lookups(db), student)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
     
     user = User(
         name=student.name,
         email=student.email,
         phone=student.phone,
-        password_hash=get_password_hash(student.password),
+        password_hash=await password_hasher.hash(student.password),
         role=UserRole.STUDENT
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.flush()
     
-    db_student = Student(
-        user_id=user.id,
-        admission_no=student.admission_no,
-        roll_no=student.roll_no
-    )
+    db_student = Student(user_id=user.id, **profile)
     db.add(db_student)
-    db.commit()
+    await db.commit()
     
-    await manager.broadcast({
-        "type": "notification",
-        "notification": {
-            "id": db_student.id,
-            "message": f"New student added: {student.name}",
-            "type": "student",
-            "time": "Just now",
-            "read": False
-        }
-    })
+    background_tasks.add_task(
+        deliver_notification, {"roles": [role.value for role in ADMIN_ROLES]},
+        "student", db_student.id, f"New student added: {student.name}",
+    )
     
     return {"message": "Student created successfully"}
 
+@app.post("/api/students/import")
+async def import_students(background_tasks: BackgroundTasks, file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    report = await import_people(db, file, IMPORT_KINDS["students"])
+    if report["created"]:
+        background_tasks.add_task(
+            deliver_notification, {"roles": [role.value for role in ADMIN_ROLES]},
+            "student", None, f"{report['created']} students imported",
+        )
+    return report
+
 # Subjects
 @app.get("/api/subjects")
-def get_subjects(db: Session = Depends(get_db)):
-    subjects = db.query(Subject).all()
+async def get_subjects(db: AsyncSession = Depends(get_db)):
+    subjects = await db.scalars(select(Subject))
     return {
         "subjects": [
             {"id": s.id, "name": s.name, "code": s.code, "classId": s.class_id}
@@ -813,19 +2935,19 @@ def get_subjects(db: Session = Depends(get_db)):
     }
 
 @app.post("/api/subjects")
-async def create_subject(subject: SubjectCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_subject(subject: SubjectCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     if current_user.role not in [UserRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
     db_subject = Subject(**subject.dict())
     db.add(db_subject)
-    db.commit()
+    await db.commit()
     return {"message": "Subject created successfully"}
 
 # Announcements
 @app.get("/api/announcements")
-def get_announcements(db: Session = Depends(get_db)):
-    announcements = db.query(Announcement).order_by(Announcement.created_at.desc()).all()
+async def get_announcements(db: AsyncSession = Depends(get_db)):
+    announcements = await db.scalars(select(Announcement).order_by(Announcement.created_at.desc()))
     return {
         "announcements": [
             {
@@ -840,7 +2962,7 @@ def get_announcements(db: Session = Depends(get_db)):
     }
 
 @app.post("/api/announcements")
-async def create_announcement(announcement: AnnouncementCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_announcement(announcement: AnnouncementCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     if current_user.role not in [UserRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
@@ -848,34 +2970,29 @@ async def create_announcement(announcement: AnnouncementCreate, db: Session = De
         title=announcement.title,
         message=announcement.message,
         target_type=announcement.target,
+        target_id=announcement.target_id,
         created_by=current_user.id
     )
     db.add(db_announcement)
-    db.commit()
+    await db.commit()
     
-    await manager.broadcast({
-        "type": "notification",
-        "notification": {
-            "id": db_announcement.id,
-            "message": f"New announcement: {announcement.title}",
-            "type": "announcement",
-            "time": "Just now",
-            "read": False
-        }
-    })
+    background_tasks.add_task(
+        deliver_notification, announcement_audience(db_announcement.target_type, db_announcement.target_id),
+        "announcement", db_announcement.id, f"New announcement: {announcement.title}",
+    )
     
     return {"message": "Announcement created successfully"}
 
 @app.put("/api/teachers/{teacher_id}")
-def update_teacher(teacher_id: int,
+async def update_teacher(teacher_id: int,
                    data: TeacherUpdate,
-                   db: Session = Depends(get_db),
-                   current_user: User = Depends(get_current_user)):
+                   db: AsyncSession = Depends(get_db),
+                   current_user: Principal = Depends(get_current_user)):
 
     if current_user.role not in [UserRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    profile = db.query(TeacherProfile).filter(TeacherProfile.user_id == teacher_id).first()
+    profile = await db.scalar(select(TeacherProfile).where(TeacherProfile.user_id == teacher_id))
     if not profile:
         raise HTTPException(status_code=404, detail="Teacher not found")
 
@@ -884,13 +3001,36 @@ def update_teacher(teacher_id: int,
     profile.qualification = data.qualification
     profile.classes = data.classes
 
-    db.commit()
+    await db.commit()
     return {"message": "Teacher updated"}
 
 # Notifications
+def notification_cursor(notification: Notification) -> str:
+    return f"{notification.created_at.isoformat()}_{notification.id}"
+
+def parse_notification_cursor(cursor: str):
+    try:
+        created_at, notification_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(notification_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/api/notifications")
-def get_notifications(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    notifications = db.query(Notification).filter(Notification.user_id == current_user.id).order_by(Notification.created_at.desc()).limit(20).all()
+async def get_notifications(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Newest first; pass nextCursor back as cursor for the following page"""
+    query = select(Notification).where(Notification.user_id == current_user.id)
+    if cursor:
+        # Keyset paging: seek past the last row seen instead of OFFSET, so deep pages cost the same as the first
+        query = query.where(tuple_(Notification.created_at, Notification.id) < parse_notification_cursor(cursor))
+    notifications = (await db.scalars(
+        query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1)
+    )).all()
+    page = notifications[:limit]
     return {
         "notifications": [
             {
@@ -900,32 +3040,51 @@ def get_notifications(db: Session = Depends(get_db), current_user: User = Depend
                 "read": n.is_read,
                 "time": n.created_at.strftime("%Y-%m-%d %H:%M")
             }
-            for n in notifications
-        ]
+            for n in page
+        ],
+        "nextCursor": notification_cursor(page[-1]) if len(notifications) > limit else None,
     }
 
+@app.get("/api/notifications/unread-count")
+async def get_unread_count(db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    """Badge count from the maintained counter, never a COUNT(*) over notifications"""
+    unread = await db.scalar(select(NotificationCounter.unread).where(NotificationCounter.user_id == current_user.id))
+    return {"unread": unread or 0}
+
 @app.patch("/api/notifications/{notification_id}/read")
-def mark_notification_read(notification_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    notification = db.query(Notification).filter(Notification.id == notification_id, Notification.user_id == current_user.id).first()
-    if notification:
-        notification.is_read = True
-        db.commit()
-    return {"message": "Notification marked as read"}
+async def mark_notification_read(notification_id: int, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    await db.close()
+    unread = await write_queue.submit(mark_notifications_read, current_user.id, notification_id)
+    await push_unread_count(current_user.id, unread)
+    return {"message": "Notification marked as read", "unread": unread}
 
 @app.post("/api/notifications/mark-all-read")
-def mark_all_read(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    db.query(Notification).filter(Notification.user_id == current_user.id).update({"is_read": True})
-    db.commit()
-    return {"message": "All notifications marked as read"}
+async def mark_all_read(db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    await db.close()
+    unread = await write_queue.submit(mark_notifications_read, current_user.id)
+    await push_unread_count(current_user.id, unread)
+    return {"message": "All notifications marked as read", "unread": unread}
 
 # WebSocket
+# Close code the frontend treats as "log in again" and never reconnects on
+WS_AUTH_FAILED = 4001
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = None):
-    await manager.connect(websocket)
+    async with AsyncSessionLocal() as db:
+        user = await principal_from_token(token, db)
+        channels = await websocket_channels(db, user) if user else None
+    if channels is None:
+        # Closing before accept rejects the handshake, which browsers report as 1006 and retry
+        await websocket.accept()
+        await websocket.close(code=WS_AUTH_FAILED)
+        return
+
+    await manager.connect(websocket, **channels)
     try:
         while True:
-            data = await websocket.receive_text()
-            await manager.broadcast({"message": data})
+            # Clients only listen; inbound frames are keepalives and are never relayed to others
+            await websocket.receive_text()
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
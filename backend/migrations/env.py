@@ -0,0 +1,42 @@
+# env.py - Alembic environment
+"""
+Runs against the connection passed in by core.migrations when the app starts, or
+builds an engine from DATABASE_URL when invoked through the alembic CLI.
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine
+
+config = context.config
+connection = config.attributes.get("connection")
+target_metadata = config.attributes.get("target_metadata")
+
+if connection is None:
+    # CLI run: configure logging and load the models for autogenerate
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    from core.config import settings
+    from main import Base
+    target_metadata = Base.metadata
+
+
+def run_migrations(connection):
+    # render_as_batch lets SQLite alter tables by copy-and-move
+    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    context.configure(url=settings.DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+elif connection is not None:
+    run_migrations(connection)
+else:
+    engine = create_engine(settings.DATABASE_URL)
+    with engine.begin() as cli_connection:
+        run_migrations(cli_connection)
+    engine.dispose()
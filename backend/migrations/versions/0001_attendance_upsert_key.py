@@ -0,0 +1,27 @@
+"""Unique (student_id, date) key on attendance_records used by the attendance upsert
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+from core.migrations import set_aside_duplicates
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The latest mark of a student's day stays; older ones go to attendance_records_duplicates
+    set_aside_duplicates(op.get_bind(), "attendance_records", ["student_id", "date"])
+    op.create_index(
+        "ix_attendance_student_date", "attendance_records", ["student_id", "date"], unique=True, if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index("ix_attendance_student_date", table_name="attendance_records", if_exists=True)
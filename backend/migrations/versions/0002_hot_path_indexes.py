@@ -0,0 +1,33 @@
+"""Composite indexes for the notification, attendance, homework, student and marks filters
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# (index, table, columns)
+INDEXES = [
+    ("ix_notifications_user_created", "notifications", ["user_id", "created_at"]),
+    ("ix_attendance_date", "attendance_records", ["date"]),
+    ("ix_homework_teacher", "homework", ["teacher_id"]),
+    ("ix_students_class_section", "students", ["class_id", "section_id"]),
+    ("ix_students_section", "students", ["section_id"]),
+    ("ix_marks_student_exam", "marks", ["student_id", "exam_id"]),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
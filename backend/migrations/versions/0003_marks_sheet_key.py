@@ -0,0 +1,28 @@
+"""Unique (exam_id, subject_id, student_id) key on marks used by the marks sheet upsert
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+from core.migrations import set_aside_duplicates
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The latest row of a duplicated mark stays; older ones go to marks_duplicates rather than being deleted
+    set_aside_duplicates(op.get_bind(), "marks", ["exam_id", "subject_id", "student_id"])
+    op.create_index(
+        "ix_marks_exam_subject_student", "marks", ["exam_id", "subject_id", "student_id"], unique=True, if_not_exists=True
+    )
+
+
+def downgrade():
+    # marks_duplicates, if any, is left in place: it is the only copy of those rows
+    op.drop_index("ix_marks_exam_subject_student", table_name="marks", if_exists=True)
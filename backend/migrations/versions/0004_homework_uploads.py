@@ -0,0 +1,60 @@
+"""Upload metadata on homework_submissions, one submission per student, and Homework.submission_count
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.migrations import set_aside_duplicates
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+SUBMISSION_COLUMNS = [
+    sa.Column("file_sha256", sa.String(64)),
+    sa.Column("file_name", sa.String()),
+    sa.Column("file_size", sa.Integer()),
+    sa.Column("content_type", sa.String()),
+]
+
+
+def _columns(table):
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    existing = _columns("homework_submissions")
+    for column in SUBMISSION_COLUMNS:
+        if column.name not in existing:
+            op.add_column("homework_submissions", column)
+    op.create_index("ix_homework_submissions_file_sha256", "homework_submissions", ["file_sha256"], if_not_exists=True)
+
+    # One submission per student: the newest stays, earlier ones move to homework_submissions_duplicates
+    set_aside_duplicates(op.get_bind(), "homework_submissions", ["homework_id", "student_id"])
+    op.create_index(
+        "ix_homework_submissions_homework_student", "homework_submissions", ["homework_id", "student_id"],
+        unique=True, if_not_exists=True,
+    )
+
+    if "submission_count" not in _columns("homework"):
+        op.add_column("homework", sa.Column("submission_count", sa.Integer(), nullable=False, server_default="0"))
+        op.execute(
+            "UPDATE homework SET submission_count = "
+            "(SELECT COUNT(*) FROM homework_submissions WHERE homework_submissions.homework_id = homework.id)"
+        )
+
+
+def downgrade():
+    # homework_submissions_duplicates is kept, it holds the only copy of the submissions moved there
+    with op.batch_alter_table("homework") as batch:
+        batch.drop_column("submission_count")
+    op.drop_index("ix_homework_submissions_homework_student", table_name="homework_submissions", if_exists=True)
+    op.drop_index("ix_homework_submissions_file_sha256", table_name="homework_submissions", if_exists=True)
+    with op.batch_alter_table("homework_submissions") as batch:
+        for column in reversed(SUBMISSION_COLUMNS):
+            batch.drop_column(column.name)
@@ -0,0 +1,30 @@
+"""Homework.graded_count
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("homework")}
+    if "graded_count" not in columns:
+        op.add_column("homework", sa.Column("graded_count", sa.Integer(), nullable=False, server_default="0"))
+        op.execute(
+            "UPDATE homework SET graded_count = "
+            "(SELECT COUNT(*) FROM homework_submissions WHERE homework_submissions.homework_id = homework.id "
+            "AND homework_submissions.status = 'GRADED')"
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("homework") as batch:
+        batch.drop_column("graded_count")
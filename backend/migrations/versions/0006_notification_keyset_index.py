@@ -0,0 +1,26 @@
+"""Notification index on (user_id, created_at, id) for keyset paging
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_notifications_user_created_id", "notifications", ["user_id", "created_at", "id"], if_not_exists=True,
+    )
+    # The new index has the old one as its prefix
+    op.drop_index("ix_notifications_user_created", table_name="notifications", if_exists=True)
+
+
+def downgrade():
+    op.create_index("ix_notifications_user_created", "notifications", ["user_id", "created_at"], if_not_exists=True)
+    op.drop_index("ix_notifications_user_created_id", table_name="notifications", if_exists=True)
@@ -0,0 +1,65 @@
+"""notification_archive gets a key of its own; the notification's id moves to notification_id
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.migrations import set_aside_duplicates
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+COPIED = "user_id, type, reference_id, message, created_at, archived_at"
+
+
+def _archive_columns(id_column):
+    return [
+        id_column,
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("type", sa.String()),
+        sa.Column("reference_id", sa.Integer()),
+        sa.Column("message", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(), nullable=False),
+    ]
+
+
+def _rebuild(columns, copy_from, copy_to):
+    """Recreate notification_archive with `columns` and copy the rows over; index names are global, so drop first"""
+    op.drop_index("ix_notification_archive_user_id", table_name="notification_archive", if_exists=True)
+    op.rename_table("notification_archive", "notification_archive_old")
+    op.create_table("notification_archive", *columns)
+    op.create_index("ix_notification_archive_user_id", "notification_archive", ["user_id"])
+    op.execute(
+        f"INSERT INTO notification_archive ({copy_to}, {COPIED}) "
+        f"SELECT {copy_from}, {COPIED} FROM notification_archive_old ORDER BY {copy_from}"
+    )
+    op.drop_table("notification_archive_old")
+
+
+def upgrade():
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("notification_archive")}
+    if "notification_id" in columns:
+        return
+    _rebuild(
+        _archive_columns(sa.Column("id", sa.Integer(), primary_key=True))
+        + [sa.Column("notification_id", sa.Integer(), nullable=False)],
+        copy_from="id", copy_to="notification_id",
+    )
+    op.create_index("ix_notification_archive_id", "notification_archive", ["id"], if_not_exists=True)
+
+
+def downgrade():
+    # The old key is the notification id: later copies of a reused id move to notification_archive_duplicates
+    op.drop_index("ix_notification_archive_id", table_name="notification_archive", if_exists=True)
+    set_aside_duplicates(op.get_bind(), "notification_archive", ["notification_id"])
+    _rebuild(
+        _archive_columns(sa.Column("id", sa.Integer(), primary_key=True, autoincrement=False)),
+        copy_from="notification_id", copy_to="id",
+    )
@@ -0,0 +1,176 @@
+# query_plans.py - Query plans and timings for the hot filters, before and after migration 0002
+"""
+Builds a throwaway SQLite database of campus size, then runs each hot query with the
+0002 indexes removed (alembic downgrade 0001) and again at head, printing SQLite's
+EXPLAIN QUERY PLAN and the median time of each. A plan line with SCAN means a full
+table scan; SEARCH ... USING INDEX means the filter is served from an index.
+Usage: python query_plans.py [--students 3000] [--days 200] [--runs 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--students", type=int, default=3000)
+parser.add_argument("--sections-per-class", type=int, default=4)
+parser.add_argument("--teachers", type=int, default=120)
+parser.add_argument("--days", type=int, default=200, help="school days of attendance history")
+parser.add_argument("--notifications", type=int, default=30, help="notifications per student")
+parser.add_argument("--runs", type=int, default=20, help="timed executions per query")
+args = parser.parse_args()
+
+# The engines are built on import, so point them at the scratch database first
+workdir = tempfile.mkdtemp(prefix="query-plans-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'plans.db')}"
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+
+from core.database import engine  # noqa: E402
+from core.migrations import downgrade_schema, upgrade_schema  # noqa: E402
+from main import (  # noqa: E402
+    AttendanceRecord, AttendanceStatus, Base, Class, Exam, Homework, Mark, Notification, Section,
+    Student, Subject, User, UserRole,
+)
+
+BATCH = 10000
+CLASSES = 12
+SUBJECTS_PER_CLASS = 8
+EXAMS = 4
+
+
+def insert_rows(connection, model, rows):
+    for start in range(0, len(rows), BATCH):
+        connection.execute(insert(model), rows[start:start + BATCH])
+
+
+def populate():
+    rng = random.Random(42)
+    today = date.today()
+    now = datetime.utcnow()
+    students = args.students
+    section_count = CLASSES * args.sections_per_class
+    with engine.begin() as connection:
+        insert_rows(connection, Class, [{"id": c, "name": f"Class {c}"} for c in range(1, CLASSES + 1)])
+        insert_rows(connection, Section, [
+            {"id": s, "class_id": (s - 1) // args.sections_per_class + 1, "name": chr(65 + (s - 1) % args.sections_per_class)}
+            for s in range(1, section_count + 1)
+        ])
+        insert_rows(connection, Subject, [
+            {"id": (c - 1) * SUBJECTS_PER_CLASS + n, "name": f"Subject {n}", "class_id": c}
+            for c in range(1, CLASSES + 1) for n in range(1, SUBJECTS_PER_CLASS + 1)
+        ])
+        insert_rows(connection, Exam, [{"id": e, "name": f"Exam {e}"} for e in range(1, EXAMS + 1)])
+
+        insert_rows(connection, User, [
+            {"id": u, "name": f"User {u}", "email": f"user{u}@bench.local", "password_hash": "-",
+             "role": UserRole.STUDENT if u <= students else UserRole.TEACHER}
+            for u in range(1, students + args.teachers + 1)
+        ])
+        sections = {}
+        student_rows = []
+        for s in range(1, students + 1):
+            section_id = rng.randint(1, section_count)
+            sections[s] = section_id
+            student_rows.append({
+                "id": s, "user_id": s, "admission_no": f"BENCH{s:06d}", "roll_no": s,
+                "class_id": (section_id - 1) // args.sections_per_class + 1, "section_id": section_id,
+            })
+        insert_rows(connection, Student, student_rows)
+
+        statuses = list(AttendanceStatus)
+        insert_rows(connection, AttendanceRecord, [
+            {"student_id": s, "date": today - timedelta(days=d), "status": rng.choice(statuses)}
+            for d in range(args.days) for s in range(1, students + 1)
+        ])
+        insert_rows(connection, Notification, [
+            {"user_id": s, "type": "announcement", "message": "Bench notification", "is_read": n % 3 == 0,
+             "created_at": now - timedelta(hours=rng.randint(0, 24 * args.days))}
+            for s in range(1, students + 1) for n in range(args.notifications)
+        ])
+        insert_rows(connection, Homework, [
+            {"class_id": c, "section_id": None, "subject_id": (c - 1) * SUBJECTS_PER_CLASS + 1,
+             "teacher_id": students + rng.randint(1, args.teachers), "title": "Bench homework",
+             "due_date": today + timedelta(days=rng.randint(-args.days, 14))}
+            for c in range(1, CLASSES + 1) for _ in range(args.teachers * 4)
+        ])
+        insert_rows(connection, Mark, [
+            {"exam_id": e, "student_id": s, "subject_id": n, "marks_obtained": rng.randint(20, 100), "max_marks": 100}
+            for s in range(1, students + 1) for e in range(1, EXAMS + 1) for n in range(1, SUBJECTS_PER_CLASS + 1)
+        ])
+        connection.execute(text("ANALYZE"))
+
+
+def hot_queries():
+    today = date.today()
+    student_id = args.students // 2
+    return [
+        ("notifications: newest 20 for a user",
+         select(Notification).where(Notification.user_id == student_id).order_by(Notification.created_at.desc(), Notification.id.desc()).limit(20)),
+        ("attendance: one day, whole school",
+         select(func.count()).select_from(AttendanceRecord).where(AttendanceRecord.date == today)),
+        ("attendance: one student, last 30 days",
+         select(AttendanceRecord).where(AttendanceRecord.student_id == student_id,
+                                        AttendanceRecord.date >= today - timedelta(days=30))),
+        ("homework: count for a teacher",
+         select(func.count()).select_from(Homework).where(Homework.teacher_id == args.students + 1)),
+        ("students: by section",
+         select(Student.id).where(Student.section_id == 1)),
+        ("students: by class",
+         select(Student.id).where(Student.class_id == 1).order_by(Student.id)),
+        ("marks: one student's exam",
+         select(Mark).where(Mark.student_id == student_id, Mark.exam_id == 1)),
+    ]
+
+
+def measure(label):
+    results = {}
+    with engine.connect() as connection:
+        for name, statement in hot_queries():
+            sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+            timings = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                connection.execute(statement).fetchall()
+                timings.append(time.perf_counter() - started)
+            results[name] = (plan, 1000 * statistics.median(timings))
+    print(f"\n=== {label} ===")
+    for name, (plan, median_ms) in results.items():
+        print(f"{name:<40} {median_ms:9.3f} ms   {' | '.join(plan)}")
+    return results
+
+
+def main():
+    print(f"Populating {engine.url.database} ...")
+    started = time.perf_counter()
+    upgrade_schema(engine, Base.metadata)
+    populate()
+    print(f"Populated in {time.perf_counter() - started:.1f}s")
+
+    downgrade_schema(engine, Base.metadata, "0001")
+    before = measure("before: migration 0001")
+    upgrade_schema(engine, Base.metadata, "head")
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    after = measure("after: head")
+
+    print("\n=== speedup ===")
+    for name in before:
+        print(f"{name:<40} {before[name][1] / max(after[name][1], 1e-6):8.1f}x")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        engine.dispose()
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+        sys.stdout.flush()
@@ -7,21 +7,44 @@ Usage: python seed_data.py
 from datetime import datetime, date, timedelta
 from sqlalchemy.orm import Session
 from main import (
-    SessionLocal, User, AcademicYear, Class, Section, Subject,
+    SessionLocal, prepare_database, User, AcademicYear, Class, Section, Subject,
     Student, Parent, StudentParent, AttendanceRecord, Homework,
-    Exam, FeeHead, StudentFee, Announcement, Notification,
-    UserRole, AttendanceStatus, FeeStatus, get_password_hash
+    Exam, Mark, FeeHead, StudentFee, Announcement, Notification,
+    StudentAttendanceSummary, SectionAttendanceDaily, ReportCard, ReportCardBatch,
+    FeePayment, StudentFeeBalance, ClassFeeBalance, TimetableEntry, TimetableRevision,
+    HomeworkSubmission, StudentHomeworkDue, TeacherHomeworkSummary, NotificationCounter, NotificationArchive,
+    UserRole, AttendanceStatus, FeeStatus, get_password_hash, rebuild_attendance_rollups,
+    rebuild_fee_balances, rebuild_homework_counters, rebuild_notification_counters,
 )
+import functools
 import random
 
+# Every demo account of a role shares its password, so hash each one once instead of per user
+password_hash = functools.lru_cache(maxsize=None)(get_password_hash)
+
 def clear_database(db: Session):
     """Clear all existing data"""
     print("🗑️  Clearing existing data...")
+    db.query(SectionAttendanceDaily).delete()
+    db.query(StudentAttendanceSummary).delete()
+    db.query(NotificationArchive).delete()
+    db.query(NotificationCounter).delete()
     db.query(Notification).delete()
     db.query(Announcement).delete()
+    db.query(ClassFeeBalance).delete()
+    db.query(StudentFeeBalance).delete()
+    db.query(FeePayment).delete()
     db.query(StudentFee).delete()
     db.query(FeeHead).delete()
+    db.query(TimetableEntry).delete()
+    db.query(TimetableRevision).delete()
+    db.query(ReportCardBatch).delete()
+    db.query(ReportCard).delete()
+    db.query(Mark).delete()
     db.query(Exam).delete()
+    db.query(StudentHomeworkDue).delete()
+    db.query(TeacherHomeworkSummary).delete()
+    db.query(HomeworkSubmission).delete()
     db.query(Homework).delete()
     db.query(AttendanceRecord).delete()
     db.query(StudentParent).delete()
@@ -59,7 +82,7 @@ def seed_users(db: Session):
             name="Super Admin",
             email="superadmin@school.com",
             phone="1111111111",
-            password_hash=get_password_hash("super123"),
+            password_hash=password_hash("super123"),
             role=UserRole.SUPER_ADMIN,
             status="active"
         ),
@@ -68,7 +91,7 @@ def seed_users(db: Session):
             name="Principal Kumar",
             email="admin@school.com",
             phone="9876543210",
-            password_hash=get_password_hash("admin123"),
+            password_hash=password_hash("admin123"),
             role=UserRole.ADMIN,
             status="active"
         ),
@@ -77,7 +100,7 @@ def seed_users(db: Session):
             name="Accountant Sharma",
             email="accountant@school.com",
             phone="9876543211",
-            password_hash=get_password_hash("accountant123"),
+            password_hash=password_hash("accountant123"),
             role=UserRole.ACCOUNTANT,
             status="active"
         )
@@ -97,7 +120,7 @@ def seed_users(db: Session):
             name=name,
             email=f"{name.lower().replace(' ', '.')}@school.com",
             phone=f"98765{random.randint(10000, 99999)}",
-            password_hash=get_password_hash("teacher123"),
+            password_hash=password_hash("teacher123"),
             role=UserRole.TEACHER,
             status="active"
         ))
@@ -115,7 +138,7 @@ def seed_users(db: Session):
             name=name,
             email=f"{name.lower().replace(' ', '.')}@school.com",
             phone=f"98765{random.randint(10000, 99999)}",
-            password_hash=get_password_hash("student123"),
+            password_hash=password_hash("student123"),
             role=UserRole.STUDENT,
             status="active"
         ))
@@ -131,7 +154,7 @@ def seed_users(db: Session):
             name=name,
             email=f"{name.lower().replace(' ', '.')}@school.com",
             phone=f"98765{random.randint(10000, 99999)}",
-            password_hash=get_password_hash("parent123"),
+            password_hash=password_hash("parent123"),
             role=UserRole.PARENT,
             status="active"
         ))
@@ -241,7 +264,7 @@ def seed_parents(db: Session, users: list, students: list):
             relation_type=random.choice(["Father", "Mother", "Guardian"])
         )
         db.add(parent)
-        db.commit()
+        db.flush()
         parents.append(parent)
         
         # Link parent to 2-3 students
@@ -281,6 +304,7 @@ def seed_attendance(db: Session, students: list, users: list):
             db.add(attendance)
             attendance_count += 1
     
+    rebuild_attendance_rollups(db)
     db.commit()
     print(f"✅ Created {attendance_count} attendance records")
 
@@ -318,6 +342,8 @@ def seed_homework(db: Session, classes: list, subjects: list, users: list):
         db.add(homework)
         homework_list.append(homework)
     
+    db.flush()
+    rebuild_homework_counters(db)
     db.commit()
     print(f"✅ Created {len(homework_list)} homework assignments")
 
@@ -377,17 +403,21 @@ def seed_fees(db: Session, students: list):
     fee_count = 0
     for student in students:
         for head in fee_heads[:2]:  # Tuition and Transport only
+            amount_due = 5000.0 if head.name == "Tuition Fee" else 2000.0
+            amount_paid = random.choice([0, amount_due / 2, amount_due]) if random.random() < 0.8 else 0
             student_fee = StudentFee(
                 student_id=student.id,
                 fee_head_id=head.id,
-                amount_due=5000.0 if head.name == "Tuition Fee" else 2000.0,
-                amount_paid=random.choice([0, 2500, 5000]) if random.random() < 0.8 else 0,
+                amount_due=amount_due,
+                amount_paid=amount_paid,
                 due_date=date.today() + timedelta(days=10),
-                status=FeeStatus.PAID if random.random() < 0.7 else FeeStatus.PENDING
+                status=FeeStatus.PAID if amount_paid >= amount_due else FeeStatus.PARTIALLY_PAID if amount_paid else FeeStatus.PENDING
             )
             db.add(student_fee)
             fee_count += 1
     
+    db.flush()
+    rebuild_fee_balances(db)
     db.commit()
     print(f"✅ Created {fee_count} fee records")
 
@@ -450,6 +480,8 @@ def seed_notifications(db: Session, users: list):
                 db.add(notif)
                 notification_count += 1
     
+    db.flush()
+    rebuild_notification_counters(db)
     db.commit()
     print(f"✅ Created {notification_count} notifications")
 
@@ -459,6 +491,7 @@ def main():
     print("🌱 SCHOOL MANAGEMENT SYSTEM - DATABASE SEEDING")
     print("=" * 50)
     
+    prepare_database()
     db = SessionLocal()
     
     try:
@@ -0,0 +1,79 @@
+# test_attendance.py - Attendance upsert and the rollups maintained with it
+
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from conftest import account
+from core.database import SessionLocal, engine
+from main import (
+    AttendanceRecord, AttendanceStatus, SectionAttendanceDaily, Student, StudentAttendanceSummary, lock_students_for_write,
+)
+
+DAY = date.today() + timedelta(days=40)  # past the generated history
+
+
+def summaries(db, student_ids):
+    rows = db.execute(
+        select(StudentAttendanceSummary.student_id, StudentAttendanceSummary.total_days, StudentAttendanceSummary.present_days)
+        .where(StudentAttendanceSummary.student_id.in_(student_ids))
+    ).all()
+    return {student_id: (total, present) for student_id, total, present in rows}
+
+
+def mark(client, auth, section, statuses):
+    response = client.post("/api/attendance/mark", headers=auth(account("teacher")), json={
+        "class_id": str(section["class_id"]),
+        "date": DAY.isoformat(),
+        "attendance": {str(student_id): value for student_id, value in statuses.items()},
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_remarking_updates_rows_in_place_and_moves_rollups_by_the_difference(client, auth, db, student):
+    student_ids = db.scalars(select(Student.id).where(Student.section_id == student["section_id"]).order_by(Student.id)).all()
+    before = summaries(db, student_ids)
+
+    mark(client, auth, student, dict.fromkeys(student_ids, "present"))
+    db.expire_all()
+    after_first = summaries(db, student_ids)
+    assert all(after_first[s] == (before[s][0] + 1, before[s][1] + 1) for s in student_ids)
+
+    absent = student_ids[0]
+    mark(client, auth, student, {**dict.fromkeys(student_ids, "present"), absent: "absent"})
+    db.expire_all()
+    after_second = summaries(db, student_ids)
+    assert after_second[absent] == (before[absent][0] + 1, before[absent][1])
+    assert all(after_second[s] == after_first[s] for s in student_ids[1:])
+
+    assert db.scalar(select(func.count()).select_from(AttendanceRecord).where(AttendanceRecord.date == DAY)) == len(student_ids)
+    assert db.get(AttendanceRecord, db.scalar(
+        select(AttendanceRecord.id).where(AttendanceRecord.student_id == absent, AttendanceRecord.date == DAY)
+    )).status == AttendanceStatus.ABSENT
+    daily = db.get(SectionAttendanceDaily, (student["section_id"], DAY))
+    assert (daily.total_days, daily.present_days) == (len(student_ids), len(student_ids) - 1)
+
+
+def test_unknown_students_are_rejected_before_writing(client, auth, student):
+    response = client.post("/api/attendance/mark", headers=auth(account("teacher")), json={
+        "class_id": str(student["class_id"]), "date": DAY.isoformat(), "attendance": {"999999": "present"},
+    })
+    assert response.status_code == 404
+
+
+def test_marking_holds_the_write_lock_before_reading_previous_statuses(db, student):
+    with SessionLocal() as first:
+        lock_students_for_write(first, [student["id"]])
+        # Another writer (e.g. a second worker) cannot start until the first transaction ends
+        competitor = sqlite3.connect(engine.url.database, timeout=0)
+        try:
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                competitor.execute("BEGIN IMMEDIATE")
+            first.rollback()
+            competitor.execute("BEGIN IMMEDIATE")
+            competitor.rollback()
+        finally:
+            competitor.close()
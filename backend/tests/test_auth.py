@@ -0,0 +1,29 @@
+# test_auth.py - Bearer token resolution through the principal cache
+
+import pytest
+
+from conftest import account
+from main import create_access_token, principal_cache
+
+
+@pytest.mark.parametrize("warm_cache", [False, True])
+def test_token_for_another_account_with_the_same_email_is_refused(client, auth, student, warm_cache):
+    principal_cache.clear()
+    if warm_cache:
+        assert client.get("/api/notifications/unread-count", headers=auth(student["email"])).status_code == 200
+    stale = create_access_token({"sub": student["email"], "uid": student["user_id"] + 100000, "role": "student"})
+    response = client.get("/api/notifications/unread-count", headers={"Authorization": f"Bearer {stale}"})
+    assert response.status_code == 401
+
+
+def test_token_without_uid_is_refused(client):
+    token = create_access_token({"sub": account("admin"), "role": "admin"})
+    assert client.get("/api/notifications/unread-count", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+
+def test_metrics_are_for_admins_only(client, auth, student):
+    assert client.get("/api/metrics").status_code == 401
+    assert client.get("/api/metrics", headers=auth(student["email"])).status_code == 403
+    response = client.get("/api/metrics", headers=auth(account("admin")))
+    assert response.status_code == 200
+    assert "writeQueue" in response.json()
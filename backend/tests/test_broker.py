@@ -0,0 +1,75 @@
+# test_broker.py - Cross-worker event bus without an external service
+
+import asyncio
+
+import pytest
+
+from utils.broker import MAX_DATAGRAM, Broker, InProcessBroker, UnixSocketBroker
+
+
+def collect(broker):
+    received = []
+    broker.subscribe(received.append)
+    return received
+
+
+async def until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "broker event never arrived"
+        await asyncio.sleep(0.01)
+
+
+def test_unix_socket_workers_see_each_others_events(tmp_path):
+    small = {"text": "hello", "audience": None}
+    large = {"text": "x" * (3 * MAX_DATAGRAM), "audience": {"users": [1, 2]}}
+
+    async def scenario():
+        first, second = UnixSocketBroker(str(tmp_path)), UnixSocketBroker(str(tmp_path))
+        on_first, on_second = collect(first), collect(second)
+        await first.start()
+        await second.start()
+        try:
+            await first.publish(small)
+            await first.publish(large)
+            await until(lambda: len(on_second) == 2)
+        finally:
+            await first.stop()
+            await second.stop()
+        return on_first, on_second
+
+    on_first, on_second = asyncio.run(scenario())
+    # The publisher delivers to its own sockets too, exactly once
+    assert on_first == [small, large]
+    assert on_second == [small, large]
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("plant", ["world_writable", "symlink"])
+def test_a_directory_others_could_control_is_refused(tmp_path, plant):
+    directory = tmp_path / "ws"
+    if plant == "symlink":
+        (tmp_path / "elsewhere").mkdir(mode=0o700)
+        directory.symlink_to(tmp_path / "elsewhere")
+    else:
+        directory.mkdir()
+        directory.chmod(0o777)
+    broker = UnixSocketBroker(str(directory))
+    with pytest.raises(PermissionError):
+        asyncio.run(broker.start())
+    assert broker.sock is None
+
+
+def test_in_process_broker_delivers_locally():
+    broker = InProcessBroker()
+    received = collect(broker)
+    asyncio.run(broker.publish({"text": "hi", "audience": None}))
+    assert received == [{"text": "hi", "audience": None}]
+
+
+def test_broker_without_publish_cannot_be_built():
+    class Incomplete(Broker):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
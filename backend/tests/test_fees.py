@@ -0,0 +1,44 @@
+# test_fees.py - Idempotent payment ledger and the balances maintained with it
+
+from sqlalchemy import func, select
+
+from conftest import account
+from main import ClassFeeBalance, FeePayment, FeeStatus, Student, StudentFee, StudentFeeBalance
+
+
+def pay(client, auth, fee_id, amount, transaction_id):
+    return client.post(f"/api/fees/{fee_id}/pay", headers=auth(account("accountant")), json={
+        "amount": amount, "payment_mode": "cash", "transaction_id": transaction_id,
+    })
+
+
+def test_payment_is_recorded_once_and_moves_both_balances(client, auth, db):
+    fee = db.scalar(select(StudentFee).where(StudentFee.status == FeeStatus.PENDING).limit(1))
+    class_id = db.scalar(select(Student.class_id).where(Student.id == fee.student_id))
+    student_paid = db.get(StudentFeeBalance, fee.student_id).total_paid
+    class_paid = db.get(ClassFeeBalance, class_id).total_paid
+
+    first = pay(client, auth, fee.id, fee.amount_due / 2, "receipt-1")
+    assert first.status_code == 200, first.text
+    assert first.json()["status"] == FeeStatus.PARTIALLY_PAID
+    retry = pay(client, auth, fee.id, fee.amount_due / 2, "receipt-1")
+    assert retry.json()["message"] == "Payment already recorded"
+    assert pay(client, auth, fee.id, fee.amount_due / 2, "receipt-1").json()["amountPaid"] == fee.amount_due / 2
+
+    db.expire_all()
+    assert db.scalar(select(func.count()).select_from(FeePayment).where(FeePayment.student_fee_id == fee.id)) == 1
+    assert db.get(StudentFeeBalance, fee.student_id).total_paid == student_paid + fee.amount_due / 2
+    assert db.get(ClassFeeBalance, class_id).total_paid == class_paid + fee.amount_due / 2
+
+
+def test_overpayment_is_rejected_without_a_ledger_row(client, auth, db):
+    fee = db.scalar(select(StudentFee).where(StudentFee.status == FeeStatus.PENDING).offset(1).limit(1))
+    response = pay(client, auth, fee.id, fee.amount_due + 1, "receipt-over")
+    assert response.status_code == 400
+    assert db.scalar(select(FeePayment.id).where(FeePayment.transaction_id == "receipt-over")) is None
+
+
+def test_reused_transaction_id_for_another_payment_conflicts(client, auth, db):
+    fees = db.scalars(select(StudentFee).where(StudentFee.status == FeeStatus.PENDING).offset(2).limit(2)).all()
+    assert pay(client, auth, fees[0].id, 1, "receipt-shared").status_code == 200
+    assert pay(client, auth, fees[1].id, 1, "receipt-shared").status_code == 409
@@ -0,0 +1,33 @@
+# test_generate_data.py - The bulk generator gives the same school for the same arguments
+
+from datetime import date
+
+from sqlalchemy import create_engine, select
+
+from generate_data import SchoolSize, generate
+from main import AttendanceRecord, Base, Homework, Notification
+
+SIZE = SchoolSize(students=20, classes=1, sections_per_class=2, days=3, exams=1, homework_per_subject=1,
+                  notifications=2, seed=3)
+
+
+def build(path, today):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        generate(connection, SIZE, log=lambda line: None, today=today)
+    with engine.connect() as connection:
+        rows = [
+            connection.execute(select(AttendanceRecord.student_id, AttendanceRecord.date, AttendanceRecord.status,
+                                      AttendanceRecord.created_at).order_by(AttendanceRecord.id)).all(),
+            connection.execute(select(Homework.title, Homework.due_date, Homework.created_at).order_by(Homework.id)).all(),
+            connection.execute(select(Notification.user_id, Notification.created_at).order_by(Notification.id)).all(),
+        ]
+    engine.dispose()
+    return rows
+
+
+def test_a_pinned_today_gives_the_same_rows(tmp_path):
+    first = build(tmp_path / "first.db", date(2025, 1, 15))
+    assert build(tmp_path / "second.db", date(2025, 1, 15)) == first
+    assert max(day for _, day, _, _ in first[0]) == date(2025, 1, 15)
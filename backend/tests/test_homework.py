@@ -0,0 +1,101 @@
+# test_homework.py - Homework submission and grading counters behind the dashboards
+
+from datetime import date
+
+from sqlalchemy import func, or_, select
+
+from conftest import account
+from main import Class, Homework, Section, Student, TeacherHomeworkSummary, User
+
+
+def dashboard(client, auth, role, email):
+    response = client.get(f"/api/dashboard/{role}", headers=auth(email))
+    assert response.status_code == 200, response.text
+    return response.json()["stats"]
+
+
+def submit(client, auth, email, homework_id, **files):
+    return client.post(
+        f"/api/homework/{homework_id}/submit", headers=auth(email),
+        data={"text_answer": "My answer"}, files=files or {"unused": ("", b"")},
+    )
+
+
+def test_assign_submit_and_grade_move_every_counter_once(client, auth, db, student, create_homework):
+    teacher_id = db.scalar(select(User.id).where(User.email == account("teacher")))
+    pending_before = dashboard(client, auth, "student", student["email"])["pendingHomework"]
+    teacher_before = db.get(TeacherHomeworkSummary, teacher_id)
+    assigned_before = teacher_before.homework if teacher_before else 0
+
+    homework_id = create_homework(student["class_id"], student["section_id"])
+    assert dashboard(client, auth, "student", student["email"])["pendingHomework"] == pending_before + 1
+
+    response = submit(client, auth, student["email"], homework_id)
+    assert response.status_code == 200, response.text
+    submission_id = response.json()["id"]
+    # A resubmission replaces the answer without counting again
+    assert submit(client, auth, student["email"], homework_id).json()["message"] == "Homework resubmitted successfully"
+    assert dashboard(client, auth, "student", student["email"])["pendingHomework"] == pending_before
+
+    teacher = dashboard(client, auth, "teacher", account("teacher"))
+    response = client.post(f"/api/homework/submissions/{submission_id}/grade", headers=auth(account("teacher")), json={"marks": 8})
+    assert response.status_code == 200, response.text
+    client.post(f"/api/homework/submissions/{submission_id}/grade", headers=auth(account("teacher")), json={"marks": 9})
+    assert dashboard(client, auth, "teacher", account("teacher"))["homeworkPending"] == teacher["homeworkPending"] - 1
+
+    db.expire_all()
+    homework = db.get(Homework, homework_id)
+    assert (homework.submission_count, homework.graded_count) == (1, 1)
+    summary = db.get(TeacherHomeworkSummary, teacher_id)
+    assert summary.homework == assigned_before + 1
+    assert summary.submissions - summary.graded == teacher["homeworkPending"] - 1
+
+
+def test_graded_work_cannot_be_resubmitted(client, auth, student, create_homework):
+    homework_id = create_homework(student["class_id"])
+    submission_id = submit(client, auth, student["email"], homework_id).json()["id"]
+    client.post(f"/api/homework/submissions/{submission_id}/grade", headers=auth(account("teacher")), json={"marks": 5})
+
+    response = submit(client, auth, student["email"], homework_id)
+    assert response.status_code == 409
+
+
+def open_homework(db, class_id, section_id):
+    return db.scalar(
+        select(func.count()).select_from(Homework)
+        .where(Homework.class_id == class_id, or_(Homework.section_id.is_(None), Homework.section_id == section_id),
+               Homework.due_date >= date.today())
+    )
+
+
+def test_imported_student_counts_homework_set_before_they_joined(client, auth, db, student, create_homework):
+    homework_id = create_homework(student["class_id"], student["section_id"])
+    class_name, section_name = db.execute(
+        select(Class.name, Section.name).join(Section, Section.class_id == Class.id).where(Section.id == student["section_id"])
+    ).one()
+    csv = f"name,email,phone,admission_no,class,section\nNew Kid,newkid@school.test,555,NEW-1,{class_name},{section_name}\n"
+    response = client.post("/api/students/import", headers=auth(account("admin")),
+                           files={"file": ("students.csv", csv.encode(), "text/csv")})
+    assert response.json()["created"] == 1, response.text
+
+    expected = open_homework(db, student["class_id"], student["section_id"])
+    assert dashboard(client, auth, "student", "newkid@school.test")["pendingHomework"] == expected
+    assert submit(client, auth, "newkid@school.test", homework_id).status_code == 200
+    assert dashboard(client, auth, "student", "newkid@school.test")["pendingHomework"] == expected - 1
+
+
+def test_created_and_moved_students_are_recounted(client, auth, db, student, create_homework):
+    class_name = db.scalar(select(Class.name).where(Class.id == student["class_id"]))
+    response = client.post("/api/students", headers=auth(account("admin")), json={
+        "name": "Walk In", "email": "walkin@school.test", "phone": "555", "admission_no": "WALK-1", "class_": class_name,
+    })
+    assert response.status_code == 200, response.text
+    assert dashboard(client, auth, "student", "walkin@school.test")["pendingHomework"] == open_homework(db, student["class_id"], None)
+
+    create_homework(student["class_id"], student["section_id"])
+    moved = db.scalar(select(Student).join(User, User.id == Student.user_id).where(User.email == "walkin@school.test"))
+    moved.section_id = student["section_id"]
+    db.commit()
+    assert dashboard(client, auth, "student", "walkin@school.test")["pendingHomework"] == open_homework(
+        db, student["class_id"], student["section_id"]
+    )
@@ -0,0 +1,54 @@
+# test_import.py - Streamed CSV import of students
+
+import threading
+
+from sqlalchemy import select
+
+import main
+from conftest import account
+from main import User, password_hasher
+
+HEADER = "name,email,phone,admission_no,class,section,roll_no\n"
+
+
+def import_csv(client, auth, content: bytes):
+    return client.post("/api/students/import", headers=auth(account("admin")),
+                       files={"file": ("students.csv", content, "text/csv")})
+
+
+def test_import_is_not_refused_when_logins_fill_the_hasher_queue(client, auth, db, monkeypatch):
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+    rows = "".join(f"Busy {n},busy{n}@school.test,555,BUSY-{n},,,{n}\n" for n in range(3))
+    response = import_csv(client, auth, (HEADER + rows).encode())
+    assert response.status_code == 200, response.text
+    assert (response.json()["created"], response.json()["failed"]) == (3, 0)
+
+
+def test_non_utf8_file_is_a_client_error_and_imports_nothing(client, auth, db):
+    content = (HEADER + "Ana,latin1@school.test,555,LAT-1,,,1\n").encode() + "José,jose@school.test,555,LAT-2,,,2\n".encode("latin-1")
+    response = import_csv(client, auth, content)
+    assert response.status_code == 400
+    assert "line 3" in response.json()["detail"]
+    assert db.scalar(select(User.id).where(User.email == "latin1@school.test")) is None
+
+
+def test_file_is_checked_and_parsed_off_the_event_loop(client, auth, db, monkeypatch):
+    threads = []
+    check_csv_encoding, iter_csv_rows = main.check_csv_encoding, main.iter_csv_rows
+
+    def check_spy(upload):
+        threads.append(threading.current_thread())
+        return check_csv_encoding(upload)
+
+    def rows_spy(upload):
+        # A generator, so this runs where the rows are actually read rather than where it is called
+        threads.append(threading.current_thread())
+        yield from iter_csv_rows(upload)
+
+    monkeypatch.setattr(main, "check_csv_encoding", check_spy)
+    monkeypatch.setattr(main, "iter_csv_rows", rows_spy)
+    loop_thread = client.portal.call(threading.current_thread)
+    response = import_csv(client, auth, (HEADER + "Off Loop,offloop@school.test,555,OFF-1,,,1\n").encode())
+    assert response.status_code == 200, response.text
+    assert len(threads) == 2
+    assert loop_thread not in threads
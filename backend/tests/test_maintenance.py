@@ -0,0 +1,69 @@
+# test_maintenance.py - Retention runs: one at a time across workers, on schedule or on demand
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from conftest import account
+from core.database import SessionLocal
+from main import MaintenanceLease, Notification, NotificationArchive, claim_maintenance
+
+
+@pytest.fixture(autouse=True)
+def no_lease(db):
+    """Each test starts with no run recorded and none in progress"""
+    db.execute(delete(MaintenanceLease))
+    db.commit()
+
+
+def claim(now, due_before=None):
+    with SessionLocal() as db:
+        claimed = claim_maintenance(db, now, due_before)
+        db.commit()
+    return claimed
+
+
+def test_manual_run_reports_and_releases_the_lease(client, auth, db):
+    headers = auth(account("admin"))
+    response = client.post("/api/admin/maintenance", headers=headers)
+    assert response.status_code == 200, response.text
+    assert {"notificationsArchived", "pagesFreed", "uploadsRemoved"} <= set(response.json())
+    assert client.post("/api/admin/maintenance", headers=headers).status_code == 200
+
+
+def test_a_held_lease_refuses_a_second_run(client, auth, db):
+    assert claim(datetime.utcnow())
+    assert client.post("/api/admin/maintenance", headers=auth(account("admin"))).status_code == 409
+    db.execute(update(MaintenanceLease).values(locked_until=None))
+    db.commit()
+    assert client.post("/api/admin/maintenance", headers=auth(account("admin"))).status_code == 200
+
+
+def test_only_one_worker_runs_per_scheduled_interval(db):
+    now = datetime.utcnow()
+    due_before = now - timedelta(minutes=30)
+    assert claim(now, due_before)
+    db.execute(update(MaintenanceLease).values(locked_until=None))
+    db.commit()
+    # A second worker whose loop wakes a moment later finds the run already done
+    assert not claim(now + timedelta(seconds=5), due_before + timedelta(seconds=5))
+    assert claim(now + timedelta(hours=1), now + timedelta(minutes=30))
+
+
+def test_a_reused_notification_id_is_archived_again(client, auth, db, student):
+    def archive_old_read_notification():
+        notification = Notification(user_id=student["user_id"], type="info", message="old news", is_read=True,
+                                    created_at=datetime(2000, 1, 1))
+        db.add(notification)
+        db.commit()
+        notification_id = notification.id
+        response = client.post("/api/admin/maintenance", headers=auth(account("admin")))
+        assert response.status_code == 200, response.text
+        return notification_id
+
+    first = archive_old_read_notification()
+    # SQLite gives the newest rowid out again once that row is deleted
+    assert archive_old_read_notification() == first
+    archived = db.scalars(select(NotificationArchive.message).where(NotificationArchive.notification_id == first)).all()
+    assert archived == ["old news", "old news"]
@@ -0,0 +1,34 @@
+# test_marks.py - Single marks and the marks sheet share one upsert
+
+from sqlalchemy import func, select
+
+from conftest import account
+from main import Exam, Mark, Subject
+
+
+def enter(client, auth, **fields):
+    return client.post("/api/marks", headers=auth(account("teacher")), json=fields)
+
+
+def test_single_mark_is_saved_and_reentering_it_updates_in_place(client, auth, db, student):
+    exam = db.scalar(select(Exam).order_by(Exam.id.desc()).limit(1))
+    subject = db.scalar(select(Subject).where(Subject.class_id == student["class_id"]).limit(1))
+    mark = {"student_id": student["id"], "subject": subject.name, "exam": exam.name, "max_marks": 50}
+
+    assert enter(client, auth, **mark, obtained_marks=20).json()["grade"] == "F"
+    response = enter(client, auth, **mark, obtained_marks=46)
+    assert response.status_code == 200, response.text
+    assert response.json()["grade"] == "A+"
+
+    key = (Mark.exam_id == exam.id, Mark.subject_id == subject.id, Mark.student_id == student["id"])
+    assert db.scalar(select(func.count()).select_from(Mark).where(*key)) == 1
+    assert db.scalar(select(Mark.marks_obtained).where(*key)) == 46
+
+
+def test_invalid_marks_are_rejected(client, auth, db, student):
+    exam = db.scalar(select(Exam.name).limit(1))
+    subject = db.scalar(select(Subject.name).where(Subject.class_id == student["class_id"]).limit(1))
+    mark = {"student_id": student["id"], "subject": subject, "exam": exam}
+    assert enter(client, auth, **mark, max_marks=0, obtained_marks=0).status_code == 422
+    assert enter(client, auth, **mark, max_marks=10, obtained_marks=11).status_code == 422
+    assert enter(client, auth, **{**mark, "subject": "Astrology"}, max_marks=10, obtained_marks=5).status_code == 404
@@ -0,0 +1,62 @@
+# test_migrations.py - Alembic revisions and the helpers they rely on
+
+from alembic import command
+from sqlalchemy import create_engine, text
+
+from core.migrations import alembic_config, set_aside_duplicates
+
+
+def test_duplicates_are_moved_to_an_audit_table_not_deleted():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE marks (id INTEGER PRIMARY KEY, exam_id INTEGER, student_id INTEGER, score INTEGER)"))
+        connection.execute(text("INSERT INTO marks VALUES (1, 1, 1, 10), (2, 1, 1, 20), (3, 1, 2, 30), (4, 1, 1, 40)"))
+
+        assert set_aside_duplicates(connection, "marks", ["exam_id", "student_id"]) == 2
+        assert connection.execute(text("SELECT id FROM marks ORDER BY id")).scalars().all() == [3, 4]
+        assert connection.execute(text("SELECT id, score FROM marks_duplicates ORDER BY id")).all() == [(1, 10), (2, 20)]
+        # Nothing left to move the second time
+        assert set_aside_duplicates(connection, "marks", ["exam_id", "student_id"]) == 0
+
+
+def test_duplicate_attendance_does_not_stop_the_upsert_key_from_being_built():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE attendance_records (id INTEGER PRIMARY KEY, student_id INTEGER, date DATE, status VARCHAR)"))
+        connection.execute(text(
+            "INSERT INTO attendance_records VALUES (1, 1, '2024-06-03', 'ABSENT'), (2, 1, '2024-06-03', 'PRESENT'), "
+            "(3, 2, '2024-06-03', 'PRESENT')"
+        ))
+        command.upgrade(alembic_config(connection), "0001")
+
+        assert connection.execute(text("SELECT id FROM attendance_records ORDER BY id")).scalars().all() == [2, 3]
+        assert connection.execute(text("SELECT id FROM attendance_records_duplicates")).scalars().all() == [1]
+
+
+def test_notification_archive_gets_its_own_key_and_keeps_its_rows(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE notification_archive (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, type VARCHAR, "
+            "reference_id INTEGER, message TEXT NOT NULL, created_at DATETIME NOT NULL, archived_at DATETIME NOT NULL)"
+        ))
+        connection.execute(text("CREATE INDEX ix_notification_archive_user_id ON notification_archive (user_id)"))
+        connection.execute(text(
+            "INSERT INTO notification_archive VALUES (7, 1, 'info', NULL, 'a', '2020-01-01', '2020-06-01'), "
+            "(9, 2, 'info', NULL, 'b', '2020-01-02', '2020-06-01')"
+        ))
+        config = alembic_config(connection)
+        command.stamp(config, "0006")
+        command.upgrade(config, "0007")
+
+        rows = connection.execute(text("SELECT notification_id, user_id, message FROM notification_archive ORDER BY id")).all()
+        assert rows == [(7, 1, "a"), (9, 2, "b")]
+        # The same notification id can now be archived a second time
+        connection.execute(text(
+            "INSERT INTO notification_archive (notification_id, user_id, message, created_at, archived_at) "
+            "VALUES (9, 2, 'c', '2020-01-03', '2020-07-01')"
+        ))
+        command.downgrade(config, "0006")
+        assert connection.execute(text("SELECT id, message FROM notification_archive ORDER BY id")).all() == [(7, "a"), (9, "c")]
+        assert connection.execute(text("SELECT message FROM notification_archive_duplicates")).scalars().all() == ["b"]
+    engine.dispose()
@@ -0,0 +1,100 @@
+# test_notifications.py - Inbox fan-out, unread counters and keyset paging
+
+from datetime import datetime
+
+from sqlalchemy import func, insert, select
+
+import main
+from conftest import account
+from main import Notification, NotificationCounter
+
+
+def unread(client, auth, email):
+    return client.get("/api/notifications/unread-count", headers=auth(email)).json()["unread"]
+
+
+def inbox(client, auth, email, limit):
+    """Every notification of a user, following nextCursor page by page"""
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/notifications", headers=auth(email), params=params).json()
+        ids.extend(item["id"] for item in page["notifications"])
+        cursor = page["nextCursor"]
+        if cursor is None:
+            return ids
+
+
+def test_keyset_pages_cover_the_inbox_once_in_order_even_with_tied_timestamps(client, auth, db, student):
+    tied = datetime(2020, 1, 1, 8, 0, 0)
+    db.execute(insert(Notification), [
+        {"user_id": student["user_id"], "type": "info", "message": f"tie {n}", "is_read": True, "created_at": tied}
+        for n in range(5)
+    ])
+    db.commit()
+
+    expected = db.scalars(
+        select(Notification.id).where(Notification.user_id == student["user_id"])
+        .order_by(Notification.created_at.desc(), Notification.id.desc())
+    ).all()
+    assert inbox(client, auth, student["email"], limit=2) == expected
+    assert inbox(client, auth, student["email"], limit=100) == expected
+
+
+def test_announcement_reaches_the_inbox_and_the_counter_tracks_reads(client, auth, db, student):
+    before = unread(client, auth, student["email"])
+    response = client.post("/api/announcements", headers=auth(account("admin")), json={
+        "title": "Sports day", "message": "Bring your kit", "target": "user", "target_id": student["user_id"],
+    })
+    assert response.status_code == 200, response.text
+    assert unread(client, auth, student["email"]) == before + 1
+
+    newest = client.get("/api/notifications", headers=auth(student["email"])).json()["notifications"][0]
+    assert newest["message"] == "New announcement: Sports day" and not newest["read"]
+    response = client.patch(f"/api/notifications/{newest['id']}/read", headers=auth(student["email"]))
+    assert response.json()["unread"] == before
+    # Marking it again must not decrement twice
+    assert client.patch(f"/api/notifications/{newest['id']}/read", headers=auth(student["email"])).json()["unread"] == before
+
+    assert client.post("/api/notifications/mark-all-read", headers=auth(student["email"])).json()["unread"] == 0
+    db.expire_all()
+    assert db.get(NotificationCounter, student["user_id"]).unread == db.scalar(
+        select(func.count()).select_from(Notification)
+        .where(Notification.user_id == student["user_id"], Notification.is_read == False)  # noqa: E712
+    ) == 0
+
+
+def test_invalid_cursor_is_a_client_error(client, auth, student):
+    response = client.get("/api/notifications", headers=auth(student["email"]), params={"cursor": "yesterday"})
+    assert response.status_code == 400
+
+
+def test_section_announcement_reaches_the_admin_inbox_like_the_live_push(client, auth, student):
+    before = unread(client, auth, account("admin"))
+    response = client.post("/api/announcements", headers=auth(account("admin")), json={
+        "title": "Section trip", "message": "Permission slips", "target": "section", "target_id": student["section_id"],
+    })
+    assert response.status_code == 200, response.text
+    assert unread(client, auth, account("admin")) == before + 1
+
+
+def test_a_failed_inbox_write_is_retried(client, auth, student, monkeypatch):
+    calls = []
+    fan_out = main.fan_out_notification
+
+    def flaky(db, *args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return fan_out(db, *args)
+
+    monkeypatch.setattr(main, "fan_out_notification", flaky)
+    retries = main.notification_state["storeRetries"]
+    before = unread(client, auth, student["email"])
+    response = client.post("/api/announcements", headers=auth(account("admin")), json={
+        "title": "Retry", "message": "Once more", "target": "user", "target_id": student["user_id"],
+    })
+    assert response.status_code == 200, response.text
+    assert len(calls) == 2
+    assert unread(client, auth, student["email"]) == before + 1
+    assert main.notification_state["storeRetries"] == retries + 1
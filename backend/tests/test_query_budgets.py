@@ -0,0 +1,44 @@
+# test_query_budgets.py - SQL statement budgets for the API's read endpoints
+"""
+Each request may run at most its budget of SQL statements, which is how N+1 lazy loads
+get caught. Budgets are per request with a warm principal cache, so authentication costs nothing.
+"""
+
+import pytest
+
+from conftest import account
+from core.database import async_engine
+from utils.querycount import assert_max_queries
+
+# (account, path, max statements)
+BUDGETS = [
+    (account("admin"), "/api/students", 1),
+    (account("admin"), "/api/students?limit=5&class_id=1", 1),
+    (account("admin"), "/api/teachers", 1),
+    (account("admin"), "/api/classes", 3),
+    (account("admin"), "/api/subjects", 1),
+    (account("admin"), "/api/announcements", 1),
+    (account("admin"), "/api/notifications", 1),
+    (account("admin"), "/api/notifications/unread-count", 1),
+    (account("admin"), "/api/dashboard/admin", 4),
+    (account("admin"), "/api/timetable?section_id=1", 1),
+    (account("teacher"), "/api/dashboard/teacher", 1),
+    (account("teacher"), "/api/marks/sheet?exam_id=1&section_id=1", 5),
+    (account("teacher"), "/api/report-cards?exam_id=1&section_id=1", 5),
+    (account("teacher"), "/api/homework", 1),
+    (account("student"), "/api/dashboard/student", 1),
+    (account("student"), "/api/homework", 2),
+    (account("student"), "/api/notifications", 1),
+    (account("accountant"), "/api/dashboard/accountant", 2),
+    (account("accountant"), "/api/fees/balances", 1),
+]
+
+
+@pytest.mark.parametrize("email, path, limit", BUDGETS, ids=[f"{path} as {email.split('@')[0]}" for email, path, _ in BUDGETS])
+def test_query_budget(client, auth, email, path, limit):
+    headers = auth(email)
+    client.get(path, headers=headers).raise_for_status()  # warm the principal cache and lazily built data
+
+    with assert_max_queries(async_engine.sync_engine, limit, label=f"GET {path}"):
+        response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
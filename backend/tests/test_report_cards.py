@@ -0,0 +1,66 @@
+# test_report_cards.py - Report cards computed once per exam and class, and again after marks change
+
+import pytest
+from sqlalchemy import event, select
+
+import main
+from conftest import account
+from core.database import SessionLocal, engine
+from main import Class, Exam, Subject
+
+
+def test_a_class_without_marks_is_computed_once_until_marks_arrive(client, auth, db, student, monkeypatch):
+    exam = Exam(name="Empty class test", type="unit")
+    db.add(exam)
+    db.commit()
+    computed = []
+    compute = main.compute_report_cards
+    monkeypatch.setattr(main, "compute_report_cards", lambda *args: computed.append(args[1:]) or compute(*args))
+
+    headers = auth(account("teacher"))
+    params = {"exam_id": exam.id, "section_id": student["section_id"]}
+    for _ in range(3):
+        assert client.get("/api/report-cards", headers=headers, params=params).json()["students"] == []
+    assert computed == [(exam.id, student["class_id"])]
+
+    subject = db.scalar(select(Subject.name).where(Subject.class_id == student["class_id"]).limit(1))
+    response = client.post("/api/marks", headers=headers, json={
+        "student_id": student["id"], "subject": subject, "exam": exam.name, "max_marks": 10, "obtained_marks": 7,
+    })
+    assert response.status_code == 200, response.text
+    cards = client.get("/api/report-cards", headers=headers, params=params).json()["students"]
+    assert [(card["studentId"], card["sectionRank"]) for card in cards] == [(student["id"], 1)]
+    assert len(computed) == 2
+
+
+def test_unknown_exam_is_not_found(client, auth, student):
+    response = client.get(f"/api/report-cards/{student['id']}", headers=auth(account("admin")), params={"exam_id": 999999})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("job", ["compute_report_cards", "write_marks_sheet"])
+def test_computing_and_writing_marks_lock_the_class_first(db, student, job, monkeypatch):
+    # On Postgres a marks write could otherwise commit its invalidation while a computation is still
+    # running on the old marks, which would then store stale cards for good; SQLite serializes them anyway
+    exam_id = db.scalar(select(Exam.id).limit(1))
+    subject_id = db.scalar(select(Subject.id).where(Subject.class_id == student["class_id"]).limit(1))
+    mark = {"exam_id": exam_id, "student_id": student["id"], "subject_id": subject_id,
+            "marks_obtained": 5.0, "max_marks": 10.0, "grade": "C"}
+    statements = []
+    lock = main.lock_rows_for_write
+    monkeypatch.setattr(main, "lock_rows_for_write", lambda db, key, ids: statements.append((key, list(ids))) or lock(db, key, ids))
+
+    def record(connection, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    args = (exam_id, student["class_id"]) + (([mark],) if job == "write_marks_sheet" else ())
+    with SessionLocal() as session:
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            getattr(main, job)(session, *args)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+            session.rollback()
+    # The lock comes before any statement that reads or writes marks or cards
+    assert statements[0] == (Class.id, [student["class_id"]])
+    assert "INSERT" in statements
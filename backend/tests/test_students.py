@@ -0,0 +1,30 @@
+# test_students.py - Student list: keyset pages of 50 by default
+
+from sqlalchemy import func, select
+
+from conftest import account
+from main import Student
+
+
+def ids(response):
+    assert response.status_code == 200, response.text
+    return [student["id"] for student in response.json()["students"]]
+
+
+def test_without_paging_parameters_the_first_page_is_returned(client, auth):
+    response = client.get("/api/students", headers=auth(account("admin")))
+    assert len(ids(response)) == 50
+    assert response.json()["nextCursor"] == ids(response)[-1]
+
+
+def test_pages_follow_next_cursor_to_every_student_once(client, auth, db):
+    headers = auth(account("admin"))
+    paged, params = [], {}
+    while True:
+        response = client.get("/api/students", headers=headers, params=params)
+        paged.extend(ids(response))
+        if response.json()["nextCursor"] is None:
+            break
+        params = {"cursor": response.json()["nextCursor"]}
+    assert paged == sorted(paged)
+    assert len(paged) == db.scalar(select(func.count()).select_from(Student))
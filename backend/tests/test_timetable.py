@@ -0,0 +1,56 @@
+# test_timetable.py - Default timetable per role, clash checks and the revision counter
+
+from sqlalchemy import delete, select
+
+from conftest import account
+from main import Parent, Section, StudentParent, Student, Subject, TimetableRevision, User, Weekday
+
+
+def timetable(client, auth, email, **params):
+    response = client.get("/api/timetable", headers=auth(email), params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_without_parameters_every_role_gets_a_grid(client, auth, db, student):
+    first_section = db.scalar(select(Section.id).order_by(Section.id).limit(1))
+    assert timetable(client, auth, account("admin"))["sectionId"] == first_section
+    assert timetable(client, auth, account("accountant"))["sectionId"] == first_section
+    assert timetable(client, auth, student["email"])["sectionId"] == student["section_id"]
+    assert "teacherId" in timetable(client, auth, account("teacher"))
+
+    parent_email, child_section = db.execute(
+        select(User.email, Student.section_id)
+        .join(Parent, Parent.user_id == User.id)
+        .join(StudentParent, StudentParent.parent_id == Parent.id)
+        .join(Student, Student.id == StudentParent.student_id)
+        .order_by(Parent.id, Student.id).limit(1)
+    ).one()
+    assert timetable(client, auth, parent_email)["sectionId"] == child_section
+
+
+def test_first_write_creates_the_revision_and_later_writes_bump_it(client, auth, db):
+    db.execute(delete(TimetableRevision))
+    db.commit()
+    section_id, class_id = db.execute(select(Section.id, Section.class_id).order_by(Section.id).limit(1)).one()
+    subject_id = db.scalar(select(Subject.id).where(Subject.class_id == class_id).limit(1))
+    teachers = client.get("/api/teachers").json()["teachers"]
+    headers = auth(account("admin"))
+
+    def create(period, teacher):
+        return client.post("/api/timetable", headers=headers, json={
+            "section_id": section_id, "day": Weekday.SATURDAY.value, "period": period,
+            "subject_id": subject_id, "teacher_id": teacher["id"],
+        })
+
+    assert create(10, teachers[0]).status_code == 200
+    db.expire_all()
+    assert db.get(TimetableRevision, 1).revision == 1
+    assert create(11, teachers[1]).status_code == 200
+    db.expire_all()
+    assert db.get(TimetableRevision, 1).revision == 2
+
+    assert create(10, teachers[1]).status_code == 409
+    assert client.delete("/api/timetable/999999", headers=headers).status_code == 404
+    grid = timetable(client, auth, account("admin"), section_id=section_id)["timetable"]
+    assert [row["period"] for row in grid if row["saturday"]][-2:] == ["10", "11"]
@@ -0,0 +1,111 @@
+# test_uploads.py - Streamed homework uploads, the content-addressed store and range downloads
+
+import hashlib
+import os
+import time
+
+import pytest
+from sqlalchemy import select, update
+
+from conftest import account
+from core.database import SessionLocal
+from main import (
+    HomeworkStatus, HomeworkSubmission, Student, SubmissionAlreadyGraded, User, save_homework_submission, sweep_uploads,
+    upload_store,
+)
+
+CONTENT = b"The quick brown fox jumps over the lazy dog\n" * 100
+
+
+def upload(client, auth, email, homework_id, content=CONTENT, content_type="text/plain", filename="answer.txt"):
+    return client.post(f"/api/homework/{homework_id}/submit", headers=auth(email),
+                       files={"file": (filename, content, content_type)})
+
+
+def test_upload_is_stored_under_its_hash_and_served_in_ranges(client, auth, student, create_homework):
+    homework_id = create_homework(student["class_id"])
+    response = upload(client, auth, student["email"], homework_id)
+    assert response.status_code == 200, response.text
+    digest = hashlib.sha256(CONTENT).hexdigest()
+    assert response.json()["fileUrl"] == f"/api/files/{digest}"
+    with open(upload_store.path(digest), "rb") as stored:
+        assert stored.read() == CONTENT
+
+    headers = {**auth(student["email"]), "Range": "bytes=4-8"}
+    partial = client.get(f"/api/files/{digest}", headers=headers)
+    assert partial.status_code == 206
+    assert partial.content == CONTENT[4:9]
+    # Only the student, their parents, the teacher and admins may fetch it
+    assert client.get(f"/api/files/{digest}", headers=auth(account("student", 2))).status_code == 404
+    assert client.get(f"/api/files/{digest}", headers=auth(account("admin"))).status_code == 200
+
+
+def test_identical_uploads_share_one_file(client, auth, db, student, create_homework):
+    classmate = db.scalar(
+        select(User.email).join(Student, Student.user_id == User.id)
+        .where(Student.class_id == student["class_id"], Student.id != student["id"]).limit(1)
+    )
+    homework_id = create_homework(student["class_id"])
+    first = upload(client, auth, student["email"], homework_id, content=b"same bytes")
+    second = upload(client, auth, classmate, homework_id, content=b"same bytes")
+    assert first.json()["fileUrl"] == second.json()["fileUrl"]
+
+
+def test_disallowed_type_is_refused(client, auth, student, create_homework):
+    homework_id = create_homework(student["class_id"])
+    response = upload(client, auth, student["email"], homework_id, content_type="application/x-msdownload", filename="a.exe")
+    assert response.status_code == 415
+
+
+def test_maintenance_removes_replaced_and_extra_files_but_keeps_referenced_ones(client, auth, student, create_homework):
+    homework_id = create_homework(student["class_id"])
+    replaced, extra, kept = b"first draft", b"stray attachment", b"final answer"
+    assert upload(client, auth, student["email"], homework_id, content=replaced).status_code == 200
+    response = client.post(f"/api/homework/{homework_id}/submit", headers=auth(student["email"]), files={
+        "file": ("answer.txt", kept, "text/plain"), "notes": ("notes.txt", extra, "text/plain"),
+    })
+    assert response.status_code == 200, response.text
+
+    paths = {content: upload_store.path(hashlib.sha256(content).hexdigest()) for content in (replaced, extra, kept)}
+    an_hour_ago = time.time() - 3600
+    for path in paths.values():
+        os.utime(path, (an_hour_ago, an_hour_ago))
+    report = sweep_uploads(time.time() - 60, batch_size=2)
+    assert report["uploadsRemoved"] >= 2
+    assert not os.path.exists(paths[replaced]) and not os.path.exists(paths[extra])
+    assert os.path.exists(paths[kept])
+
+
+def test_recent_unreferenced_files_survive_the_sweep(client, auth, student, create_homework):
+    homework_id = create_homework(student["class_id"])
+    response = client.post(f"/api/homework/{homework_id}/submit", headers=auth(student["email"]), files={
+        "file": ("answer.txt", b"fresh answer", "text/plain"), "notes": ("notes.txt", b"fresh extra", "text/plain"),
+    })
+    assert response.status_code == 200
+    sweep_uploads(time.time() - 60, batch_size=100)
+    assert os.path.exists(upload_store.path(hashlib.sha256(b"fresh extra").hexdigest()))
+
+
+def test_filename_that_is_not_utf8_is_accepted(client, auth, student, create_homework):
+    homework_id = create_homework(student["class_id"])
+    body = (
+        b"--b0undary\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="r\xe9ponse.txt"\r\n'
+        b"Content-Type: text/plain\r\n\r\n"
+        b"latin-1 name\r\n"
+        b"--b0undary--\r\n"
+    )
+    response = client.post(f"/api/homework/{homework_id}/submit", content=body, headers={
+        **auth(student["email"]), "Content-Type": "multipart/form-data; boundary=b0undary",
+    })
+    assert response.status_code == 200, response.text
+
+
+def test_resubmission_racing_the_grading_is_refused(client, auth, db, student, create_homework):
+    homework_id = create_homework(student["class_id"])
+    assert upload(client, auth, student["email"], homework_id).status_code == 200
+    db.execute(update(HomeworkSubmission).where(HomeworkSubmission.homework_id == homework_id).values(status=HomeworkStatus.GRADED))
+    db.commit()
+    homework = {"id": homework_id, "teacher_id": None, "due_date": None}
+    with SessionLocal() as session, pytest.raises(SubmissionAlreadyGraded):
+        save_homework_submission(session, homework, student["id"], {"text_answer": "late edit", "status": HomeworkStatus.SUBMITTED})
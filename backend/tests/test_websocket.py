@@ -0,0 +1,108 @@
+# test_websocket.py - Channel routing of live events to connected sockets
+
+import asyncio
+
+import pytest
+from sqlalchemy import delete, select
+from starlette.websockets import WebSocketDisconnect
+
+from conftest import account
+from main import WS_AUTH_FAILED, Class, Section, Subject, TeacherProfile, User, UserRole, teacher_sections
+from utils.websocket import CLOSE_TRY_AGAIN_LATER, ClientConnection, ConnectionManager
+
+
+def token(auth, email):
+    return auth(email)["Authorization"].split(" ", 1)[1]
+
+
+def announce(client, auth, **target):
+    response = client.post("/api/announcements", headers=auth(account("admin")), json={"title": "t", "message": "m", **target})
+    assert response.status_code == 200, response.text
+
+
+def announcements_until_everyone_news(ws):
+    """Announcement messages received up to the closing broadcast, which every socket gets"""
+    messages = []
+    while not messages or messages[-1] != "New announcement: everyone news":
+        event = ws.receive_json()
+        if event["type"] == "notification":
+            messages.append(event["notification"]["message"])
+    return [message.removeprefix("New announcement: ") for message in messages]
+
+
+def test_section_events_reach_its_teachers_and_admins_only(client, auth, db):
+    section_id, class_id = db.execute(select(Section.id, Section.class_id).order_by(Section.id.desc()).limit(1)).one()
+    subject_id = db.scalar(select(Subject.id).where(Subject.class_id == class_id).limit(1))
+    teacher_id = client.get("/api/teachers").json()["teachers"][0]["id"]
+    response = client.post("/api/timetable", headers=auth(account("admin")), json={
+        "section_id": section_id, "day": "saturday", "period": 12, "subject_id": subject_id, "teacher_id": teacher_id,
+    })
+    assert response.status_code == 200, response.text
+    teacher = next(t["email"] for t in client.get("/api/teachers").json()["teachers"] if t["id"] == teacher_id)
+    other_teacher = next(t["email"] for t in client.get("/api/teachers").json()["teachers"] if t["id"] != teacher_id)
+
+    with client.websocket_connect(f"/ws?token={token(auth, teacher)}") as assigned, \
+            client.websocket_connect(f"/ws?token={token(auth, other_teacher)}") as unassigned, \
+            client.websocket_connect(f"/ws?token={token(auth, account('admin'))}") as admin:
+        announce(client, auth, title="section news", target="section", target_id=section_id)
+        announce(client, auth, title="class news", target="class", target_id=class_id)
+        announce(client, auth, title="staff news", target="teachers")
+        announce(client, auth, title="everyone news", target="all")
+
+        assert announcements_until_everyone_news(assigned) == ["section news", "class news", "staff news", "everyone news"]
+        assert announcements_until_everyone_news(admin) == ["section news", "class news", "everyone news"]
+        assert announcements_until_everyone_news(unassigned) == ["staff news", "everyone news"]
+
+
+def test_wildcards_in_class_names_match_only_themselves(db):
+    wildcard = Class(name="9_%")
+    db.add(wildcard)
+    db.flush()
+    section = Section(class_id=wildcard.id, name="A")
+    teacher = User(name="Wildcard Teacher", email="wildcard-teacher@school.test", password_hash="-", role=UserRole.TEACHER)
+    db.add_all([section, teacher])
+    db.flush()
+    db.add(TeacherProfile(user_id=teacher.id, subject="Maths", classes="98x-A"))
+    db.commit()
+    try:
+        assigned = teacher_sections()
+        assert db.scalars(select(assigned.c.section_id).where(assigned.c.teacher_id == teacher.id)).all() == []
+        db.execute(TeacherProfile.__table__.update().where(TeacherProfile.user_id == teacher.id).values(classes="98x-A, 9_%-A"))
+        assert db.scalars(select(assigned.c.section_id).where(assigned.c.teacher_id == teacher.id)).all() == [section.id]
+    finally:
+        db.rollback()
+        db.execute(delete(TeacherProfile).where(TeacherProfile.user_id == teacher.id))
+        db.execute(delete(User).where(User.id == teacher.id))
+        db.execute(delete(Section).where(Section.id == section.id))
+        db.execute(delete(Class).where(Class.id == wildcard.id))
+        db.commit()
+
+
+def test_socket_without_a_valid_token_is_closed_with_the_no_reconnect_code(client):
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/ws?token=nonsense") as ws:
+            ws.receive_text()
+    assert closed.value.code == WS_AUTH_FAILED
+
+
+def test_a_slow_client_is_closed_with_try_again_later():
+    class Socket:
+        closed_with = None
+
+        async def close(self, code):
+            self.closed_with = code
+
+    async def scenario():
+        manager = ConnectionManager(max_queue=1)
+        socket = Socket()
+        client = ClientConnection(socket, max_queue=1)
+        manager.clients[socket] = client
+        manager._enqueue(client, "first")
+        manager._enqueue(client, "second")  # queue full: dropped and closed in the background
+        assert len(manager._closing) == 1
+        await asyncio.gather(*manager._closing)
+        return manager, socket
+
+    manager, socket = asyncio.run(scenario())
+    assert socket.closed_with == CLOSE_TRY_AGAIN_LATER
+    assert not manager._closing and socket not in manager.clients
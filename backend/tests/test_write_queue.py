@@ -0,0 +1,86 @@
+# test_write_queue.py - Group commit in the serialized write queue
+
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from core.writer import WriteQueue
+
+
+def insert_value(db, value):
+    db.execute(text("INSERT INTO items (value) VALUES (:value)"), {"value": value})
+    return value
+
+
+async def with_queue(tmp_path, scenario, **options):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'queue.db'}")
+    async with engine.begin() as connection:
+        await connection.exec_driver_sql("CREATE TABLE items (value INTEGER UNIQUE)")
+    queue = WriteQueue(async_sessionmaker(engine), **options)
+    try:
+        result = await scenario(queue)
+        await queue.stop()
+        async with engine.connect() as connection:
+            stored = (await connection.exec_driver_sql("SELECT value FROM items ORDER BY value")).scalars().all()
+        return result, stored, queue.metrics()
+    finally:
+        await engine.dispose()
+
+
+def test_concurrent_writes_share_one_commit(tmp_path):
+    async def scenario(queue):
+        return await asyncio.gather(*(queue.submit(insert_value, n) for n in range(20)))
+
+    results, stored, metrics = asyncio.run(with_queue(tmp_path, scenario, enabled=True, max_delay=0.05))
+    assert results == list(range(20))
+    assert stored == list(range(20))
+    assert (metrics["batches"], metrics["writes"]) == (1, 20)
+
+
+def test_a_failing_write_does_not_take_its_batch_down(tmp_path):
+    async def scenario(queue):
+        return await asyncio.gather(*(queue.submit(insert_value, n) for n in [1, 2, 2, 3]), return_exceptions=True)
+
+    results, stored, metrics = asyncio.run(with_queue(tmp_path, scenario, enabled=True, max_delay=0.05))
+    assert results[:2] == [1, 2] and results[3] == 3
+    assert isinstance(results[2], IntegrityError)
+    assert stored == [1, 2, 3]
+    assert metrics["writes"] == 3
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_errors_reach_the_caller(tmp_path, enabled):
+    def reject(db):
+        raise LookupError("nothing to write")
+
+    async def scenario(queue):
+        with pytest.raises(LookupError):
+            await queue.submit(reject)
+        return await queue.submit(insert_value, 7)
+
+    result, stored, _ = asyncio.run(with_queue(tmp_path, scenario, enabled=enabled))
+    assert (result, stored) == (7, [7])
+
+
+def test_exclusive_job_runs_between_the_writes_queued_around_it(tmp_path):
+    def count_committed():
+        connection = sqlite3.connect(tmp_path / "queue.db")
+        try:
+            return connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        finally:
+            connection.close()
+
+    async def scenario(queue):
+        before = [queue.submit(insert_value, n) for n in range(3)]
+        exclusive = queue.submit_exclusive(count_committed)
+        after = [queue.submit(insert_value, n) for n in range(3, 6)]
+        return (await asyncio.gather(*before, exclusive, *after))[3]
+
+    seen, stored, metrics = asyncio.run(with_queue(tmp_path, scenario, enabled=True, max_delay=0.05))
+    assert seen == 3
+    assert stored == list(range(6))
+    assert metrics["batches"] == 2
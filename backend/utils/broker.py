@@ -0,0 +1,209 @@
+# broker.py - Cross-worker pub/sub for WebSocket events
+"""
+A broker carries published events to every API worker, and each worker's
+ConnectionManager delivers them to its own sockets. With uvicorn --workers N a
+publish from one worker therefore reaches clients connected to any of them.
+
+InProcessBroker is the single-worker default. UnixSocketBroker needs no external
+service: every worker binds a datagram socket in a shared directory and a publish
+is one sendto() per peer; an envelope larger than one datagram is sent as
+numbered fragments and reassembled by the receiver.
+"""
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import socket
+import stat
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], None]
+
+# Upper bound for one datagram; Linux accepts datagrams up to roughly net.core.wmem_default
+MAX_DATAGRAM = 64 * 1024
+# A fragment is b"#<message id> <index> <count>\n" followed by its slice of the JSON envelope
+FRAGMENT_MARK = b"#"
+FRAGMENT_PAYLOAD = MAX_DATAGRAM - 64
+# Incomplete fragmented envelopes are dropped after this many seconds (a fragment was lost)
+FRAGMENT_TIMEOUT = 30.0
+# A peer's receive queue is short (net.unix.max_dgram_qlen), so back off briefly before giving up
+SEND_RETRIES = 5
+
+
+class Broker(abc.ABC):
+    """Publish/subscribe transport; the subscribed handler must not block"""
+
+    def __init__(self):
+        self.handler: Optional[Handler] = None
+
+    def subscribe(self, handler: Handler):
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abc.abstractmethod
+    async def publish(self, envelope: dict):
+        """Deliver the envelope to the handler of every worker, this one included"""
+
+    def _dispatch(self, envelope: dict):
+        if self.handler is not None:
+            self.handler(envelope)
+
+
+class InProcessBroker(Broker):
+    """Delivers straight to the local handler; enough when running a single worker"""
+
+    async def publish(self, envelope: dict):
+        self._dispatch(envelope)
+
+
+class UnixSocketBroker(Broker):
+    """Peer-to-peer bus over Unix datagram sockets; all workers on the host share one directory"""
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self.sock: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_mtime: Optional[int] = None
+        # message id -> (first seen, fragment count, fragments received so far)
+        self._partial: Dict[str, Tuple[float, int, Dict[int, bytes]]] = {}
+
+    async def start(self):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self._check_directory()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self._on_readable)
+
+    def _check_directory(self):
+        """Refuse a directory another local user could have planted to read or inject events"""
+        info = os.lstat(self.directory)
+        if stat.S_ISLNK(info.st_mode) or not stat.S_ISDIR(info.st_mode):
+            raise PermissionError(f"Broker path {self.directory} is not a plain directory")
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise PermissionError(f"Broker directory {self.directory} must be owned by this user with mode 0700")
+
+    async def stop(self):
+        if self.sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def publish(self, envelope: dict):
+        self._dispatch(envelope)
+        if self.sock is None:
+            return
+        datagrams = self._datagrams(json.dumps(envelope).encode())
+        for peer in list(self.peers()):
+            for data in datagrams:
+                if not await self._send(data, peer):
+                    break
+
+    @staticmethod
+    def _datagrams(data: bytes) -> List[bytes]:
+        """The envelope as one datagram, or as fragments when it does not fit in one"""
+        if len(data) <= MAX_DATAGRAM:
+            return [data]
+        message_id = uuid.uuid4().hex
+        chunks = [data[start:start + FRAGMENT_PAYLOAD] for start in range(0, len(data), FRAGMENT_PAYLOAD)]
+        return [
+            FRAGMENT_MARK + f"{message_id} {index} {len(chunks)}\n".encode() + chunk
+            for index, chunk in enumerate(chunks)
+        ]
+
+    async def _send(self, data: bytes, peer: str) -> bool:
+        for attempt in range(SEND_RETRIES):
+            try:
+                self.sock.sendto(data, peer)
+                return True
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket file of a worker that died without cleaning up
+                self._forget(peer)
+                return False
+            except BlockingIOError:
+                await asyncio.sleep(0.001 * 2 ** attempt)
+        logger.warning("Broker peer %s is not draining its socket, dropping event", peer)
+        return False
+
+    def peers(self) -> List[str]:
+        """Socket paths of the other workers, re-listed only when the directory changes"""
+        mtime = os.stat(self.directory).st_mtime_ns
+        if mtime != self._peers_mtime:
+            self._peers = [
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(".sock") and os.path.join(self.directory, name) != self.path
+            ]
+            self._peers_mtime = mtime
+        return self._peers
+
+    def _forget(self, peer: str):
+        try:
+            os.unlink(peer)
+        except FileNotFoundError:
+            pass
+        if peer in self._peers:
+            self._peers.remove(peer)
+
+    def _on_readable(self):
+        while self.sock is not None:
+            try:
+                data = self.sock.recv(MAX_DATAGRAM)
+            except BlockingIOError:
+                return
+            if data.startswith(FRAGMENT_MARK):
+                data = self._reassemble(data)
+                if data is None:
+                    continue
+            try:
+                envelope = json.loads(data)
+            except ValueError:
+                logger.warning("Discarding malformed broker datagram")
+                continue
+            self._dispatch(envelope)
+
+    def _reassemble(self, fragment: bytes) -> Optional[bytes]:
+        """Collect a fragment; returns the whole envelope once its last fragment arrived"""
+        header, _, chunk = fragment[len(FRAGMENT_MARK):].partition(b"\n")
+        try:
+            message_id, index, count = header.decode().split(" ")
+            index, count = int(index), int(count)
+        except ValueError:
+            logger.warning("Discarding malformed broker fragment")
+            return None
+        now = time.monotonic()
+        for stale in [key for key, (seen, _, _) in self._partial.items() if now - seen > FRAGMENT_TIMEOUT]:
+            logger.warning("Dropping incomplete broker message %s", stale)
+            del self._partial[stale]
+        seen, count, chunks = self._partial.setdefault(message_id, (now, count, {}))
+        chunks[index] = chunk
+        if len(chunks) < count:
+            return None
+        del self._partial[message_id]
+        return b"".join(chunks[n] for n in range(count))
+
+
+def create_broker(kind: str, path: str) -> Broker:
+    if kind == "memory":
+        return InProcessBroker()
+    if kind == "unix":
+        return UnixSocketBroker(path)
+    raise ValueError(f"Unknown WebSocket broker: {kind}")
@@ -0,0 +1,50 @@
+# querycount.py - SQL statement counting for query budgets
+"""
+Counts the statements an engine executes while a block runs, so list endpoints can
+be held to an upper bound and N+1 regressions show up as a failed budget.
+
+    with QueryCounter(engine) as counter:
+        client.get("/api/students")
+    assert counter.count <= 2, counter.statements
+"""
+
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryCounter:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+        return False
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(engine: Engine, limit: int, label: str = "block"):
+    """Fail with the offending statements when the block runs more than `limit` queries"""
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = "\n".join(f"  {i + 1}. {statement}" for i, statement in enumerate(counter.statements))
+        raise QueryBudgetExceeded(f"{label} ran {counter.count} queries, budget is {limit}:\n{listing}")
@@ -0,0 +1,218 @@
+# uploads.py - Streaming multipart uploads into content-addressed storage
+"""
+receive_multipart() parses the request body as it arrives and writes each file part
+straight into the store, hashing on the way, so an upload is never held in memory or
+copied through an intermediate temp file, and an oversized one is cut off as soon as
+it crosses the limit instead of after the whole body has been received.
+
+Files are stored under their SHA-256 (root/ab/cd/abcd...), so identical uploads share
+one file on disk and a stored file never changes once written. Nothing is deleted when
+a submission is rejected or replaced, since another upload may share the file; the
+maintenance job removes files nobody references once they are old enough (see
+stale_digests()), and storing a file again refreshes its mtime for that purpose.
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class StoredFile:
+    def __init__(self, digest: str, size: int, filename: str, content_type: str):
+        self.digest = digest
+        self.size = size
+        self.filename = filename
+        self.content_type = content_type
+
+
+class UploadSink:
+    """Temp file in the store that hashes what is written to it"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadError(413, f"File exceeds the {self.max_bytes // (1024 * 1024)} MB upload limit")
+        self.hash.update(data)
+        self.file.write(data)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class ContentStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp = os.path.join(root, "tmp")
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.isfile(self.path(digest))
+
+    def open_sink(self, max_bytes: int) -> UploadSink:
+        os.makedirs(self.tmp, exist_ok=True)
+        return UploadSink(self.tmp, max_bytes)
+
+    def commit(self, sink: UploadSink) -> str:
+        """Move a finished upload to its hash path; a file already stored under it is kept and the copy dropped"""
+        sink.close()
+        digest = sink.hash.hexdigest()
+        target = self.path(digest)
+        if os.path.exists(target):
+            os.unlink(sink.path)
+            os.utime(target)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(sink.path, target)
+        return digest
+
+    def discard(self, sink: UploadSink):
+        sink.close()
+        try:
+            os.unlink(sink.path)
+        except FileNotFoundError:
+            pass
+
+    def stale_digests(self, older_than: float) -> Iterator[str]:
+        """Digests of stored files last written before older_than (a time.time() value)"""
+        for directory, subdirectories, names in os.walk(self.root):
+            if directory == self.root and "tmp" in subdirectories:
+                subdirectories.remove("tmp")
+            for name in names:
+                if len(name) == 64 and os.stat(os.path.join(directory, name)).st_mtime < older_than:
+                    yield name
+
+    def delete(self, digest: str, older_than: float) -> bool:
+        """Remove a stored file unless it was stored again since older_than; returns whether it went"""
+        target = self.path(digest)
+        try:
+            if os.stat(target).st_mtime >= older_than:
+                return False
+            os.unlink(target)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def purge_partial(self, older_than: float) -> int:
+        """Remove temp files of uploads that died midway (the process crashed before commit or discard)"""
+        removed = 0
+        for entry in os.scandir(self.tmp) if os.path.isdir(self.tmp) else ():
+            if entry.name.endswith(".part") and entry.stat().st_mtime < older_than:
+                os.unlink(entry.path)
+                removed += 1
+        return removed
+
+
+async def receive_multipart(
+    request: Request,
+    store: ContentStore,
+    max_bytes: int,
+    allowed_types: Optional[set] = None,
+    max_field_bytes: int = 64 * 1024,
+) -> Tuple[Dict[str, str], Dict[str, StoredFile]]:
+    """Stream a multipart/form-data body: returns ({field: text}, {field: StoredFile})"""
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError(415, "Expected a multipart/form-data body")
+
+    # The parser's callbacks only queue events; the writes happen between chunks, off the event loop
+    events: List[tuple] = []
+    header = {"field": b"", "value": b""}
+    part_headers: Dict[bytes, bytes] = {}
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        part_headers[header["field"].lower()] = header["value"]
+        header["field"] = header["value"] = b""
+
+    def on_headers_finished():
+        events.append(("part", dict(part_headers)))
+        part_headers.clear()
+
+    def on_part_data(data, start, end):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    fields: Dict[str, str] = {}
+    files: Dict[str, StoredFile] = {}
+    sink: Optional[UploadSink] = None
+    part: dict = {}
+    value = bytearray()
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            pending, events[:] = events[:], []
+            for kind, payload in pending:
+                if kind == "part":
+                    _, disposition = parse_options_header(payload.get(b"content-disposition", b""))
+                    name = disposition.get(b"name", b"").decode("utf-8", errors="replace")
+                    filename = disposition.get(b"filename")
+                    part = {"name": name, "filename": filename.decode("utf-8", errors="replace") if filename is not None else None}
+                    if filename is not None:
+                        part_type = payload.get(b"content-type", b"application/octet-stream").decode("latin-1")
+                        if allowed_types and part_type not in allowed_types:
+                            raise UploadError(415, f"Unsupported file type {part_type}")
+                        part["content_type"] = part_type
+                        sink = store.open_sink(max_bytes)
+                    value.clear()
+                elif kind == "data":
+                    if sink is not None:
+                        await run_in_threadpool(sink.write, payload)
+                    else:
+                        value.extend(payload)
+                        if len(value) > max_field_bytes:
+                            raise UploadError(413, f"Field {part['name']} is too long")
+                elif kind == "end":
+                    if sink is not None:
+                        if part["filename"] or sink.size:
+                            digest = await run_in_threadpool(store.commit, sink)
+                            files[part["name"]] = StoredFile(digest, sink.size, part["filename"], part["content_type"])
+                        else:
+                            # Browsers send an empty, nameless part for an unused file input
+                            store.discard(sink)
+                        sink = None
+                    else:
+                        fields[part["name"]] = value.decode("utf-8", errors="replace")
+        parser.finalize()
+    finally:
+        if sink is not None:
+            store.discard(sink)
+    return fields, files
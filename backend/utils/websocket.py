@@ -0,0 +1,149 @@
+# websocket.py - WebSocket connection manager and broadcast engine
+"""
+Every connected client gets a bounded outbound queue drained by its own sender task.
+A broadcast serializes the message once and only enqueues it, so one slow or dead
+socket can never hold up delivery to everybody else.
+
+Connections are also indexed by user, role, class and section, so publish() only
+touches the sockets in the requested audience instead of all N of them. A connection
+indexed under EVERY_CHANNEL for a key gets every event published to that key.
+
+Events travel through a Broker (see utils/broker.py) so that every worker process
+delivers them to its own sockets, not only the worker that handled the request.
+"""
+
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket
+
+from utils.broker import Broker, InProcessBroker
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to clients that could not keep up (RFC 6455 "try again later")
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+INDEX_KEYS = ("user", "role", "class", "section")
+# A connection registered under this value of a key receives events for every value of it (admins' class/section feed)
+EVERY_CHANNEL = "*"
+
+
+class ClientConnection:
+    def __init__(self, websocket: WebSocket, max_queue: int, channels: Dict[str, Iterable] = None):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.sender: Optional[asyncio.Task] = None
+        # index key -> values this connection is registered under, e.g. {"section": {3, 7}}
+        self.channels = {key: set(values) for key, values in (channels or {}).items() if key in INDEX_KEYS}
+
+
+class ConnectionManager:
+    def __init__(self, broker: Broker = None, max_queue: int = 100, send_timeout: float = 10.0):
+        self.broker = broker or InProcessBroker()
+        self.broker.subscribe(self.deliver)
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.indexes: Dict[str, Dict[object, Set[ClientConnection]]] = {key: defaultdict(set) for key in INDEX_KEYS}
+        # The loop only keeps weak references to tasks; these hold slow-client closes until they finish
+        self._closing: Set[asyncio.Task] = set()
+
+    @property
+    def active_connections(self):
+        return list(self.clients)
+
+    async def start(self):
+        await self.broker.start()
+
+    async def stop(self):
+        await self.broker.stop()
+
+    async def connect(self, websocket: WebSocket, user_id: int = None, role: str = None,
+                      class_ids: Iterable[int] = (), section_ids: Iterable[int] = ()):
+        await websocket.accept()
+        channels = {
+            "user": [user_id] if user_id is not None else [],
+            "role": [role] if role is not None else [],
+            "class": class_ids,
+            "section": section_ids,
+        }
+        client = ClientConnection(websocket, self.max_queue, channels)
+        client.sender = asyncio.create_task(self._sender(client))
+        self.clients[websocket] = client
+        for key, values in client.channels.items():
+            for value in values:
+                self.indexes[key][value].add(client)
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        for key, values in client.channels.items():
+            index = self.indexes[key]
+            for value in values:
+                index[value].discard(client)
+                if not index[value]:
+                    del index[value]
+        if client.sender and client.sender is not asyncio.current_task():
+            client.sender.cancel()
+
+    async def broadcast(self, message: dict):
+        await self.broker.publish({"text": json.dumps(message, default=str), "audience": None})
+
+    async def publish(self, message: dict, user_ids: Iterable[int] = (), roles: Iterable[str] = (),
+                      class_ids: Iterable[int] = (), section_ids: Iterable[int] = ()):
+        """Send to the union of the given channels; cost is proportional to the audience, not to all clients"""
+        audience = {"user": list(user_ids), "role": list(roles), "class": list(class_ids), "section": list(section_ids)}
+        if not any(audience.values()):
+            return
+        await self.broker.publish({"text": json.dumps(message, default=str), "audience": audience})
+
+    def deliver(self, envelope: dict):
+        """Broker handler: enqueue an already serialized event for the local sockets it targets"""
+        audience = envelope.get("audience")
+        clients = list(self.clients.values()) if audience is None else self.audience(**audience)
+        for client in clients:
+            self._enqueue(client, envelope["text"])
+
+    def audience(self, **channels: Iterable) -> Set[ClientConnection]:
+        clients: Set[ClientConnection] = set()
+        for key, values in channels.items():
+            index = self.indexes[key]
+            if values:
+                clients |= index.get(EVERY_CHANNEL, set())
+            for value in values:
+                clients |= index.get(value, set())
+        return clients
+
+    def _enqueue(self, client: ClientConnection, text: str):
+        try:
+            client.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            # The client is too far behind; it reconnects and refetches instead of stalling the queue
+            logger.warning("Dropping slow WebSocket client with %d queued messages", client.queue.qsize())
+            self.disconnect(client.websocket)
+            task = asyncio.create_task(self._close(client.websocket, CLOSE_TRY_AGAIN_LATER))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def _sender(self, client: ClientConnection):
+        try:
+            while True:
+                text = await client.queue.get()
+                await asyncio.wait_for(client.websocket.send_text(text), timeout=self.send_timeout)
+        except Exception:
+            # Dead or stuck socket: prune it so later broadcasts skip it
+            self.disconnect(client.websocket)
+            await self._close(client.websocket)
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int = 1000):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
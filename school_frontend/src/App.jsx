@@ -1191,6 +1191,7 @@ const TeachersTab = () => {
 
 const StudentsTab = () => {
   const [students, setStudents] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [classes, setClasses] = useState([]);
   const [sections, setSections] = useState([]);
   const [showModal, setShowModal] = useState(false);
@@ -1210,11 +1211,13 @@ const StudentsTab = () => {
 
   const selectedClass = watch("class_id");
 
-  // LOAD STUDENTS
-  const loadStudents = async () => {
+  // LOAD STUDENTS (one page at a time; a cursor appends the next page)
+  const loadStudents = async (cursor = null) => {
     const token = localStorage.getItem("token");
-    const data = await api.request("/api/students", "GET", null, token);
-    setStudents(data.students || []);
+    const path = cursor ? `/api/students?cursor=${cursor}` : "/api/students";
+    const data = await api.request(path, "GET", null, token);
+    setStudents((prev) => (cursor ? [...prev, ...(data.students || [])] : data.students || []));
+    setNextCursor(data.nextCursor ?? null);
   };
 
   // LOAD CLASSES FOR DROPDOWN
@@ -1324,6 +1327,17 @@ const StudentsTab = () => {
         ))}
       </div>
 
+      {nextCursor && (
+        <div className="flex justify-center">
+          <button
+            onClick={() => loadStudents(nextCursor)}
+            className="px-4 py-2 bg-gray-100 hover:bg-gray-200 text-gray-700 rounded-lg"
+          >
+            Load more
+          </button>
+        </div>
+      )}
+
       {/* MODAL */}
       <Modal
         isOpen={showModal}
@@ -1521,7 +1535,8 @@ const Dashboard = ({ user, onLogout }) => {
 
     const unsubscribe = wsManager.subscribe((data) => {
       if (data.type === "notification") {
-        setNotifications((prev) => [data.notification, ...prev]);
+        // The push has no inbox id; refetch so the list holds the stored rows
+        loadNotifications();
       }
     });
 
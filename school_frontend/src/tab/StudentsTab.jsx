@@ -9,6 +9,7 @@ import Modal from "./components/Modal.jsx";
 
 const StudentsTab = () => {
   const [students, setStudents] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [showModal, setShowModal] = useState(false);
   const [editingStudent, setEditingStudent] = useState(null);
   const [loading, setLoading] = useState(false);
@@ -26,11 +27,14 @@ const StudentsTab = () => {
     },
   });
 
-  const loadStudents = async () => {
+  // The list comes in pages; pass the previous page's nextCursor to append the next one
+  const loadStudents = async (cursor = null) => {
     try {
       const token = localStorage.getItem("token");
-      const data = await api.request("/api/students", "GET", null, token);
-      setStudents(data.students || []);
+      const path = cursor ? `/api/students?cursor=${cursor}` : "/api/students";
+      const data = await api.request(path, "GET", null, token);
+      setStudents((prev) => (cursor ? [...prev, ...(data.students || [])] : data.students || []));
+      setNextCursor(data.nextCursor ?? null);
     } catch (err) {
       toast.error("Failed to load students");
     }
@@ -166,6 +170,14 @@ const StudentsTab = () => {
         </div>
       )}
 
+      {nextCursor && (
+        <div className="flex justify-center">
+          <button onClick={() => loadStudents(nextCursor)} className="btn">
+            Load more
+          </button>
+        </div>
+      )}
+
       {/* Student Form Modal */}
       <Modal
         isOpen={showModal}